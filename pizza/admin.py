@@ -1,4 +1,164 @@
+"""
+Admin for the menu and for the order, item, account and ledger tables,
+which grow without bound.
+
+The large-table changelists avoid the queries that grow with the table.
+Counts are capped and estimated past the cap, and the full-table count
+next to the filters is off. Related rows are joined or prefetched per page.
+The date hierarchy lists periods between the indexed first and last
+timestamps instead of a DISTINCT over every row. The filters and exact
+searches all hit an index. Accounts show their ledger balance, computed in
+the changelist query; the stored ``account_balance`` copy, ledger entries
+and balance snapshots are read-only.
+"""
+from datetime import timedelta
+
 from django.contrib import admin
-from .models import Topping, Pizza, Order, Account
+from django.core.paginator import Paginator
+from django.db import models
+from django.db.models import Max, Min, Prefetch
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from . import ledger
+from .models import Account, BalanceSnapshot, CatalogTopping, LedgerEntry, Order, OrderItem, Pizza, Topping
+from .pricing import from_cents
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts at most ``count_limit`` rows. Past that, an unfiltered table is
+    estimated from its id range, both ends read from the primary key index,
+    and a filtered one reports ``count_limit`` rows.
+    """
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list.order_by()
+        counted = queryset[:self.count_limit + 1].count()
+        if counted <= self.count_limit:
+            return counted
+        if not queryset.query.where:
+            ids = queryset.aggregate(first=Min("pk"), last=Max("pk"))
+            return max(self.count_limit, ids["last"] - ids["first"] + 1)
+        return self.count_limit
+
+
+class PeriodQuerySet(models.QuerySet):
+    """
+    ``datetimes()`` for the date hierarchy, built from the first and last
+    timestamps in the queryset. Periods in between are listed even if they
+    happen to be empty.
+    """
+
+    def datetimes(self, field_name, kind, order="ASC", tzinfo=None):
+        bounds = self.aggregate(first=Min(field_name), last=Max(field_name))
+        if bounds["first"] is None:
+            return []
+        first, last = (timezone.localtime(bounds[key], tzinfo) for key in ("first", "last"))
+        period = first.replace(
+            month=1 if kind == "year" else first.month, day=1 if kind in ("year", "month") else first.day,
+            hour=0, minute=0, second=0, microsecond=0,
+        )
+        periods = []
+        while period <= last:
+            periods.append(period)
+            if kind == "year":
+                period = period.replace(year=period.year + 1)
+            elif kind == "month":
+                period = period.replace(year=period.year + period.month // 12, month=period.month % 12 + 1)
+            else:
+                period = timezone.localtime(period + timedelta(days=1), tzinfo)
+        return periods if order == "ASC" else periods[::-1]
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    raw_id_fields = ("pizza", "toppings")
+
+
+@admin.register(Order)
+class OrderAdmin(LargeTableAdmin):
+    list_display = ("order_number", "created_at", "payment_status", "total", "version")
+    list_filter = ("payment_status",)
+    date_hierarchy = "created_at"
+    ordering = ("-created_at",)
+    search_fields = ("=order_number",)
+    inlines = [OrderItemInline]
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return PeriodQuerySet(model=queryset.model, query=queryset.query, using=queryset.db)
+
+
+@admin.register(OrderItem)
+class OrderItemAdmin(LargeTableAdmin):
+    list_display = ("id", "order", "pizza", "quantity", "topping_names")
+    list_select_related = ("order", "pizza")
+    raw_id_fields = ("order", "pizza", "toppings")
+    search_fields = ("=order__order_number",)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related(
+            Prefetch("toppings", queryset=Topping.objects.select_related("catalog_topping"))  # type: ignore
+        )
+
+    @admin.display(description="toppings")
+    def topping_names(self, item):
+        return ", ".join(topping.name for topping in item.toppings.all())
+
+
+@admin.register(Account)
+class AccountAdmin(LargeTableAdmin):
+    list_display = ("account_number", "ledger_balance", "account_balance", "created_at")
+    readonly_fields = ("ledger_balance", "account_balance")
+    search_fields = ("=account_number",)
+
+    def get_queryset(self, request):
+        return ledger.with_balances(super().get_queryset(request))
+
+    @admin.display(description="balance")
+    def ledger_balance(self, account):
+        cents = getattr(account, "balance_cents", None)
+        return None if cents is None else from_cents(cents)
+
+
+class LedgerAdmin(LargeTableAdmin):
+    """
+    The ledger is append-only: entries and snapshots are written by
+    pizza.ledger and only ever viewed here.
+    """
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(LedgerAdmin):
+    list_display = ("id", "account", "amount_cents", "order_number", "created_at")
+    list_select_related = ("account",)
+    search_fields = ("=account__account_number",)
+
+
+@admin.register(BalanceSnapshot)
+class BalanceSnapshotAdmin(LedgerAdmin):
+    list_display = ("id", "account", "balance_cents", "last_entry_id", "created_at")
+    list_select_related = ("account",)
+    search_fields = ("=account__account_number",)
+
 
-admin.site.register([Topping, Pizza, Order, Account])
\ No newline at end of file
+admin.site.register([CatalogTopping, Topping, Pizza])
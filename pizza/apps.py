@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class PizzaConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "pizza"
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from . import checks, signals  # noqa: F401
+        from .metrics import install_query_timer
+
+        connection_created.connect(install_query_timer)
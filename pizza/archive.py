@@ -0,0 +1,109 @@
+"""
+Hot/cold split of the order tables.
+
+Paid orders older than ``ORDER_ARCHIVE_AFTER_DAYS`` move, with their items
+and item toppings, from ``Order``/``OrderItem`` into ``ArchivedOrder``/
+``ArchivedOrderItem`` (``manage.py archive_orders``), keeping their ids.
+Each batch is copied and deleted in one transaction, and copies ignore rows
+already archived, so an interrupted run simply resumes. Lookups by order
+number go through ``find_orders``, which falls back to the archive.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import payments
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+ORDER_FIELDS = ("id", "created_at", "subtotal", "vat", "total", "order_number", "payment_status", "version")
+
+
+def cutoff(days=None):
+    if days is None:
+        days = getattr(settings, "ORDER_ARCHIVE_AFTER_DAYS", 90)
+    return timezone.now() - timedelta(days=days)
+
+
+def find_orders(order_numbers, fields=("order_number", "payment_status", "total")):
+    """
+    Return ``{order_number: values}`` for the given order numbers, looking
+    in the archive only for those missing from the hot table.
+    """
+    fields = tuple(dict.fromkeys(("order_number",) + tuple(fields)))
+    found = {
+        order["order_number"]: order
+        for order in Order.objects.filter(order_number__in=order_numbers).values(*fields)  # type: ignore
+    }
+    missing = [number for number in order_numbers if number not in found]
+    if missing:
+        found.update(
+            (order["order_number"], order)
+            for order in ArchivedOrder.objects.filter(order_number__in=missing).values(*fields)  # type: ignore
+        )
+    return found
+
+
+def find_order(order_number, fields=("order_number", "payment_status", "total")):
+    return find_orders([order_number], fields).get(order_number)
+
+
+def archive_batch(order_ids, chunk_size=500):
+    """
+    Move the given orders to the archive in one transaction, returning the
+    number of orders moved.
+    """
+    through = OrderItem.toppings.through
+    archived_through = ArchivedOrderItem.toppings.through
+    with transaction.atomic():
+        orders = list(Order.objects.filter(id__in=order_ids, payment_status=payments.PAID).values(*ORDER_FIELDS))  # type: ignore
+        ids = [order["id"] for order in orders]
+        ArchivedOrder.objects.bulk_create(  # type: ignore
+            [ArchivedOrder(**order) for order in orders], ignore_conflicts=True
+        )
+        items = OrderItem.objects.filter(order_id__in=ids).values_list(  # type: ignore
+            "id", "order_id", "pizza_id", "quantity"
+        ).iterator(chunk_size=chunk_size)
+        ArchivedOrderItem.objects.bulk_create([  # type: ignore
+            ArchivedOrderItem(id=item_id, order_id=order_id, pizza_id=pizza_id, quantity=quantity)
+            for item_id, order_id, pizza_id, quantity in items
+        ], batch_size=chunk_size, ignore_conflicts=True)
+        toppings = through.objects.filter(orderitem__order_id__in=ids).values_list(
+            "orderitem_id", "topping_id"
+        ).iterator(chunk_size=chunk_size)
+        archived_through.objects.bulk_create([
+            archived_through(archivedorderitem_id=item_id, topping_id=topping_id)
+            for item_id, topping_id in toppings
+        ], batch_size=chunk_size, ignore_conflicts=True)
+        through.objects.filter(orderitem__order_id__in=ids).delete()
+        OrderItem.objects.filter(order_id__in=ids).delete()  # type: ignore
+        Order.objects.filter(id__in=ids).delete()  # type: ignore
+    return len(ids)
+
+
+def archive_orders(older_than=None, chunk_size=500, pause=0.0, max_batches=None):
+    """
+    Archive paid orders created before ``older_than`` in batches of
+    ``chunk_size``, sleeping ``pause`` seconds between batches. Yields the
+    number of orders moved by each batch.
+
+    Batches are walked by id rather than through one open iterator, since
+    SQLite gives no isolation between a cursor and deletes on the same
+    connection.
+    """
+    older_than = older_than or cutoff()
+    last_id = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        ids = list(Order.objects.filter(  # type: ignore
+            payment_status=payments.PAID, created_at__lt=older_than, id__gt=last_id
+        ).order_by("id").values_list("id", flat=True)[:chunk_size])
+        if not ids:
+            return
+        yield archive_batch(ids, chunk_size)
+        last_id = ids[-1]
+        batches += 1
+        if pause:
+            time.sleep(pause)
@@ -0,0 +1,127 @@
+"""
+Native async versions of the v1 endpoints for the ASGI deployment.
+
+Reads go through Django's async ORM. Order and payment writes still run in
+a thread via ``sync_to_async``: Django's ``transaction.atomic`` is not
+available from async code, and those writes must stay in one transaction.
+Writes honour ``Idempotency-Key`` like their sync counterparts.
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.db.models.functions import Lower
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import status
+
+from . import menu_cache, order_queue, pricing, throttling
+from .idempotency import AsyncIdempotentMixin
+from .models import Pizza, Topping
+from .order_ids import next_order_number
+from .orders import OrderRequestError, order_receipt, parse_order
+from .payments import PaymentError, parse_payment, settle
+from .renderers import FastJSONRenderer
+from .serializers import MENU_ROW_FIELDS, TOPPING_ROW_FIELDS, account_row, envelope, menu_rows
+
+
+def _respond(payload, status_code):
+    return HttpResponse(FastJSONRenderer().render(payload), status=status_code, content_type="application/json")
+
+
+def _error(message, status_code=status.HTTP_400_BAD_REQUEST, response_object=None):
+    return _respond(envelope(response_object, message, successful=False), status_code)
+
+
+def _json_body(request):
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        raise ValueError("Invalid JSON body")
+    return data
+
+
+class AsyncPizzaList(View):
+    async def get(self, request):
+        wait = await throttling.await_time(request, "read")
+        if wait:
+            return throttling.throttled_response(wait)
+
+        async def build():
+            return envelope(menu_rows([row async for row in Pizza.objects.values_list(*MENU_ROW_FIELDS)]))  # type: ignore
+
+        return menu_cache.respond(request, await menu_cache.aget_entry("pizzas", build))
+
+
+class AsyncToppingList(View):
+    async def get(self, request):
+        wait = await throttling.await_time(request, "read")
+        if wait:
+            return throttling.throttled_response(wait)
+
+        size = request.GET.get("size")
+        category = request.GET.get("category")
+
+        async def build():
+            toppings = Topping.objects.all()  # type: ignore
+            if size:
+                toppings = toppings.alias(size=Lower("pizza__name")).filter(size=size.lower())
+
+            if category:
+                toppings = toppings.alias(category=Lower("catalog_topping__category")).filter(category=category.lower())
+
+            return envelope(menu_rows([row async for row in toppings.order_by("id").values_list(*TOPPING_ROW_FIELDS)]))
+
+        params = ((size or "").lower(), (category or "").lower())
+        return menu_cache.respond(request, await menu_cache.aget_entry("toppings", build, params))
+
+
+class AsyncOrderView(AsyncIdempotentMixin, View):
+    async def post(self, request):
+        wait = await throttling.await_time(request, "write")
+        if wait:
+            return throttling.throttled_response(wait)
+
+        try:
+            quote = parse_order(_json_body(request), await pricing.aget_snapshot())
+        except OrderRequestError as e:
+            return _error(str(e), response_object=e.response_object)
+        except ValueError as e:
+            return _error(str(e))
+
+        try:
+            order_number = next_order_number()
+
+            if await sync_to_async(order_queue.submit)(
+                order_number, [quote], quote.subtotal, quote.vat, quote.total
+            ):
+                return _respond(envelope(
+                    order_receipt(order_number, quote), f"Order {order_number} accepted for processing"
+                ), status.HTTP_202_ACCEPTED)
+
+            return _respond(envelope(
+                order_receipt(order_number, quote), f"Order {order_number} processed successfully"
+            ), status.HTTP_201_CREATED)
+
+        except Exception as e:
+            return _error(f"Unknown error occurred: {str(e)}", status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncMakePayment(AsyncIdempotentMixin, View):
+    async def post(self, request):
+        wait = await throttling.await_time(request, "write")
+        if wait:
+            return throttling.throttled_response(wait)
+
+        try:
+            order_id, account_number, amount = parse_payment(_json_body(request))
+            account = await sync_to_async(settle)(order_id, account_number, amount)
+        except (PaymentError, ValueError) as e:
+            return _error(str(e))
+        except Exception as e:
+            return _error(f"Payment processing failed with error: {e}")
+
+        return _respond(envelope(
+            account_row(account), f"Payment completed for Order number {order_id}"
+        ), status.HTTP_200_OK)
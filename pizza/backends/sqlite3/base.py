@@ -0,0 +1,55 @@
+"""
+SQLite backend tuned for concurrent writers.
+
+Accepts two ``OPTIONS`` that Django only gained in 5.1, with the same
+meaning, so this backend can be dropped after upgrading:
+
+``init_command``
+    ``;``-separated statements run on every new connection, typically
+    pragmas such as ``journal_mode=WAL`` and ``synchronous=NORMAL``.
+``transaction_mode``
+    ``"DEFERRED"``, ``"IMMEDIATE"`` or ``"EXCLUSIVE"``. ``"IMMEDIATE"`` takes
+    the write lock when ``atomic()`` starts, so a writer waits for the busy
+    timeout instead of failing when it later tries to upgrade a read lock.
+
+The busy timeout itself is sqlite3's ``timeout`` option, in seconds.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.sqlite3 import base
+
+TRANSACTION_MODES = ("DEFERRED", "IMMEDIATE", "EXCLUSIVE")
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        kwargs.pop("init_command", None)
+        kwargs.pop("transaction_mode", None)
+        return kwargs
+
+    @property
+    def init_commands(self):
+        init_command = self.settings_dict["OPTIONS"].get("init_command") or ""
+        return [command.strip() for command in init_command.split(";") if command.strip()]
+
+    @property
+    def transaction_mode(self):
+        mode = self.settings_dict["OPTIONS"].get("transaction_mode")
+        if mode is not None and mode.upper() not in TRANSACTION_MODES:
+            raise ImproperlyConfigured(
+                f"settings.DATABASES[{self.alias!r}]['OPTIONS']['transaction_mode'] "
+                f"must be one of {', '.join(TRANSACTION_MODES)}."
+            )
+        return mode and mode.upper()
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for command in self.init_commands:
+            conn.execute(command)
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.transaction_mode is None:
+            super()._start_transaction_under_autocommit()
+        else:
+            self.cursor().execute(f"BEGIN {self.transaction_mode}")
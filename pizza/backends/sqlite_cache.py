@@ -0,0 +1,280 @@
+"""
+Cache backend shared by every process on a host, with no external service.
+
+Entries live in one SQLite file in WAL mode. Readers never block writers,
+and every statement is atomic, so ``add()`` and ``incr()`` stay consistent
+across gunicorn workers. Integers are stored as SQLite integers, so
+``incr()`` is a single ``UPDATE ... RETURNING``. Other values are pickled.
+
+Expired entries are ignored on read and removed when the cache is culled.
+Culling runs every ``CULL_CHECK_EVERY`` writes. Once there are more than
+``MAX_ENTRIES`` entries, it drops ``1/CULL_FREQUENCY`` of them, least
+recently read first. Read times are refreshed at most once per
+``TOUCH_INTERVAL`` seconds, so hot keys do not turn reads into writes.
+
+Keys starting with one of the ``LOCAL_PREFIXES`` are also kept in an
+in-process copy. Every write to such a key bumps a generation counter in a
+small memory-mapped file next to the database. Each process compares the
+counter with the one its copy was read under, and drops its copy when they
+differ. Reading that counter costs no system call, so hot, rarely changing
+keys such as the menu are served without touching SQLite. A change made by
+any worker still reaches every other worker on its next read.
+
+    CACHES = {
+        "default": {
+            "BACKEND": "pizza.backends.sqlite_cache.SQLiteCache",
+            "LOCATION": "/var/cache/soko/cache.sqlite3",
+            "OPTIONS": {"MAX_ENTRIES": 10000, "LOCAL_PREFIXES": ["menu:"]},
+        }
+    }
+"""
+import fcntl
+import mmap
+import os
+import pickle
+import sqlite3
+import struct
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS cache_entry ("
+    " key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL, accessed REAL NOT NULL"
+    ") WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS cache_entry_accessed ON cache_entry (accessed)",
+]
+LIVE = "(expires IS NULL OR expires > ?)"
+UPSERT = (
+    "INSERT INTO cache_entry (key, value, expires, accessed) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires, "
+    "accessed = excluded.accessed"
+)
+GENERATION = struct.Struct("Q")
+
+
+def _encode(value):
+    if type(value) is int and -(2 ** 63) <= value < 2 ** 63:
+        return value
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _decode(value):
+    return value if isinstance(value, int) else pickle.loads(value)
+
+
+class Generation:
+    """
+    A 64-bit counter in a memory-mapped file, shared by every process that
+    maps it.
+    """
+
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        if os.fstat(self.fd).st_size < GENERATION.size:
+            os.ftruncate(self.fd, GENERATION.size)
+        self.map = mmap.mmap(self.fd, GENERATION.size)
+
+    def value(self):
+        return GENERATION.unpack_from(self.map)[0]
+
+    def bump(self):
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            GENERATION.pack_into(self.map, 0, (self.value() + 1) % 2 ** 64)
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self.path = str(location)
+        self.busy_timeout = options.get("BUSY_TIMEOUT", 5)
+        self.touch_interval = options.get("TOUCH_INTERVAL", 60)
+        self.cull_check_every = options.get("CULL_CHECK_EVERY", 100)
+        self.local_prefixes = tuple(options.get("LOCAL_PREFIXES", ()))
+        self._thread = threading.local()
+        self._setup_lock = threading.Lock()
+        self._generation = None
+        self._local = {}
+        self._writes = 0
+
+    # Connections are per thread and per process: a forked worker opens
+    # its own instead of sharing its parent's.
+    def _connection(self):
+        pid = os.getpid()
+        if getattr(self._thread, "pid", None) != pid:
+            connection = sqlite3.connect(
+                self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False
+            )
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with self._setup_lock:
+                for statement in SCHEMA:
+                    connection.execute(statement)
+            self._thread.connection, self._thread.pid = connection, pid
+        return self._thread.connection
+
+    def _generation_map(self):
+        if self._generation is None:
+            with self._setup_lock:
+                if self._generation is None:
+                    self._generation = Generation(f"{self.path}-generation")
+        return self._generation
+
+    def _is_local(self, key):
+        return bool(self.local_prefixes) and key.split(":", 2)[-1].startswith(self.local_prefixes)
+
+    def _changed(self, keys):
+        if any(self._is_local(key) for key in keys):
+            self._local.clear()
+            self._generation_map().bump()
+
+    def _read(self, keys, now):
+        """
+        Map each live key in ``keys`` to its stored (encoded) value.
+        """
+        found = {}
+        generation = self._generation_map().value() if self.local_prefixes else None
+        remote = []
+        for key in keys:
+            local = self._local.get(key) if self._is_local(key) else None
+            if local is not None and local[0] == generation and (local[1] is None or local[1] > now):
+                found[key] = local[2]
+            else:
+                remote.append(key)
+        if not remote:
+            return found
+
+        connection = self._connection()
+        placeholders = ", ".join("?" * len(remote))
+        rows = connection.execute(
+            f"SELECT key, value, expires, accessed FROM cache_entry WHERE key IN ({placeholders}) AND {LIVE}",
+            [*remote, now],
+        ).fetchall()
+        stale = []
+        for key, value, expires, accessed in rows:
+            found[key] = value
+            if self._is_local(key):
+                if len(self._local) >= self._max_entries:
+                    self._local.clear()
+                self._local[key] = (generation, expires, value)
+            if now - accessed > self.touch_interval:
+                stale.append((now, key))
+        if stale:
+            try:
+                connection.executemany("UPDATE cache_entry SET accessed = ? WHERE key = ?", stale)
+            except sqlite3.OperationalError:
+                # Only eviction order depends on this; never fail a read on it.
+                pass
+        return found
+
+    def _write(self, statement, rows, keys):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = connection.executemany(statement, rows)
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        # Bump only after the commit, so a reader that sees the new
+        # generation also sees the new value.
+        self._changed(keys)
+        self._writes += 1
+        if self._writes % self.cull_check_every == 0:
+            self._cull(connection, time.time())
+        return cursor.rowcount
+
+    def _cull(self, connection, now):
+        connection.execute("DELETE FROM cache_entry WHERE expires <= ?", [now])
+        count = connection.execute("SELECT count(*) FROM cache_entry").fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute("DELETE FROM cache_entry")
+        else:
+            connection.execute(
+                "DELETE FROM cache_entry WHERE key IN (SELECT key FROM cache_entry ORDER BY accessed LIMIT ?)",
+                [count // self._cull_frequency],
+            )
+        self._local.clear()
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        found = self._read([key], time.time())
+        return _decode(found[key]) if key in found else default
+
+    def get_many(self, keys, version=None):
+        keys = {self.make_and_validate_key(key, version=version): key for key in keys}
+        found = self._read(list(keys), time.time())
+        return {keys[key]: _decode(value) for key, value in found.items()}
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return key in self._read([key], time.time())
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._write(UPSERT, [(key, _encode(value), self.get_backend_timeout(timeout), time.time())], [key])
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires, now = self.get_backend_timeout(timeout), time.time()
+        rows = [
+            (self.make_and_validate_key(key, version=version), _encode(value), expires, now)
+            for key, value in data.items()
+        ]
+        if rows:
+            self._write(UPSERT, rows, [row[0] for row in rows])
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        return bool(self._write(
+            f"{UPSERT} WHERE NOT {LIVE.replace('expires', 'cache_entry.expires')}",
+            [(key, _encode(value), self.get_backend_timeout(timeout), now, now)],
+            [key],
+        ))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return bool(self._write(
+            f"UPDATE cache_entry SET expires = ? WHERE key = ? AND {LIVE}",
+            [(self.get_backend_timeout(timeout), key, time.time())],
+            [key],
+        ))
+
+    def incr(self, key, delta=1, version=None):
+        cache_key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            f"UPDATE cache_entry SET value = value + ? WHERE key = ? AND typeof(value) = 'integer' AND {LIVE} "
+            "RETURNING value",
+            [delta, cache_key, time.time()],
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Key '{key}' not found")
+        self._changed([cache_key])
+        return row[0]
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return bool(self._write("DELETE FROM cache_entry WHERE key = ?", [(key,)], [key]))
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_and_validate_key(key, version=version) for key in keys]
+        if keys:
+            self._write("DELETE FROM cache_entry WHERE key = ?", [(key,) for key in keys], keys)
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache_entry")
+        self._local.clear()
+        if self.local_prefixes:
+            self._generation_map().bump()
+
+    def close(self, **kwargs):
+        # Connections are reused across requests, like the locmem cache.
+        pass
@@ -0,0 +1,381 @@
+"""
+Helpers shared by the benchmark management commands: a throwaway database,
+synthetic menu data, in-process WSGI/ASGI drivers and latency summaries.
+"""
+import asyncio
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.client import HTTPConnection, HTTPSConnection
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+from . import ledger, metrics
+from .models import CatalogTopping, Pizza, Topping
+from .order_ids import next_order_number
+from .orders import create_order
+from .pricing import get_snapshot
+
+Call = namedtuple("Call", ["method", "path", "body"])
+
+Result = namedtuple("Result", ["status", "seconds"])
+
+# In-process runs drive every request from one client address, so rate
+# limits and admission control would measure the limiter, not the API.
+UNLIMITED = {"RATE_LIMITS": {}, "WRITE_CONCURRENCY_LIMIT": None}
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Run the block against a freshly migrated SQLite file that is thrown away
+    afterwards, never against the configured database.
+    """
+    connection = connections["default"]
+    with tempfile.TemporaryDirectory() as directory:
+        connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(directory, "benchmark.sqlite3")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def seed_menu(pizzas=3, toppings_per_pizza=5):
+    created = Pizza.objects.bulk_create([  # type: ignore
+        Pizza(name=f"size-{i}", price=f"{10 + i}.00") for i in range(pizzas)
+    ])
+    CatalogTopping.objects.bulk_create([  # type: ignore
+        CatalogTopping(name=f"topping-{j}", category="basic" if j % 2 else "deluxe")
+        for j in range(toppings_per_pizza)
+    ])
+    catalog = dict(CatalogTopping.objects.values_list("name", "id"))  # type: ignore
+    Topping.objects.bulk_create([  # type: ignore
+        Topping(pizza=pizza, catalog_topping_id=catalog[f"topping-{j}"], price=f"{1 + j % 5}.50")
+        for pizza in created for j in range(toppings_per_pizza)
+    ])
+    menu = {}
+    for topping_id, pizza_id in Topping.objects.values_list("id", "pizza_id"):  # type: ignore
+        menu.setdefault(pizza_id, []).append(topping_id)
+    return {pizza.id: menu.get(pizza.id, []) for pizza in created}
+
+
+def seed_account(account_number="0100172111111", balance="1000000000.00"):
+    return ledger.open_account(account_number, balance)
+
+
+def order_calls(menu, count, path="/api/v1/order/", rng=None):
+    rng = rng or random.Random(0)
+    pizza_ids = list(menu)
+    calls = []
+    for _ in range(count):
+        pizza_id = rng.choice(pizza_ids)
+        toppings = rng.sample(menu[pizza_id], min(2, len(menu[pizza_id])))
+        body = {"pizza_id": pizza_id, "quantity": rng.randint(1, 3), "toppings": toppings}
+        calls.append(Call("POST", path, json.dumps(body).encode()))
+    return calls
+
+
+def seed_orders(menu, count, rng=None):
+    """
+    Create ``count`` unpaid orders and return ``(order_number, total)`` pairs.
+    """
+    rng = rng or random.Random(1)
+    snapshot = get_snapshot()
+    orders = []
+    for _ in range(count):
+        pizza_id = rng.choice(list(menu))
+        quote = snapshot.quote(pizza_id, 1, menu[pizza_id][:1])
+        order_number = next_order_number()
+        create_order(order_number, [quote], quote.subtotal, quote.vat, quote.total)
+        orders.append((order_number, quote.total))
+    return orders
+
+
+def payment_calls(orders, account_number="0100172111111", path="/api/v1/payment/"):
+    return [
+        Call("POST", path, json.dumps({
+            "account_number": account_number, "order_id": order_number, "amount": str(total),
+        }).encode())
+        for order_number, total in orders
+    ]
+
+
+def mixed_calls(menu, orders, count, rng=None):
+    """
+    A read-heavy mix: 60% pizza list, 20% topping list, 15% orders and up to
+    5% payments (one per seeded order).
+    """
+    rng = rng or random.Random(2)
+    sizes = list(Pizza.objects.values_list("name", flat=True))  # type: ignore
+    payments = payment_calls(orders[:count // 20])
+    new_orders = order_calls(menu, count * 15 // 100, rng=rng)
+    calls = payments + new_orders
+    calls += [Call("GET", f"/api/v1/toppings/?size={rng.choice(sizes)}", None) for _ in range(count // 5)]
+    calls += [Call("GET", "/api/v1/pizzas/", None)] * (count - len(calls))
+    rng.shuffle(calls)
+    return calls
+
+
+def _resolvable(path):
+    candidates = [path, path.rstrip("/") + "/"]
+    candidates += [p.replace("/api/", "/api/v1/", 1) for p in candidates]
+    for candidate in candidates:
+        try:
+            resolve(candidate)
+        except Resolver404:
+            continue
+        return candidate
+    return path
+
+
+def postman_calls(collection_path):
+    """
+    Calls described by a Postman v2.1 collection such as ``pizza_post.json``.
+    Paths that predate the versioned routes are mapped onto them.
+    """
+    with open(collection_path) as f:
+        collection = json.load(f)
+    calls = []
+    stack = list(collection.get("item", []))
+    while stack:
+        item = stack.pop(0)
+        if "item" in item:
+            stack[:0] = item["item"]
+            continue
+        request = item["request"]
+        url = urlsplit(request["url"]["raw"] if isinstance(request["url"], dict) else request["url"])
+        path = _resolvable(url.path)
+        body = (request.get("body") or {}).get("raw")
+        calls.append(Call(request["method"], f"{path}?{url.query}" if url.query else path,
+                          body.encode() if body else None))
+    return calls
+
+
+def traffic_calls(traffic_path):
+    """
+    Calls captured one JSON object per line: ``{"method", "path", "body"}``.
+    """
+    calls = []
+    with open(traffic_path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            body = record.get("body")
+            if body is not None and not isinstance(body, str):
+                body = json.dumps(body)
+            calls.append(Call(record.get("method", "GET").upper(), record["path"], body.encode() if body else None))
+    return calls
+
+
+def percentile(ordered, q):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(results, elapsed):
+    latencies = sorted(r.seconds for r in results)
+    return {
+        "requests": len(results),
+        "seconds": round(elapsed, 4),
+        "throughput": round(len(results) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "statuses": dict(Counter(str(r.status) for r in results)),
+    }
+
+
+def _environ(call):
+    path, _, query = call.path.partition("?")
+    body = call.body or b""
+    return {
+        "REQUEST_METHOD": call.method,
+        "PATH_INFO": path,
+        "QUERY_STRING": query,
+        "SCRIPT_NAME": "",
+        "SERVER_NAME": "benchmark",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "REMOTE_ADDR": "127.0.0.1",
+        "HTTP_HOST": "benchmark",
+        "CONTENT_TYPE": "application/json",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.input": BytesIO(body),
+        "wsgi.url_scheme": "http",
+        "wsgi.errors": BytesIO(),
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+
+
+def run_wsgi(calls, concurrency, application=None):
+    """
+    Drive ``calls`` through a WSGI application from ``concurrency`` threads.
+    """
+    application = application or WSGIHandler()
+
+    def send(call):
+        started = time.perf_counter()
+        status = []
+        response = application(_environ(call), lambda s, headers, exc_info=None: status.append(s))
+        try:
+            for _ in response:
+                pass
+        finally:
+            if hasattr(response, "close"):
+                response.close()
+        return Result(int(status[0].split()[0]), time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(send, calls))
+    return results, time.perf_counter() - started
+
+
+def run_http(base_url, calls, concurrency):
+    """
+    Drive ``calls`` against a running server from ``concurrency`` threads,
+    each reusing one keep-alive connection.
+    """
+    target = urlsplit(base_url)
+    connection_class = HTTPSConnection if target.scheme == "https" else HTTPConnection
+    local = threading.local()
+
+    def send(call):
+        started = time.perf_counter()
+        if not hasattr(local, "connection"):
+            local.connection = connection_class(target.netloc, timeout=30)
+        headers = {"Content-Type": "application/json"}
+        try:
+            local.connection.request(call.method, target.path.rstrip("/") + call.path, call.body, headers)
+            response = local.connection.getresponse()
+            response.read()
+            status = response.status
+        except OSError:
+            local.connection.close()
+            del local.connection
+            status = 0
+        return Result(status, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(send, calls))
+    return results, time.perf_counter() - started
+
+
+def fetch_metrics(base_url):
+    """
+    Per-route ``(query_sum, request_count)`` from a server's /api/metrics/.
+    """
+    target = urlsplit(base_url)
+    connection_class = HTTPSConnection if target.scheme == "https" else HTTPConnection
+    connection = connection_class(target.netloc, timeout=30)
+    connection.request("GET", target.path.rstrip("/") + "/api/metrics/")
+    text = connection.getresponse().read().decode()
+    connection.close()
+    totals = {}
+    for line in text.splitlines():
+        for suffix, index in (("_sum", 0), ("_count", 1)):
+            prefix = f"soko_db_queries_per_request{suffix}{{route=\""
+            if line.startswith(prefix):
+                route, _, value = line[len(prefix):].partition('"} ')
+                totals.setdefault(route, [0.0, 0])[index] = float(value)
+    return totals
+
+
+def registry_query_totals():
+    """
+    Per-route ``(query_sum, request_count)`` from this process's metrics.
+    """
+    histograms = metrics.registry.snapshot()["queries"]
+    return {route: [histogram[-1], sum(histogram[:-1])] for route, histogram in histograms.items()}
+
+
+def queries_per_request(before, after):
+    report = {}
+    for route, (queries, count) in after.items():
+        if route == "api/metrics/":
+            continue
+        old_queries, old_count = before.get(route, (0.0, 0))
+        if count - old_count:
+            report[route] = round((queries - old_queries) / (count - old_count), 2)
+    return report
+
+
+async def _asgi_send(application, call):
+    path, _, query = call.path.partition("?")
+    body = call.body or b""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": call.method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [
+            (b"host", b"benchmark"),
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    request = [{"type": "http.request", "body": body, "more_body": False}]
+    status = []
+
+    async def receive():
+        if request:
+            return request.pop()
+        # Stay connected; the handler cancels this once the response is sent.
+        await asyncio.Future()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    started = time.perf_counter()
+    await application(scope, receive, send)
+    return Result(status[0], time.perf_counter() - started)
+
+
+def run_asgi(calls, concurrency, application=None):
+    """
+    Drive ``calls`` through an ASGI application with ``concurrency``
+    requests in flight on one event loop.
+    """
+    application = application or ASGIHandler()
+
+    async def main():
+        pending = iter(calls)
+        results = []
+
+        async def worker():
+            for call in pending:
+                results.append(await _asgi_send(application, call))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return results
+
+    started = time.perf_counter()
+    results = asyncio.run(main())
+    return results, time.perf_counter() - started
@@ -0,0 +1,118 @@
+"""
+Bulk import and export of the topping catalog and its price matrix.
+
+Rows are ``pizza, topping, category, price``: one per topping offered on a
+pizza size. Imports upsert catalog toppings by case-insensitive name and
+prices by ``(pizza, topping)`` with ``bulk_create(update_conflicts=True)``,
+so a catalog of any size loads in a handful of statements and existing
+``Topping`` ids, which orders refer to, never change.
+"""
+import csv
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from . import menu_cache
+from .models import CatalogTopping, Pizza, Topping
+
+COLUMNS = ("pizza", "topping", "category", "price")
+CATEGORIES = {key for key, _ in CatalogTopping.CATEGORY_CHOICES}
+
+
+class CatalogError(ValueError):
+    pass
+
+
+def read_rows(f):
+    """
+    Parse and validate CSV rows, returning ``(pizza, topping, category,
+    price)`` tuples.
+    """
+    reader = csv.DictReader(f)
+    missing = set(COLUMNS) - set(reader.fieldnames or ())
+    if missing:
+        raise CatalogError(f"Missing columns: {', '.join(sorted(missing))}")
+    rows = []
+    for line, row in enumerate(reader, start=2):
+        pizza, topping, category = row["pizza"].strip(), row["topping"].strip(), row["category"].strip().lower()
+        try:
+            price = Decimal(row["price"])
+            if price < 0 or not pizza or not topping or category not in CATEGORIES:
+                raise ValueError
+        except (InvalidOperation, ValueError):
+            raise CatalogError(f"Invalid row on line {line}")
+        rows.append((pizza, topping, category, price))
+    return rows
+
+
+def import_rows(rows, batch_size=1000):
+    """
+    Upsert catalog rows, returning ``(toppings, prices)`` counts. Pizza
+    sizes must already exist. Pizzas and toppings are matched by name
+    ignoring case, as the catalog migration grouped them; a new topping is
+    spelled as in its first row, and every row for it must agree on its
+    category.
+    """
+    pizzas = {name.lower(): pk for pk, name in Pizza.objects.values_list("id", "name")}  # type: ignore
+    unknown = sorted({pizza for pizza, *_ in rows if pizza.lower() not in pizzas})
+    if unknown:
+        raise CatalogError(f"Unknown pizza sizes: {', '.join(unknown)}")
+
+    toppings = {}
+    conflicts = set()
+    for _, topping, category, _ in rows:
+        name, seen = toppings.setdefault(topping.lower(), (topping, category))
+        if seen != category:
+            conflicts.add(name)
+    if conflicts:
+        raise CatalogError(f"Conflicting categories for toppings: {', '.join(sorted(conflicts))}")
+
+    with transaction.atomic():
+        existing = {
+            name.lower(): (pk, category)
+            for pk, name, category in CatalogTopping.objects.alias(key=Lower("name")).filter(  # type: ignore
+                key__in=toppings
+            ).values_list("id", "name", "category")
+        }
+        # ON CONFLICT cannot target the lower(name) index, so changed and
+        # new toppings are written separately.
+        CatalogTopping.objects.bulk_update(  # type: ignore
+            [CatalogTopping(id=existing[key][0], category=category)
+             for key, (_, category) in toppings.items() if key in existing and existing[key][1] != category],
+            ["category"], batch_size=batch_size,
+        )
+        CatalogTopping.objects.bulk_create(  # type: ignore
+            [CatalogTopping(name=name, category=category)
+             for key, (name, category) in toppings.items() if key not in existing],
+            batch_size=batch_size,
+        )
+        catalog = {
+            name.lower(): pk for name, pk in CatalogTopping.objects.alias(key=Lower("name")).filter(  # type: ignore
+                key__in=toppings
+            ).values_list("name", "id")
+        }
+        prices = {
+            (pizzas[pizza.lower()], catalog[topping.lower()]): price for pizza, topping, _, price in rows
+        }
+        Topping.objects.bulk_create(  # type: ignore
+            [Topping(pizza_id=pizza_id, catalog_topping_id=topping_id, price=price)
+             for (pizza_id, topping_id), price in prices.items()],
+            update_conflicts=True, unique_fields=["pizza", "catalog_topping"], update_fields=["price"],
+            batch_size=batch_size,
+        )
+        # bulk_create sends no post_save, so invalidate the menu here.
+        transaction.on_commit(menu_cache.invalidate)
+    return len(toppings), len(prices)
+
+
+def export_rows():
+    return Topping.objects.order_by("pizza__name", "catalog_topping__name").values_list(  # type: ignore
+        "pizza__name", "catalog_topping__name", "catalog_topping__category", "price"
+    )
+
+
+def write_rows(f, rows):
+    writer = csv.writer(f)
+    writer.writerow(COLUMNS)
+    writer.writerows(rows)
@@ -0,0 +1,18 @@
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+from . import menu_cache, routers
+
+
+@register(Tags.caches)
+def check_replica_menu_cache(app_configs, **kwargs):
+    # sync_replicas invalidates the menu from its own process, which only
+    # reaches the web workers through a cache they share.
+    if not routers.replicas() or not isinstance(menu_cache._cache(), (LocMemCache, DummyCache)):
+        return []
+    return [Error(
+        "DATABASE_REPLICAS need a menu cache shared by every process.",
+        hint="Point MENU_CACHE_ALIAS at a shared cache such as pizza.backends.sqlite_cache.SQLiteCache.",
+        id="pizza.E001",
+    )]
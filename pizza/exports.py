@@ -0,0 +1,119 @@
+"""
+Streaming order exports.
+
+Orders, hot and archived, are read with ``iterator(chunk_size=...)`` and
+their items, pizzas and toppings are prefetched per chunk, so memory use
+depends on the chunk size and not on how many orders are exported.
+"""
+import csv
+import json
+from datetime import datetime, time, timedelta
+
+from django.db.models import Prefetch
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem, Topping
+
+CSV_COLUMNS = (
+    "order_number", "created_at", "payment_status", "subtotal", "vat", "total",
+    "pizza", "quantity", "toppings",
+)
+CONTENT_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+
+class ExportError(ValueError):
+    pass
+
+
+def parse_bound(value, name, end=False):
+    """
+    Parse a ``start``/``end`` filter: an ISO datetime, or an ISO date
+    meaning the start of that day, or of the next day for ``end`` so the
+    range includes it.
+    """
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise ExportError(f"Invalid {name} date")
+        moment = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _orders(order_model, item_model, start, end, chunk_size, using):
+    orders = order_model.objects.using(using).order_by("id").only(
+        "order_number", "created_at", "payment_status", "subtotal", "vat", "total"
+    ).prefetch_related(Prefetch(
+        "items",
+        queryset=item_model.objects.select_related("pizza").only("order_id", "pizza__name", "quantity")
+        .prefetch_related(Prefetch(
+            "toppings", queryset=Topping.objects.select_related("catalog_topping").only("catalog_topping__name")
+        )),  # type: ignore
+    ))
+    if start:
+        orders = orders.filter(created_at__gte=start)
+    if end:
+        orders = orders.filter(created_at__lt=end)
+    return orders.iterator(chunk_size=chunk_size)
+
+
+def iter_orders(start=None, end=None, chunk_size=1000, using=None):
+    """
+    Yield one dict per order, with its items, for orders created in
+    ``[start, end)``: hot orders first, then archived ones. Rows are read
+    from ``using``, or the database the router picks when the generator
+    runs.
+    """
+    for order_model, item_model in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+        for order in _orders(order_model, item_model, start, end, chunk_size, using):
+            yield {
+                "order_number": order.order_number,
+                "created_at": order.created_at.isoformat(),
+                "payment_status": order.payment_status,
+                "subtotal": f"{order.subtotal:.2f}",
+                "vat": f"{order.vat:.2f}",
+                "total": f"{order.total:.2f}",
+                "items": [{
+                    "pizza": item.pizza.name,
+                    "quantity": item.quantity,
+                    "toppings": [topping.name for topping in item.toppings.all()],
+                } for item in order.items.all()],
+            }
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(orders):
+    """
+    One CSV line per order item; toppings are joined with ``;``.
+    """
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for order in orders:
+        header = [order[column] for column in CSV_COLUMNS[:6]]
+        for item in order["items"] or [{"pizza": "", "quantity": "", "toppings": []}]:
+            yield writer.writerow(header + [item["pizza"], item["quantity"], ";".join(item["toppings"])])
+
+
+def ndjson_lines(orders):
+    for order in orders:
+        yield json.dumps(order) + "\n"
+
+
+def export_lines(kind, orders):
+    if kind == "csv":
+        return csv_lines(orders)
+    if kind == "ndjson":
+        return ndjson_lines(orders)
+    raise ExportError("Export type must be csv or ndjson")
@@ -0,0 +1,216 @@
+"""
+``Idempotency-Key`` support for POST endpoints.
+
+The first request carrying a key runs the handler and its response is
+stored for ``IDEMPOTENCY_TTL`` seconds; retries with the same key get the
+stored response back without the handler running again. Duplicates that
+arrive while the first request is still running wait for its response:
+threads of one process through an in-process event, other processes through
+a short-lived claim in the store.
+
+``IDEMPOTENCY_STORE`` selects where responses live: ``"cache"`` (the
+``IDEMPOTENCY_CACHE_ALIAS`` cache, the default) or ``"database"`` (the
+``IdempotencyRecord`` table, purged by ``manage.py purge_idempotency_keys``).
+"""
+import hashlib
+import threading
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+
+from .models import IdempotencyRecord
+from .renderers import FastJSONRenderer
+from .serializers import envelope
+
+HEADER = "Idempotency-Key"
+POLL_INTERVAL = 0.05
+
+StoredResponse = namedtuple("StoredResponse", ["fingerprint", "status_code", "content", "content_type"])
+
+
+def _setting(name, default):
+    return getattr(settings, f"IDEMPOTENCY_{name}", default)
+
+
+class CacheStore:
+    def __init__(self):
+        self.cache = caches[_setting("CACHE_ALIAS", "default")]
+
+    def get(self, key):
+        return self.cache.get(f"idem:{key}")
+
+    def claim(self, key, timeout):
+        return self.cache.add(f"idem-claim:{key}", 1, timeout)
+
+    def put(self, key, stored, ttl):
+        self.cache.set(f"idem:{key}", stored, ttl)
+        self.cache.delete(f"idem-claim:{key}")
+
+    def release(self, key):
+        self.cache.delete(f"idem-claim:{key}")
+
+
+class DatabaseStore:
+    def get(self, key):
+        record = IdempotencyRecord.objects.filter(  # type: ignore
+            key=key, status_code__isnull=False, expires_at__gt=timezone.now()
+        ).first()
+        if record is None:
+            return None
+        return StoredResponse(record.fingerprint, record.status_code, bytes(record.content), record.content_type)
+
+    def claim(self, key, timeout):
+        now = timezone.now()
+        IdempotencyRecord.objects.filter(key=key, expires_at__lte=now).delete()  # type: ignore
+        try:
+            with transaction.atomic():
+                IdempotencyRecord.objects.create(key=key, expires_at=now + timedelta(seconds=timeout))  # type: ignore
+        except IntegrityError:
+            return False
+        return True
+
+    def put(self, key, stored, ttl):
+        IdempotencyRecord.objects.filter(key=key).update(  # type: ignore
+            fingerprint=stored.fingerprint,
+            status_code=stored.status_code,
+            content=stored.content,
+            content_type=stored.content_type,
+            expires_at=timezone.now() + timedelta(seconds=ttl),
+        )
+
+    def release(self, key):
+        IdempotencyRecord.objects.filter(key=key, status_code__isnull=True).delete()  # type: ignore
+
+
+def get_store():
+    if _setting("STORE", "cache") == "database":
+        return DatabaseStore()
+    return CacheStore()
+
+
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def _envelope(message, status_code, **headers):
+    response = HttpResponse(FastJSONRenderer().render(envelope(None, message, successful=False)),
+                            status=status_code, content_type="application/json")
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def _replay(stored, fingerprint):
+    if stored.fingerprint != fingerprint:
+        return _envelope(
+            f"{HEADER} was already used with a different request body",
+            status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    response = HttpResponse(stored.content, status=stored.status_code, content_type=stored.content_type)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _wait_for(store, key, event, timeout):
+    if event is not None:
+        # Same-process duplicate: the leader sets the event once it is done.
+        event.wait(timeout)
+        return store.get(key)
+    deadline = time.monotonic() + timeout
+    while True:
+        stored = store.get(key)
+        if stored is not None or time.monotonic() >= deadline:
+            return stored
+        time.sleep(POLL_INTERVAL)
+
+
+def run_once(request, handler):
+    """
+    Run ``handler()`` at most once per idempotency key and return its
+    response, or the stored response for a key that has already run.
+    """
+    key = hashlib.sha256(f"{request.path}\0{request.headers[HEADER]}".encode()).hexdigest()
+    fingerprint = hashlib.sha256(request.body).hexdigest()
+    store = get_store()
+    ttl = _setting("TTL", 24 * 60 * 60)
+    wait = _setting("WAIT", 10)
+
+    stored = store.get(key)
+    if stored is not None:
+        return _replay(stored, fingerprint)
+
+    with _in_flight_lock:
+        event = _in_flight.get(key)
+        leader = event is None
+        if leader:
+            event = _in_flight[key] = threading.Event()
+
+    if not leader or not store.claim(key, wait):
+        if leader:
+            with _in_flight_lock:
+                _in_flight.pop(key, None)
+            event.set()
+            event = None
+        stored = _wait_for(store, key, event, wait)
+        if stored is None:
+            return _envelope(
+                "A request with this Idempotency-Key is still being processed",
+                status.HTTP_409_CONFLICT, **{"Retry-After": "1"},
+            )
+        return _replay(stored, fingerprint)
+
+    try:
+        response = handler()
+        if hasattr(response, "render"):
+            response.render()
+        # Shed and failed requests are not stored, so they can be retried.
+        if response.status_code < 500 and response.status_code != status.HTTP_429_TOO_MANY_REQUESTS:
+            store.put(key, StoredResponse(
+                fingerprint, response.status_code, response.content, response["Content-Type"]
+            ), ttl)
+        else:
+            store.release(key)
+        return response
+    except BaseException:
+        store.release(key)
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+        event.set()
+
+
+class IdempotentMixin:
+    """
+    APIView mixin honouring the ``Idempotency-Key`` header on POST.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method != "POST" or HEADER not in request.headers:
+            return super().dispatch(request, *args, **kwargs)
+        return run_once(request, lambda: super(IdempotentMixin, self).dispatch(request, *args, **kwargs))
+
+
+class AsyncIdempotentMixin:
+    """
+    ``IdempotentMixin`` for async views: ``run_once`` runs in a thread and
+    calls back into the event loop for the view itself.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        respond = super().dispatch
+        if request.method != "POST" or HEADER not in request.headers:
+            return await respond(request, *args, **kwargs)
+
+        async def handler():
+            return await respond(request, *args, **kwargs)
+
+        return await sync_to_async(run_once)(request, async_to_sync(handler))
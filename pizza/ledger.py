@@ -0,0 +1,136 @@
+"""
+Append-only account ledger.
+
+Balances never change by updating ``Account`` rows: every debit and credit,
+the opening balance included, is a ``LedgerEntry`` insert, and an account's
+balance is its latest ``BalanceSnapshot`` plus the entries after it.
+``compact()`` (``manage.py compact_ledger``) rolls the entries since each
+account's last snapshot into a new snapshot and copies that balance to
+``Account.account_balance``, a read-only copy of the balance at the last
+compaction that nothing reads back.
+"""
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Account, BalanceSnapshot, LedgerEntry
+from .pricing import from_cents, to_cents
+
+
+def _latest_snapshot(account):
+    return BalanceSnapshot.objects.filter(account=account).order_by("-last_entry_id")  # type: ignore
+
+
+def _with_snapshot(accounts):
+    latest = _latest_snapshot(OuterRef("pk"))
+    return accounts.annotate(
+        snapshot_cents=Subquery(latest.values("balance_cents")[:1]),
+        snapshot_entry=Subquery(latest.values("last_entry_id")[:1]),
+    )
+
+
+def with_balances(accounts):
+    """
+    Annotate ``accounts`` with ``balance_cents``, the balance
+    ``get_balance`` reports, in the same query.
+    """
+    since = LedgerEntry.objects.filter(  # type: ignore
+        account_id=OuterRef("pk"), id__gt=Coalesce(OuterRef("snapshot_entry"), 0)
+    ).order_by().values("account_id").annotate(cents=Sum("amount_cents")).values("cents")
+    return _with_snapshot(accounts).annotate(
+        balance_cents=Coalesce("snapshot_cents", 0) + Coalesce(Subquery(since), 0)
+    )
+
+
+def _base_cents(account):
+    return account["snapshot_cents"] or 0
+
+
+def get_balance(account_number):
+    """
+    Return ``{"id", "balance_cents"}`` for an account, or None if there is
+    no such account. Two queries however many entries there are.
+    """
+    account = _with_snapshot(Account.objects.filter(account_number=account_number)).values(  # type: ignore
+        "id", "snapshot_cents", "snapshot_entry"
+    ).first()
+    if account is None:
+        return None
+    since = LedgerEntry.objects.filter(  # type: ignore
+        account_id=account["id"], id__gt=account["snapshot_entry"] or 0
+    ).aggregate(cents=Sum("amount_cents"))["cents"]
+    return {"id": account["id"], "balance_cents": _base_cents(account) + (since or 0)}
+
+
+def balance(account_number):
+    account = get_balance(account_number)
+    return None if account is None else from_cents(account["balance_cents"])
+
+
+def open_account(account_number, balance=0):
+    """
+    Create an account whose opening balance is its first ledger entry.
+    """
+    with transaction.atomic():
+        account = Account.objects.create(account_number=account_number, account_balance=balance)  # type: ignore
+        if to_cents(balance):
+            credit(account.id, to_cents(balance))
+    return account
+
+
+def credit(account_id, cents, reference=""):
+    """
+    Add ``cents`` to an account, e.g. a top-up or a refund of
+    ``reference``.
+    """
+    return LedgerEntry.objects.create(  # type: ignore
+        account_id=account_id, amount_cents=cents, order_number=reference
+    )
+
+
+def debit(account_id, cents, order_number=""):
+    return LedgerEntry.objects.create(  # type: ignore
+        account_id=account_id, amount_cents=-cents, order_number=order_number
+    )
+
+
+def debit_many(account_id, debits):
+    """
+    Record ``(cents, order_number)`` debits with one INSERT.
+    """
+    return LedgerEntry.objects.bulk_create([  # type: ignore
+        LedgerEntry(account_id=account_id, amount_cents=-cents, order_number=order_number)
+        for cents, order_number in debits
+    ])
+
+
+def compact():
+    """
+    Snapshot every account with entries since its last snapshot, returning
+    the number of snapshots written.
+    """
+    with transaction.atomic():
+        # Each run snapshots every account with newer entries, and entry ids
+        # only grow, so the entries since the newest snapshotted one are
+        # exactly those not yet in any snapshot. Only they are scanned.
+        floor = BalanceSnapshot.objects.aggregate(floor=Max("last_entry_id"))["floor"] or 0  # type: ignore
+        pending = LedgerEntry.objects.filter(id__gt=floor).values("account_id").annotate(  # type: ignore
+            cents=Sum("amount_cents"), last_entry_id=Max("id")
+        )
+        pending = {row["account_id"]: row for row in pending}
+        if not pending:
+            return 0
+
+        accounts = _with_snapshot(Account.objects.filter(id__in=pending))  # type: ignore
+        snapshots = []
+        updated = []
+        for account in accounts.values("id", "snapshot_cents", "snapshot_entry"):
+            row = pending[account["id"]]
+            cents = _base_cents(account) + row["cents"]
+            snapshots.append(BalanceSnapshot(
+                account_id=account["id"], balance_cents=cents, last_entry_id=row["last_entry_id"]
+            ))
+            updated.append(Account(id=account["id"], account_balance=from_cents(cents)))
+        BalanceSnapshot.objects.bulk_create(snapshots)  # type: ignore
+        Account.objects.bulk_update(updated, ["account_balance"])  # type: ignore
+    return len(snapshots)
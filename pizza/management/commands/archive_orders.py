@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from pizza import archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Move paid orders older than --days into the archive tables in "
+        "batches. Safe to interrupt and re-run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, help="Archive orders older than this; ORDER_ARCHIVE_AFTER_DAYS by default.")
+        parser.add_argument("--chunk-size", type=int, default=500)
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+        parser.add_argument("--max-batches", type=int, help="Stop after this many batches.")
+
+    def handle(self, *args, **options):
+        moved = 0
+        for count in archive.archive_orders(
+            archive.cutoff(options["days"]), options["chunk_size"], options["pause"], options["max_batches"]
+        ):
+            moved += count
+            if options["verbosity"] > 1:
+                self.stdout.write(f"Archived {moved} orders so far")
+        self.stdout.write(f"Archived {moved} orders")
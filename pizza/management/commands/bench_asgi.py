@@ -0,0 +1,54 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from pizza import benchmarks
+from pizza.benchmarks import Call
+
+ENDPOINTS = {
+    "pizzas": ("/api/v1/pizzas/", "/api/v1/async/pizzas/"),
+    "toppings": ("/api/v1/toppings/?size=size-0", "/api/v1/async/toppings/?size=size-0"),
+    "order": ("/api/v1/order/", "/api/v1/async/order/"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare in-process throughput of the sync views under WSGI with the "
+        "sync and native async views under ASGI. Runs against a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--endpoint", choices=sorted(ENDPOINTS), default="pizzas")
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=64)
+        parser.add_argument("--pizzas", type=int, default=3)
+        parser.add_argument("--toppings", type=int, default=5, help="Toppings per pizza.")
+
+    def handle(self, *args, **options):
+        sync_path, async_path = ENDPOINTS[options["endpoint"]]
+        count, concurrency = options["requests"], options["concurrency"]
+
+        with override_settings(DEBUG=False, **benchmarks.UNLIMITED), benchmarks.benchmark_database():
+            menu = benchmarks.seed_menu(options["pizzas"], options["toppings"])
+
+            def calls(path):
+                if options["endpoint"] == "order":
+                    return benchmarks.order_calls(menu, count, path)
+                return [Call("GET", path, None)] * count
+
+            report = {}
+            for name, run, path in [
+                ("wsgi_sync", benchmarks.run_wsgi, sync_path),
+                ("asgi_sync", benchmarks.run_asgi, sync_path),
+                ("asgi_async", benchmarks.run_asgi, async_path),
+            ]:
+                run(calls(path)[:concurrency], concurrency)  # warm up caches and connections
+                report[name] = benchmarks.summarize(*run(calls(path), concurrency))
+
+        self.stdout.write(json.dumps({
+            "endpoint": options["endpoint"],
+            "concurrency": concurrency,
+            "results": report,
+        }, indent=2))
@@ -0,0 +1,87 @@
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from pizza.backends.sqlite_cache import SQLiteCache
+from pizza.menu_cache import VERSION_KEY, MenuEntry
+
+BACKENDS = {
+    "locmem": lambda directory: LocMemCache("bench", {}),
+    "file": lambda directory: FileBasedCache(os.path.join(directory, "file"), {}),
+    "shared": lambda directory: SQLiteCache(os.path.join(directory, "shared.sqlite3"), {}),
+    "shared+local": lambda directory: SQLiteCache(
+        os.path.join(directory, "shared.sqlite3"), {"OPTIONS": {"LOCAL_PREFIXES": ["menu:"]}}
+    ),
+}
+
+
+def _rate(count, elapsed):
+    return round(count / elapsed) if elapsed else None
+
+
+def _time(operations, fn):
+    started = time.perf_counter()
+    for i in range(operations):
+        fn(i)
+    return _rate(operations, time.perf_counter() - started)
+
+
+def _worker(args):
+    name, directory, operations = args
+    cache = BACKENDS[name](directory)
+    started = time.perf_counter()
+    for _ in range(operations):
+        cache.get(f"menu:{cache.get(VERSION_KEY)}:pizzas")
+        cache.incr("counter")
+    return time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the shared SQLite cache with the locmem and file caches: "
+        "single-process get/set/incr rates, then several processes reading "
+        "the menu and incrementing one counter at the same time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--operations", type=int, default=5000)
+        parser.add_argument("--processes", type=int, default=4)
+        parser.add_argument("--body-size", type=int, default=8192, help="Bytes in the cached menu body.")
+
+    def handle(self, *args, **options):
+        operations, processes = options["operations"], options["processes"]
+        entry = MenuEntry(b"x" * options["body_size"], '"etag"')
+        report = {}
+        for name, factory in BACKENDS.items():
+            with tempfile.TemporaryDirectory() as directory:
+                cache = factory(directory)
+                cache.set(VERSION_KEY, 1, timeout=None)
+                cache.set("menu:1:pizzas", entry, timeout=None)
+                cache.set("counter", 0, timeout=None)
+                result = {
+                    "get_per_second": _time(operations, lambda i: cache.get("menu:1:pizzas")),
+                    "set_per_second": _time(operations, lambda i: cache.set(f"key:{i % 100}", entry)),
+                    "incr_per_second": _time(operations, lambda i: cache.incr("counter")),
+                }
+
+                cache.set("counter", 0, timeout=None)
+                started = time.perf_counter()
+                with multiprocessing.get_context("fork").Pool(processes) as pool:
+                    pool.map(_worker, [(name, directory, operations)] * processes)
+                elapsed = time.perf_counter() - started
+                # Workers see the parent's counter only through a shared cache.
+                counter = BACKENDS[name](directory).get("counter") if name != "locmem" else cache.get("counter")
+                result["concurrent"] = {
+                    "menu_reads_per_second": _rate(processes * operations, elapsed),
+                    "counter": counter,
+                    "expected_counter": processes * operations,
+                    "consistent": counter == processes * operations,
+                }
+                report[name] = result
+        self.stdout.write(json.dumps(report, indent=2))
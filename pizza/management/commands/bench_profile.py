@@ -0,0 +1,73 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Run in a fresh interpreter: time importing the WSGI module, then the first
+# request through it, which is where Django is set up.
+COLD_START = """
+import json, sys, time
+from io import BytesIO
+started = time.perf_counter()
+from soko_pizza.wsgi import application
+imported = time.perf_counter()
+status = []
+body = b"".join(application({
+    "REQUEST_METHOD": "GET", "PATH_INFO": sys.argv[1], "QUERY_STRING": "", "SCRIPT_NAME": "",
+    "SERVER_NAME": "benchmark", "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1",
+    "HTTP_HOST": "benchmark", "REMOTE_ADDR": "127.0.0.1", "wsgi.input": BytesIO(), "wsgi.errors": BytesIO(),
+    "wsgi.url_scheme": "http", "wsgi.multithread": False, "wsgi.multiprocess": False,
+    "wsgi.run_once": False,
+}, lambda s, headers, exc_info=None: status.append(s)))
+finished = time.perf_counter()
+print(json.dumps({"status": status[0], "import": imported - started, "first_response": finished - started}))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare settings profiles: cold-start time of the WSGI entry point "
+        "and per-request throughput/latency of the benchmark workload, each "
+        "measured in a separate process."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("profiles", nargs="*", default=["soko_pizza.settings", "soko_pizza.settings_api"])
+        parser.add_argument("--runs", type=int, default=5, help="Cold starts per profile.")
+        parser.add_argument("--path", default="/api/metrics/", help="Path requested on cold start.")
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=16)
+
+    def handle(self, *args, **options):
+        report = {}
+        for profile in options["profiles"]:
+            env = dict(os.environ, DJANGO_SETTINGS_MODULE=profile)
+            starts = [self.cold_start(env, options["path"]) for _ in range(options["runs"])]
+            with tempfile.NamedTemporaryFile(suffix=".json") as output:
+                self.run([sys.executable, str(settings.BASE_DIR / "manage.py"), "benchmark",
+                          "--requests", str(options["requests"]), "--concurrency", str(options["concurrency"]),
+                          "--output", output.name], env)
+                load = json.load(output)["total"]
+            report[profile] = {
+                "import_ms": round(statistics.median(s["import"] for s in starts) * 1000, 2),
+                "cold_start_ms": round(statistics.median(s["first_response"] for s in starts) * 1000, 2),
+                "throughput": load["throughput"],
+                "p50_ms": load["p50_ms"],
+                "p95_ms": load["p95_ms"],
+                "per_request_ms": round(1000 / load["throughput"], 3) if load["throughput"] else None,
+            }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def cold_start(self, env, path):
+        return json.loads(self.run([sys.executable, "-c", COLD_START, path], env))
+
+    def run(self, command, env):
+        result = subprocess.run(command, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+        if result.returncode:
+            raise CommandError(result.stderr)
+        return result.stdout
@@ -0,0 +1,47 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+
+from pizza import benchmarks
+from pizza.models import Topping
+from pizza.renderers import FastJSONRenderer
+from pizza.serializers import TOPPING_ROW_FIELDS, ToppingSerializer, envelope, menu_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Time rendering the topping list through ToppingSerializer + JSONRenderer "
+        "against values_list rows + FastJSONRenderer on a large synthetic menu."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pizzas", type=int, default=20)
+        parser.add_argument("--toppings", type=int, default=500, help="Toppings per pizza.")
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        with override_settings(DEBUG=False), benchmarks.benchmark_database():
+            benchmarks.seed_menu(options["pizzas"], options["toppings"])
+
+            def model_serializer():
+                toppings = Topping.objects.select_related("catalog_topping")  # type: ignore
+                return JSONRenderer().render(envelope(ToppingSerializer(toppings, many=True).data))
+
+            def fast_path():
+                return FastJSONRenderer().render(envelope(menu_rows(Topping.objects.values_list(*TOPPING_ROW_FIELDS))))
+
+            if model_serializer() != fast_path():
+                raise CommandError("Fast path output differs from the ModelSerializer output")
+
+            report = {"rows": options["pizzas"] * options["toppings"]}
+            for name, render in [("model_serializer", model_serializer), ("fast_path", fast_path)]:
+                started = time.perf_counter()
+                for _ in range(options["repeat"]):
+                    render()
+                report[f"{name}_ms"] = round((time.perf_counter() - started) / options["repeat"] * 1000, 2)
+            report["speedup"] = round(report["model_serializer_ms"] / report["fast_path_ms"], 2)
+
+        self.stdout.write(json.dumps(report, indent=2))
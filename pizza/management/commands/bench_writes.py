@@ -0,0 +1,91 @@
+import json
+import logging
+import multiprocessing
+import time
+from collections import Counter
+
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.test.utils import override_settings
+
+from pizza import benchmarks
+
+# The stock backend with Django's defaults, for comparison.
+STOCK = {
+    "ENGINE": "django.db.backends.sqlite3",
+    "CONN_MAX_AGE": 0,
+    "OPTIONS": {},
+}
+TUNED_KEYS = ("ENGINE", "CONN_MAX_AGE", "OPTIONS")
+
+
+def _use_database(overrides):
+    connections.close_all()
+    settings_dict = dict(connections.settings["default"], **overrides)
+    connections.settings["default"] = settings_dict
+    del connections["default"]
+
+
+def _write(calls):
+    # Lock errors surface as 500s; keep their tracebacks out of the report.
+    logging.getLogger("django.request").setLevel(logging.CRITICAL)
+    results, elapsed = benchmarks.run_wsgi(calls, 1, WSGIHandler())
+    return [r.status for r in results], elapsed
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare write throughput of the stock SQLite backend and the tuned "
+        "DATABASES profile: several processes POST orders and payments "
+        "against one throwaway database file at the same time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--processes", type=int, default=8)
+        parser.add_argument("--writes", type=int, default=200, help="Order and payment POSTs per process.")
+
+    def handle(self, *args, **options):
+        tuned = connections.settings["default"]
+        tuned = {key: tuned[key] for key in TUNED_KEYS}
+        profiles = {"stock": (STOCK, 0), "tuned": (tuned, None)}
+        report = {}
+        try:
+            for name, (overrides, retries) in profiles.items():
+                _use_database(overrides)
+                with override_settings(**({} if retries is None else {"DATABASE_LOCK_RETRIES": retries})):
+                    report[name] = self.run_profile(options["processes"], options["writes"])
+        finally:
+            _use_database(tuned)
+        if report["stock"]["throughput"]:
+            report["speedup"] = round(report["tuned"]["throughput"] / report["stock"]["throughput"], 2)
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run_profile(self, processes, writes):
+        with override_settings(DEBUG=False, **benchmarks.UNLIMITED), benchmarks.benchmark_database():
+            menu = benchmarks.seed_menu()
+            benchmarks.seed_account()
+            orders = benchmarks.seed_orders(menu, processes * writes // 2)
+            payments = benchmarks.payment_calls(orders)
+            new_orders = benchmarks.order_calls(menu, processes * (writes - writes // 2))
+            per_process = [
+                payments[i::processes] + new_orders[i::processes] for i in range(processes)
+            ]
+            connections.close_all()
+            started = time.perf_counter()
+            with multiprocessing.get_context("fork").Pool(processes) as pool:
+                outcomes = pool.map(_write, per_process)
+            elapsed = time.perf_counter() - started
+            journal_mode = connections["default"].cursor().execute("PRAGMA journal_mode").fetchone()[0]
+
+        statuses = Counter(str(status) for codes, _ in outcomes for status in codes)
+        succeeded = statuses["200"] + statuses["201"]
+        return {
+            "journal_mode": journal_mode,
+            "writes": sum(statuses.values()),
+            "succeeded": succeeded,
+            "failed": sum(statuses.values()) - succeeded,
+            "statuses": dict(statuses),
+            "seconds": round(elapsed, 3),
+            "throughput": round(succeeded / elapsed, 1),
+        }
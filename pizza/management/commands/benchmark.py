@@ -0,0 +1,105 @@
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from pizza import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a workload against the API in-process (on a throwaway, seeded "
+        "database) or against a running server, and report throughput, "
+        "p50/p95/p99 latency and queries per request as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workload", choices=["mixed", "postman", "traffic"], default="mixed")
+        parser.add_argument("--collection", default=str(settings.BASE_DIR / "pizza_post.json"),
+                            help="Postman collection replayed by --workload=postman.")
+        parser.add_argument("--traffic", help="JSONL file of {method, path, body} replayed by --workload=traffic.")
+        parser.add_argument("--url", help="Base URL of a running server; defaults to in-process.")
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=16)
+        parser.add_argument("--pizzas", type=int, default=3)
+        parser.add_argument("--toppings", type=int, default=5, help="Toppings per pizza.")
+        parser.add_argument("--orders", type=int, default=200, help="Unpaid orders to seed for payments.")
+        parser.add_argument("--output", help="Also write the JSON report to this file.")
+        parser.add_argument("--baseline", help="Fail if results regress past this stored report.")
+        parser.add_argument("--save-baseline", help="Write the report as a new baseline.")
+        parser.add_argument("--tolerance", type=float, default=0.15,
+                            help="Allowed relative throughput drop / p95 increase against the baseline.")
+
+    def handle(self, *args, **options):
+        if options["workload"] == "traffic" and not options["traffic"]:
+            raise CommandError("--workload=traffic needs --traffic PATH")
+
+        if options["url"]:
+            calls = self.calls(options, menu=None, orders=[])
+            before = benchmarks.fetch_metrics(options["url"])
+            results, elapsed = benchmarks.run_http(options["url"], calls, options["concurrency"])
+            queries = benchmarks.queries_per_request(before, benchmarks.fetch_metrics(options["url"]))
+        else:
+            with override_settings(DEBUG=False, **benchmarks.UNLIMITED), benchmarks.benchmark_database():
+                menu = benchmarks.seed_menu(options["pizzas"], options["toppings"])
+                benchmarks.seed_account()
+                orders = benchmarks.seed_orders(menu, options["orders"])
+                calls = self.calls(options, menu, orders)
+                before = benchmarks.registry_query_totals()
+                results, elapsed = benchmarks.run_wsgi(calls, options["concurrency"])
+                queries = benchmarks.queries_per_request(before, benchmarks.registry_query_totals())
+
+        by_endpoint = defaultdict(list)
+        for call, result in zip(calls, results):
+            by_endpoint[f"{call.method} {call.path.partition('?')[0]}"].append(result)
+
+        report = {
+            "target": options["url"] or "in-process",
+            "workload": options["workload"],
+            "concurrency": options["concurrency"],
+            "total": benchmarks.summarize(results, elapsed),
+            "endpoints": {
+                name: benchmarks.summarize(endpoint_results, elapsed)
+                for name, endpoint_results in sorted(by_endpoint.items())
+            },
+            "queries_per_request": queries,
+        }
+        text = json.dumps(report, indent=2)
+        self.stdout.write(text)
+        for path in filter(None, [options["output"], options["save_baseline"]]):
+            with open(path, "w") as f:
+                f.write(text + "\n")
+
+        if options["baseline"]:
+            with open(options["baseline"]) as f:
+                regressions = self.compare(json.load(f), report, options["tolerance"])
+            if regressions:
+                raise CommandError("Performance regressed against baseline:\n  " + "\n  ".join(regressions))
+
+    def calls(self, options, menu, orders):
+        if options["workload"] == "postman":
+            calls = benchmarks.postman_calls(options["collection"])
+        elif options["workload"] == "traffic":
+            calls = benchmarks.traffic_calls(options["traffic"])
+        elif menu is None:
+            raise CommandError("The mixed workload seeds its own data and only runs in-process; "
+                               "use --workload=postman or traffic with --url")
+        else:
+            return benchmarks.mixed_calls(menu, orders, options["requests"])
+        return [calls[i % len(calls)] for i in range(options["requests"])]
+
+    def compare(self, baseline, report, tolerance):
+        regressions = []
+        old, new = baseline["total"], report["total"]
+        if new["throughput"] < old["throughput"] * (1 - tolerance):
+            regressions.append(f"throughput {new['throughput']} req/s < baseline {old['throughput']} req/s")
+        if new["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            regressions.append(f"p95 {new['p95_ms']} ms > baseline {old['p95_ms']} ms")
+        for route, count in report["queries_per_request"].items():
+            expected = baseline.get("queries_per_request", {}).get(route)
+            # Small slack so cache warm-up misses on read routes are not flagged.
+            if expected is not None and count > expected * (1 + tolerance) + 0.1:
+                regressions.append(f"{route} runs {count} queries per request, baseline {expected}")
+        return regressions
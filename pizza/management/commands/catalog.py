@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pizza import catalog
+
+
+class Command(BaseCommand):
+    help = (
+        "Import or export the topping catalog and price matrix as CSV with "
+        "columns pizza, topping, category, price."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("action", choices=["import", "export"])
+        parser.add_argument("path", nargs="?", help="CSV file; export writes to stdout without one.")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options["action"] == "export":
+            if options["path"]:
+                with open(options["path"], "w", newline="") as f:
+                    catalog.write_rows(f, catalog.export_rows())
+            else:
+                catalog.write_rows(self.stdout, catalog.export_rows())
+            return
+
+        if not options["path"]:
+            raise CommandError("import needs a CSV path")
+        try:
+            with open(options["path"], newline="") as f:
+                toppings, prices = catalog.import_rows(catalog.read_rows(f), options["batch_size"])
+        except catalog.CatalogError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"Imported {toppings} toppings and {prices} prices")
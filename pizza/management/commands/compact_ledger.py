@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from pizza import ledger
+
+
+class Command(BaseCommand):
+    help = "Roll ledger entries into new balance snapshots for every account that has any since its last one."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Wrote {ledger.compact()} balance snapshots")
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from pizza import order_queue
+
+
+class Command(BaseCommand):
+    help = "Write every order waiting in the write-behind queue to the database."
+
+    def handle(self, *args, **options):
+        spool = order_queue.get_spool()
+        created = order_queue.drain(spool)
+        self.stdout.write(f"Wrote {created} queued orders; {len(spool)} left in {spool.path}")
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from pizza import exports
+
+
+class Command(BaseCommand):
+    help = "Stream orders, with their items and toppings, as CSV or NDJSON."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--type", choices=sorted(exports.CONTENT_TYPES), default="csv")
+        parser.add_argument("--start", help="ISO date or datetime; orders created on or after it.")
+        parser.add_argument("--end", help="ISO date or datetime; orders created before it, or on that day.")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--output", help="File to write; stdout by default.")
+
+    def handle(self, *args, **options):
+        try:
+            start = exports.parse_bound(options["start"], "start")
+            end = exports.parse_bound(options["end"], "end", end=True)
+        except exports.ExportError as e:
+            raise CommandError(str(e))
+
+        lines = exports.export_lines(options["type"], exports.iter_orders(start, end, options["chunk_size"]))
+        if options["output"]:
+            with open(options["output"], "w", newline="") as f:
+                f.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
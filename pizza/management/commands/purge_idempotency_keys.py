@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from pizza.models import IdempotencyRecord
+
+
+class Command(BaseCommand):
+    help = "Delete expired Idempotency-Key responses from the database store."
+
+    def handle(self, *args, **options):
+        deleted, _ = IdempotencyRecord.objects.filter(expires_at__lte=timezone.now()).delete()  # type: ignore
+        self.stdout.write(f"Deleted {deleted} expired idempotency records")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from pizza import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales rollups from all hot and archived orders."
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"Rebuilt {rollups.rebuild()} rollup rows")
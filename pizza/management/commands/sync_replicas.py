@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pizza import replicas, routers
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy the primary SQLite database to every alias in DATABASE_REPLICAS "
+        "with the backup API, once or every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, help="Keep syncing, this many seconds apart.")
+
+    def handle(self, *args, **options):
+        if not routers.replicas():
+            raise CommandError("No DATABASE_REPLICAS are configured")
+        while True:
+            elapsed = replicas.sync_all()
+            self.stdout.write(f"Synced {', '.join(routers.replicas())} in {elapsed:.3f}s")
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
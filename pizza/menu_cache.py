@@ -0,0 +1,105 @@
+import hashlib
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+
+from .renderers import FastJSONRenderer
+
+VERSION_KEY = "menu:version"
+
+MenuEntry = namedtuple("MenuEntry", ["body", "etag"])
+
+
+def _cache():
+    return caches[getattr(settings, "MENU_CACHE_ALIAS", "default")]
+
+
+def current_version():
+    cache = _cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so a version key lost to eviction or a restart
+        # can never collide with entries written under an older version.
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _in_process(cache):
+    # LocMemCache never blocks, so calling it directly from the event loop is
+    # cheaper than its default sync_to_async-wrapped async methods.
+    return isinstance(cache, LocMemCache)
+
+
+async def acurrent_version():
+    cache = _cache()
+    if _in_process(cache):
+        return current_version()
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, time.time_ns(), timeout=None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    cache = _cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def _entry_key(version, name, params):
+    if params:
+        digest = hashlib.md5(repr(params).encode()).hexdigest()
+        return f"menu:{version}:{name}:{digest}"
+    return f"menu:{version}:{name}"
+
+
+def get_entry(name, build, params=()):
+    """
+    Return the rendered body for a menu listing, building it with ``build()``
+    only when the current menu version has no entry for it yet.
+    """
+    cache = _cache()
+    key = _entry_key(current_version(), name, params)
+    entry = cache.get(key)
+    if entry is None:
+        body = FastJSONRenderer().render(build())
+        entry = MenuEntry(body, f'"{hashlib.md5(body).hexdigest()}"')
+        cache.set(key, entry, timeout=getattr(settings, "MENU_CACHE_TIMEOUT", None))
+    return entry
+
+
+async def aget_entry(name, abuild, params=()):
+    """
+    Async counterpart of ``get_entry``; ``abuild`` is a coroutine function.
+    """
+    cache = _cache()
+    key = _entry_key(await acurrent_version(), name, params)
+    in_process = _in_process(cache)
+    entry = cache.get(key) if in_process else await cache.aget(key)
+    if entry is None:
+        body = FastJSONRenderer().render(await abuild())
+        entry = MenuEntry(body, f'"{hashlib.md5(body).hexdigest()}"')
+        timeout = getattr(settings, "MENU_CACHE_TIMEOUT", None)
+        if in_process:
+            cache.set(key, entry, timeout=timeout)
+        else:
+            await cache.aset(key, entry, timeout=timeout)
+    return entry
+
+
+def respond(request, entry):
+    response = get_conditional_response(request, etag=entry.etag)
+    if response is None:
+        response = HttpResponse(entry.body, content_type="application/json")
+    response["ETag"] = entry.etag
+    response["Cache-Control"] = "no-cache"
+    return response
@@ -0,0 +1,303 @@
+"""
+Per-route request metrics exposed in the Prometheus text format.
+
+``MetricsMiddleware`` records, for every request, its latency, the number of
+SQL queries it ran and the time spent in them, and the time spent rendering
+the response body. Queries are timed by an execute wrapper installed on
+every database connection, which attributes them to the request through a
+context variable so queries run from ``sync_to_async`` threads are counted
+too.
+
+Each process keeps its own registry. With ``METRICS_DIR`` set, processes
+on the host also write their registry there every ``METRICS_FLUSH_INTERVAL``
+seconds and the ``/api/metrics/`` view merges every file, so a multi-worker
+deployment reports totals across all workers. Files left by workers that
+have exited are folded into one ``metrics-dead.json``, so restarts neither
+pile up files nor make the counters go backwards.
+
+The view answers only clients in ``METRICS_ALLOWED_NETWORKS``, loopback and
+private addresses by default. Behind a proxy that is the proxy's address,
+so keep the path off the public listener.
+"""
+import fcntl
+import glob
+import ipaddress
+import json
+import os
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+DEFAULT_ALLOWED_NETWORKS = ("127.0.0.0/8", "10.0.0.0/8", "172.16.0.0/12", "192.168.0.0/16", "::1/128", "fc00::/7")
+
+DEAD_FILE = "metrics-dead.json"
+_worker_file = re.compile(r"metrics-(\d+)(?:-\d+)?\.json$")
+
+_current_probe = ContextVar("metrics_probe", default=None)
+
+
+class Probe:
+    __slots__ = ("queries", "query_seconds", "render_started", "render_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.render_started = None
+        self.render_seconds = 0.0
+
+
+def query_timer(execute, sql, params, many, context):
+    probe = _current_probe.get()
+    if probe is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        probe.queries += 1
+        probe.query_seconds += time.perf_counter() - started
+
+
+def install_query_timer(sender, connection, **kwargs):
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+def _observe(histogram, buckets, value):
+    # histogram: [per-bucket counts..., +Inf count, sum]
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            histogram[i] += 1
+            break
+    else:
+        histogram[len(buckets)] += 1
+    histogram[-1] += value
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.data = {"requests": {}, "latency": {}, "queries": {}, "query_seconds": {}, "render_seconds": {}}
+
+    def observe(self, route, method, status, seconds, probe):
+        key = f"{route}|{method}|{status}"
+        with self._lock:
+            data = self.data
+            data["requests"][key] = data["requests"].get(key, 0) + 1
+            latency = data["latency"].setdefault(route, [0] * (len(LATENCY_BUCKETS) + 2))
+            _observe(latency, LATENCY_BUCKETS, seconds)
+            queries = data["queries"].setdefault(route, [0] * (len(QUERY_BUCKETS) + 2))
+            _observe(queries, QUERY_BUCKETS, probe.queries)
+            data["query_seconds"][route] = data["query_seconds"].get(route, 0.0) + probe.query_seconds
+            data["render_seconds"][route] = data["render_seconds"].get(route, 0.0) + probe.render_seconds
+
+    def snapshot(self):
+        with self._lock:
+            return json.loads(json.dumps(self.data))
+
+
+registry = Registry()
+_last_flush = 0.0
+_file = (None, None, None)
+
+
+def _merge_into(merged, snapshot):
+    for family, values in snapshot.items():
+        target = merged.setdefault(family, {})
+        for key, value in values.items():
+            if isinstance(value, list):
+                current = target.setdefault(key, [0] * len(value))
+                target[key] = [a + b for a, b in zip(current, value)]
+            else:
+                target[key] = target.get(key, 0) + value
+
+
+def merge(snapshots):
+    merged = {"requests": {}, "latency": {}, "queries": {}, "query_seconds": {}, "render_seconds": {}}
+    for snapshot in snapshots:
+        _merge_into(merged, snapshot)
+    return merged
+
+
+def _path(directory):
+    global _file
+    pid, current, path = _file
+    if pid != os.getpid() or current != directory:
+        # The start time keeps a later process that reuses the pid from
+        # overwriting this one's totals before they are folded.
+        path = os.path.join(directory, f"metrics-{os.getpid()}-{time.time_ns()}.json")
+        _file = (os.getpid(), directory, path)
+    return path
+
+
+def _write(path, data):
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(data, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def flush(force=False):
+    global _last_flush
+    directory = getattr(settings, "METRICS_DIR", None)
+    now = time.monotonic()
+    if not directory or (not force and now - _last_flush < getattr(settings, "METRICS_FLUSH_INTERVAL", 5)):
+        return
+    _last_flush = now
+    os.makedirs(directory, exist_ok=True)
+    _write(_path(directory), registry.snapshot())
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def fold_dead(directory):
+    """
+    Add the files of workers that are no longer running to the dead-worker
+    totals and remove them, returning how many were folded.
+    """
+    dead = [
+        path for path in glob.glob(os.path.join(directory, "metrics-*.json"))
+        if (match := _worker_file.search(path)) and not _alive(int(match.group(1)))
+    ]
+    if not dead:
+        return 0
+    with open(os.path.join(directory, f"{DEAD_FILE}.lock"), "w") as lock:
+        # One collector at a time, or two could both fold the same file.
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        dead = [path for path in dead if os.path.exists(path)]
+        totals = merge([_read(os.path.join(directory, DEAD_FILE)) or {}])
+        for path in dead:
+            _merge_into(totals, _read(path) or {})
+        _write(os.path.join(directory, DEAD_FILE), totals)
+        for path in dead:
+            os.remove(path)
+    return len(dead)
+
+
+def collect():
+    directory = getattr(settings, "METRICS_DIR", None)
+    if not directory:
+        return registry.snapshot()
+    flush(force=True)
+    fold_dead(directory)
+    return merge(filter(None, map(_read, glob.glob(os.path.join(directory, "metrics-*.json")))))
+
+
+def _histogram_lines(name, buckets, values):
+    lines = [f"# TYPE {name} histogram"]
+    for route, histogram in sorted(values.items()):
+        cumulative = 0
+        for bound, count in zip(buckets, histogram):
+            cumulative += count
+            lines.append(f'{name}_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+        count = cumulative + histogram[len(buckets)]
+        lines.append(f'{name}_bucket{{route="{route}",le="+Inf"}} {count}')
+        lines.append(f'{name}_sum{{route="{route}"}} {histogram[-1]}')
+        lines.append(f'{name}_count{{route="{route}"}} {count}')
+    return lines
+
+
+def render(data):
+    lines = ["# TYPE soko_http_requests_total counter"]
+    for key, count in sorted(data["requests"].items()):
+        route, method, status = key.split("|")
+        lines.append(f'soko_http_requests_total{{route="{route}",method="{method}",status="{status}"}} {count}')
+    lines += _histogram_lines("soko_http_request_duration_seconds", LATENCY_BUCKETS, data["latency"])
+    lines += _histogram_lines("soko_db_queries_per_request", QUERY_BUCKETS, data["queries"])
+    for name, family in [
+        ("soko_db_query_duration_seconds_total", "query_seconds"),
+        ("soko_serialization_duration_seconds_total", "render_seconds"),
+    ]:
+        lines.append(f"# TYPE {name} counter")
+        for route, seconds in sorted(data[family].items()):
+            lines.append(f'{name}{{route="{route}"}} {seconds}')
+    return "\n".join(lines) + "\n"
+
+
+def _allowed(address):
+    networks = getattr(settings, "METRICS_ALLOWED_NETWORKS", DEFAULT_ALLOWED_NETWORKS)
+    try:
+        address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in networks)
+
+
+def metrics_view(request):
+    if not _allowed(request.META.get("REMOTE_ADDR", "")):
+        return HttpResponseForbidden()
+    return HttpResponse(render(collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        probe = Probe()
+        token = _current_probe.set(probe)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_probe.reset(token)
+        self._record(request, response, time.perf_counter() - started, probe)
+        return response
+
+    async def __acall__(self, request):
+        probe = Probe()
+        token = _current_probe.set(probe)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_probe.reset(token)
+        self._record(request, response, time.perf_counter() - started, probe)
+        return response
+
+    def process_template_response(self, request, response):
+        probe = _current_probe.get()
+        if probe is not None:
+            probe.render_started = time.perf_counter()
+
+            def rendered(response):
+                probe.render_seconds += time.perf_counter() - probe.render_started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def _record(self, request, response, seconds, probe):
+        match = request.resolver_match
+        route = match.route if match else "unmatched"
+        registry.observe(route, request.method, response.status_code, seconds, probe)
+        flush()
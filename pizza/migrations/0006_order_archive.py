@@ -0,0 +1,37 @@
+# Generated by Django 5.0.14 on 2026-10-18 09:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pizza', '0005_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField()),
+                ('subtotal', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('vat', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('order_number', models.CharField(editable=False, max_length=20, unique=True)),
+                ('payment_status', models.CharField(editable=False, max_length=2)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedOrderItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('quantity', models.PositiveIntegerField(default=1)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='pizza.archivedorder')),
+                ('pizza', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pizza.pizza')),
+                ('toppings', models.ManyToManyField(related_name='+', to='pizza.topping')),
+            ],
+        ),
+    ]
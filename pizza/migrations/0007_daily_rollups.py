@@ -0,0 +1,65 @@
+# Generated by Django 5.0.14 on 2026-10-18 09:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pizza', '0006_order_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyOrderStatus',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('payment_status', models.CharField(max_length=2)),
+                ('orders', models.IntegerField(default=0)),
+                ('total_cents', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyPizzaSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('orders', models.IntegerField(default=0)),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue_cents', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyToppingSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue_cents', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyorderstatus',
+            constraint=models.UniqueConstraint(fields=('day', 'payment_status'), name='daily_order_status_day_status'),
+        ),
+        migrations.AddField(
+            model_name='dailypizzasales',
+            name='pizza',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pizza.pizza'),
+        ),
+        migrations.AddField(
+            model_name='dailytoppingsales',
+            name='topping',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='pizza.topping'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailypizzasales',
+            constraint=models.UniqueConstraint(fields=('day', 'pizza'), name='daily_pizza_sales_day_pizza'),
+        ),
+        migrations.AddConstraint(
+            model_name='dailytoppingsales',
+            constraint=models.UniqueConstraint(fields=('day', 'topping'), name='daily_topping_sales_day_topping'),
+        ),
+    ]
@@ -0,0 +1,77 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def split_catalog(apps, schema_editor):
+    CatalogTopping = apps.get_model("pizza", "CatalogTopping")
+    Topping = apps.get_model("pizza", "Topping")
+    catalog = {}
+    for topping in Topping.objects.order_by("id"):
+        # Names that differ only in case are the same topping; the first
+        # row seen decides its spelling and category.
+        key = topping.name.strip().lower()
+        if key not in catalog:
+            catalog[key] = CatalogTopping.objects.create(name=topping.name.strip(), category=topping.category)
+        topping.catalog_topping = catalog[key]
+        topping.save(update_fields=["catalog_topping"])
+
+
+def join_catalog(apps, schema_editor):
+    Topping = apps.get_model("pizza", "Topping")
+    for topping in Topping.objects.select_related("catalog_topping"):
+        topping.name = topping.catalog_topping.name
+        topping.category = topping.catalog_topping.category
+        topping.save(update_fields=["name", "category"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pizza', '0007_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogTopping',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('category', models.CharField(choices=[('basic', 'Basic'), ('deluxe', 'Deluxe')], max_length=20)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='topping',
+            name='catalog_topping',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='pizza.catalogtopping'),
+        ),
+        # Nullable first so that unapplying can add the columns back before
+        # join_catalog fills them.
+        migrations.AlterField(
+            model_name='topping',
+            name='name',
+            field=models.CharField(max_length=50, null=True),
+        ),
+        migrations.AlterField(
+            model_name='topping',
+            name='category',
+            field=models.CharField(choices=[('basic', 'Basic'), ('deluxe', 'Deluxe')], max_length=20, null=True),
+        ),
+        migrations.RunPython(split_catalog, join_catalog),
+        migrations.RemoveField(
+            model_name='topping',
+            name='category',
+        ),
+        migrations.RemoveField(
+            model_name='topping',
+            name='name',
+        ),
+        migrations.AlterField(
+            model_name='topping',
+            name='catalog_topping',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='prices', to='pizza.catalogtopping'),
+        ),
+        migrations.AddConstraint(
+            model_name='topping',
+            constraint=models.UniqueConstraint(fields=('pizza', 'catalog_topping'), name='topping_pizza_catalog_topping'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.14 on 2026-10-18 09:13
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pizza', '0008_catalog'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='archivedorder',
+            index=models.Index(fields=['created_at'], name='archived_order_created_at'),
+        ),
+        migrations.AddIndex(
+            model_name='catalogtopping',
+            index=models.Index(django.db.models.functions.text.Lower('category'), name='catalog_topping_category_lower'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='order_created_at'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['payment_status', 'created_at'], name='order_status_created_at'),
+        ),
+        migrations.AddIndex(
+            model_name='pizza',
+            index=models.Index(django.db.models.functions.text.Lower('name'), name='pizza_name_lower'),
+        ),
+    ]
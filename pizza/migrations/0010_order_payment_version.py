@@ -0,0 +1,50 @@
+# Generated by Django 5.0.14 on 2026-10-18 09:15
+
+from django.db import migrations, models
+
+# Statuses written before payment statuses became two-character codes.
+LEGACY_STATUSES = {"pending": "99", "completed": "00"}
+
+
+def convert_legacy_statuses(apps, schema_editor):
+    for name in ("Order", "ArchivedOrder"):
+        model = apps.get_model("pizza", name)
+        for status in model.objects.exclude(payment_status__in=["99", "00"]).values_list(
+            "payment_status", flat=True
+        ).distinct():
+            code = LEGACY_STATUSES.get(status.strip().lower())
+            if code is not None:
+                model.objects.filter(payment_status=status).update(payment_status=code)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pizza', '0009_indexes'),
+    ]
+
+    operations = [
+        # The codes were already in use alongside the legacy strings, so
+        # unapplying leaves them as they are.
+        migrations.RunPython(convert_legacy_statuses, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='archivedorder',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AlterField(
+            model_name='archivedorder',
+            name='payment_status',
+            field=models.CharField(choices=[('99', 'Unpaid'), ('00', 'Paid')], editable=False, max_length=2),
+        ),
+        migrations.AlterField(
+            model_name='order',
+            name='payment_status',
+            field=models.CharField(choices=[('99', 'Unpaid'), ('00', 'Paid')], default='99', editable=False, max_length=2),
+        ),
+    ]
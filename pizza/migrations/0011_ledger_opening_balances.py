@@ -0,0 +1,38 @@
+# Generated by Django 5.0.14 on 2026-10-18 09:27
+
+from django.db import migrations, models
+
+
+def open_balances(apps, schema_editor):
+    # Accounts not compacted yet counted account_balance as their opening
+    # balance; it becomes a credit entry so the ledger alone holds balances.
+    Account = apps.get_model("pizza", "Account")
+    LedgerEntry = apps.get_model("pizza", "LedgerEntry")
+    LedgerEntry.objects.bulk_create([
+        LedgerEntry(account_id=account_id, amount_cents=int(balance * 100))
+        for account_id, balance in Account.objects.filter(
+            balance_snapshots__isnull=True
+        ).exclude(account_balance=0).values_list("id", "account_balance")
+    ])
+
+
+def close_balances(apps, schema_editor):
+    # The opening entries stay; the old code adds them to a zero base.
+    Account = apps.get_model("pizza", "Account")
+    Account.objects.filter(balance_snapshots__isnull=True).update(account_balance=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pizza', '0010_order_payment_version'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='account',
+            name='account_balance',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=50),
+        ),
+        migrations.RunPython(open_balances, close_balances),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.14 on 2026-10-18 09:32
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pizza', '0011_ledger_opening_balances'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='catalogtopping',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('name'), name='catalog_topping_name_lower_unique'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 09:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('pizza', '0012_catalog_topping_name_lower_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='balancesnapshot',
+            index=models.Index(fields=['last_entry_id'], name='balance_snapshot_last_entry'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.functions import Lower
 from decimal import Decimal
 
 VAT_RATE = Decimal('0.16')
@@ -12,29 +13,60 @@ class Pizza(models.Model):
 
     class Meta:
         app_label = 'pizza'
+        indexes = [models.Index(Lower('name'), name='pizza_name_lower')]
 
 
-class Topping(models.Model):
+class CatalogTopping(models.Model):
     CATEGORY_CHOICES = (
         ('basic', 'Basic'),
         ('deluxe', 'Deluxe'),
     )
+    name = models.CharField(max_length=50, unique=True)
+    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
+
+    def __str__(self):
+        return self.name
+
+    class Meta:
+        app_label = 'pizza'
+        indexes = [models.Index(Lower('category'), name='catalog_topping_category_lower')]
+        # Names that differ only in case are the same topping.
+        constraints = [models.UniqueConstraint(Lower('name'), name='catalog_topping_name_lower_unique')]
+
+
+class Topping(models.Model):
+    """
+    A catalog topping offered on one pizza size, at that size's price.
+    """
+    CATEGORY_CHOICES = CatalogTopping.CATEGORY_CHOICES
     pizza = models.ForeignKey(Pizza, on_delete=models.CASCADE, related_name='toppings')
-    name = models.CharField(max_length=50)
+    catalog_topping = models.ForeignKey(CatalogTopping, on_delete=models.CASCADE, related_name='prices')
     price = models.DecimalField(max_digits=6, decimal_places=2)
-    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES)
+
+    @property
+    def name(self):
+        return self.catalog_topping.name
+
+    @property
+    def category(self):
+        return self.catalog_topping.category
 
     def __str__(self):
         return self.name
 
     class Meta:
         app_label = 'pizza'
+        constraints = [
+            models.UniqueConstraint(fields=['pizza', 'catalog_topping'], name='topping_pizza_catalog_topping')
+        ]
 
 
 class Account(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     account_number = models.CharField(max_length=13, unique=True)
-    account_balance = models.DecimalField(max_digits=50, decimal_places=2, default=0)
+    # A copy of the ledger balance when the account was opened or last
+    # compacted. Balances change only through ledger entries; see pizza.ledger.
+    account_balance = models.DecimalField(max_digits=50, decimal_places=2, default=0, editable=False)
 
     def __str__(self):
         return f"Account {self.account_number} — Balance: {self.account_balance:.2f}"
@@ -44,13 +76,27 @@ class Account(models.Model):
 
 
 class Order(models.Model):
+    class PaymentStatus(models.TextChoices):
+        UNPAID = "99", "Unpaid"
+        PAID = "00", "Paid"
+
+    # The states each payment status may move to. Changes go through
+    # payments.transition(), a compare-and-swap on status and version.
+    TRANSITIONS = {
+        PaymentStatus.UNPAID: (PaymentStatus.PAID,),
+        PaymentStatus.PAID: (),
+    }
+
     created_at = models.DateTimeField(auto_now_add=True)
     subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     vat = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     import uuid
     order_number = models.CharField(default=uuid.uuid4, max_length=20, editable=False, unique=True)
-    payment_status = models.CharField(default="99", editable=False, max_length=2)
+    payment_status = models.CharField(
+        default=PaymentStatus.UNPAID, choices=PaymentStatus.choices, editable=False, max_length=2
+    )
+    version = models.PositiveIntegerField(default=0, editable=False)
 
 
     def __str__(self):
@@ -58,6 +104,10 @@ class Order(models.Model):
 
     class Meta:
         app_label = 'pizza'
+        indexes = [
+            models.Index(fields=['created_at'], name='order_created_at'),
+            models.Index(fields=['payment_status', 'created_at'], name='order_status_created_at'),
+        ]
 
 
 class OrderItem(models.Model):
@@ -77,3 +127,119 @@ class OrderItem(models.Model):
 
     class Meta:
         app_label = 'pizza'
+
+
+class IdempotencyRecord(models.Model):
+    key = models.CharField(max_length=64, unique=True)
+    fingerprint = models.CharField(max_length=64, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    content = models.BinaryField(default=b"")
+    content_type = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Idempotency key {self.key} ({self.status_code or 'in progress'})"
+
+    class Meta:
+        app_label = 'pizza'
+
+
+class LedgerEntry(models.Model):
+    account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='ledger_entries')
+    amount_cents = models.BigIntegerField()
+    order_number = models.CharField(max_length=20, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.account_id}: {self.amount_cents / 100:+.2f} ({self.order_number or 'adjustment'})"
+
+    class Meta:
+        app_label = 'pizza'
+        verbose_name_plural = 'ledger entries'
+
+
+class BalanceSnapshot(models.Model):
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='balance_snapshots')
+    balance_cents = models.BigIntegerField()
+    last_entry_id = models.BigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.account_id}: {self.balance_cents / 100:.2f} up to entry {self.last_entry_id}"
+
+    class Meta:
+        app_label = 'pizza'
+        indexes = [
+            models.Index(fields=['account', '-last_entry_id']),
+            models.Index(fields=['last_entry_id'], name='balance_snapshot_last_entry'),
+        ]
+
+
+class ArchivedOrder(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    created_at = models.DateTimeField()
+    subtotal = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    vat = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    total = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    order_number = models.CharField(max_length=20, editable=False, unique=True)
+    payment_status = models.CharField(editable=False, max_length=2, choices=Order.PaymentStatus.choices)
+    version = models.PositiveIntegerField(default=0, editable=False)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archived order: {self.order_number}"
+
+    class Meta:
+        app_label = 'pizza'
+        indexes = [models.Index(fields=['created_at'], name='archived_order_created_at')]
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    pizza = models.ForeignKey(Pizza, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField(default=1)
+    toppings = models.ManyToManyField(Topping, related_name='+')
+
+    def __str__(self):
+        return f"{self.quantity} x {self.pizza_id} in archived order #{self.order_id}"
+
+    class Meta:
+        app_label = 'pizza'
+
+
+class DailyPizzaSales(models.Model):
+    day = models.DateField()
+    pizza = models.ForeignKey(Pizza, on_delete=models.CASCADE, related_name='+')
+    orders = models.IntegerField(default=0)
+    quantity = models.IntegerField(default=0)
+    revenue_cents = models.BigIntegerField(default=0)
+
+    class Meta:
+        app_label = 'pizza'
+        constraints = [models.UniqueConstraint(fields=['day', 'pizza'], name='daily_pizza_sales_day_pizza')]
+
+
+class DailyToppingSales(models.Model):
+    day = models.DateField()
+    topping = models.ForeignKey(Topping, on_delete=models.CASCADE, related_name='+')
+    quantity = models.IntegerField(default=0)
+    revenue_cents = models.BigIntegerField(default=0)
+
+    class Meta:
+        app_label = 'pizza'
+        constraints = [models.UniqueConstraint(fields=['day', 'topping'], name='daily_topping_sales_day_topping')]
+
+
+class DailyOrderStatus(models.Model):
+    day = models.DateField()
+    payment_status = models.CharField(max_length=2)
+    orders = models.IntegerField(default=0)
+    total_cents = models.BigIntegerField(default=0)
+
+    class Meta:
+        app_label = 'pizza'
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'payment_status'], name='daily_order_status_day_status')
+        ]
@@ -0,0 +1,135 @@
+"""
+Snowflake-style order numbers.
+
+An id packs milliseconds since ``EPOCH_MS`` (41 bits), a worker id (10 bits)
+and a per-millisecond sequence (12 bits) into a 63-bit integer, rendered as
+``OR`` plus 13 zero-padded base-36 digits so the strings sort in creation
+order and fit ``Order.order_number``.
+
+Worker ids must be unique among processes generating ids at the same time.
+Set ``ORDER_ID_WORKER_ID`` (or the ``ORDER_ID_WORKER_ID`` environment
+variable) per process when running on several hosts; otherwise each process
+claims a free id by taking an exclusive lock on a file in
+``ORDER_ID_LOCK_DIR``, which the OS releases when the process exits.
+"""
+import os
+import string
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+EPOCH_MS = 1735689600000  # 2025-01-01T00:00:00Z
+WORKER_BITS = 10
+SEQUENCE_BITS = 12
+MAX_WORKER_ID = (1 << WORKER_BITS) - 1
+SEQUENCE_MASK = (1 << SEQUENCE_BITS) - 1
+PREFIX = "OR"
+WIDTH = 13
+
+DIGITS = string.digits + string.ascii_uppercase
+
+
+def encode(value):
+    chars = []
+    while value:
+        value, rem = divmod(value, 36)
+        chars.append(DIGITS[rem])
+    return PREFIX + "".join(reversed(chars)).rjust(WIDTH, "0")
+
+
+def decode(order_number):
+    return int(order_number[len(PREFIX):], 36)
+
+
+class OrderNumberGenerator:
+    def __init__(self, worker_id, clock=None):
+        if not 0 <= worker_id <= MAX_WORKER_ID:
+            raise ValueError(f"worker_id must be between 0 and {MAX_WORKER_ID}")
+        self.worker_id = worker_id
+        self._clock = clock or (lambda: time.time_ns() // 1_000_000)
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def next_id(self):
+        with self._lock:
+            now = max(self._clock(), self._last_ms)
+            if now == self._last_ms:
+                self._sequence = (self._sequence + 1) & SEQUENCE_MASK
+                if self._sequence == 0:
+                    # Sequence exhausted for this millisecond (or the clock
+                    # went backwards): borrow the next one instead of waiting.
+                    now += 1
+            else:
+                self._sequence = 0
+            self._last_ms = now
+            return ((now - EPOCH_MS) << (WORKER_BITS + SEQUENCE_BITS)) | (
+                self.worker_id << SEQUENCE_BITS) | self._sequence
+
+    def next_order_number(self):
+        return encode(self.next_id())
+
+
+def claim_worker_id(lock_dir=None):
+    """
+    Claim a worker id unused by any live process on this host, returning
+    ``(worker_id, fd)``. The claim lasts as long as ``fd`` stays open.
+    """
+    start = os.getpid() & MAX_WORKER_ID
+    if fcntl is None:
+        return start, None
+    lock_dir = lock_dir or os.path.join(tempfile.gettempdir(), "soko_pizza-order-ids")
+    os.makedirs(lock_dir, exist_ok=True)
+    for offset in range(MAX_WORKER_ID + 1):
+        worker_id = (start + offset) & MAX_WORKER_ID
+        fd = os.open(os.path.join(lock_dir, f"worker-{worker_id}.lock"), os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            continue
+        return worker_id, fd
+    raise RuntimeError(f"All {MAX_WORKER_ID + 1} order id worker slots are in use")
+
+
+_generator = None
+_claim_fd = None
+_generator_lock = threading.Lock()
+
+
+def get_generator():
+    global _generator, _claim_fd
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                worker_id = getattr(settings, "ORDER_ID_WORKER_ID", None)
+                if worker_id is None:
+                    worker_id = os.environ.get("ORDER_ID_WORKER_ID")
+                if worker_id is None:
+                    worker_id, _claim_fd = claim_worker_id(getattr(settings, "ORDER_ID_LOCK_DIR", None))
+                _generator = OrderNumberGenerator(int(worker_id))
+    return _generator
+
+
+def next_order_number():
+    return get_generator().next_order_number()
+
+
+def _reset_after_fork():
+    # A forked child shares the parent's claim, so it must claim its own id.
+    global _generator, _claim_fd, _generator_lock
+    if _claim_fd is not None:
+        os.close(_claim_fd)
+    _generator = _claim_fd = None
+    _generator_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
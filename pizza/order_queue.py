@@ -0,0 +1,274 @@
+"""
+Write-behind ingestion for orders.
+
+With ``ORDER_INGESTION = "queued"`` the order views price an order, append
+it to a local SQLite spool file (``ORDER_QUEUE_PATH``) and answer 202 with
+its order number straight away. A background thread in each process claims
+spooled orders in batches of up to ``ORDER_QUEUE_BATCH_SIZE`` and writes
+each batch to the main database in one transaction, so many orders share a
+single commit.
+
+Spooled orders survive a crash: the spool commits before the view
+responds, claims are leases that expire after ``ORDER_QUEUE_LEASE``
+seconds so another process picks up a dead worker's orders, and a batch
+written twice creates its orders once. On interpreter exit the queue is
+drained synchronously; ``manage.py drain_order_queue`` does the same by
+hand.
+
+A batch the database rejects is split in halves and retried until the
+orders that cannot be written, e.g. for a pizza deleted after they were
+priced, are isolated. Those move to the spool's ``failed`` table, where the
+order status view reports them, so they never hold up the orders behind
+them.
+"""
+import atexit
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DataError, IntegrityError
+
+from .orders import create_order, create_orders
+
+logger = logging.getLogger(__name__)
+
+QueuedLine = namedtuple("QueuedLine", ["pizza_id", "quantity", "topping_ids"])
+
+
+def _setting(name, default):
+    return getattr(settings, f"ORDER_QUEUE_{name}", default)
+
+
+def is_enabled():
+    return getattr(settings, "ORDER_INGESTION", "sync") == "queued"
+
+
+class Spool:
+    """
+    Orders waiting to be written, in a SQLite file shared by every process
+    on the host.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _connection(self):
+        # sqlite3 connections must not cross threads or forks.
+        pid, conn = getattr(self._local, "conn", (None, None))
+        if pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=20, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # The view answers 202 once the spool commits, so commits must
+            # survive a power loss, not only a crash of the process.
+            conn.execute("PRAGMA synchronous=FULL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending ("
+                "order_number TEXT PRIMARY KEY, payload TEXT NOT NULL, "
+                "claimed_by TEXT, claimed_until REAL NOT NULL DEFAULT 0)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS failed ("
+                "order_number TEXT PRIMARY KEY, payload TEXT NOT NULL, "
+                "error TEXT NOT NULL, failed_at REAL NOT NULL)"
+            )
+            self._local.conn = (os.getpid(), conn)
+        return conn
+
+    def put(self, order_number, payload):
+        self._connection().execute(
+            "INSERT INTO pending (order_number, payload) VALUES (?, ?)", (order_number, payload)
+        )
+
+    def claim(self, owner, limit, lease):
+        """
+        Lease up to ``limit`` unclaimed or expired orders to ``owner`` and
+        return every order ``owner`` holds as ``(order_number, payload)``.
+        """
+        conn = self._connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "UPDATE pending SET claimed_by = ?, claimed_until = ? WHERE order_number IN ("
+                "SELECT order_number FROM pending WHERE claimed_until < ? ORDER BY rowid LIMIT ?)",
+                (owner, now + lease, now, limit),
+            )
+            rows = conn.execute(
+                "SELECT order_number, payload FROM pending WHERE claimed_by = ? ORDER BY rowid LIMIT ?",
+                (owner, limit),
+            ).fetchall()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return rows
+
+    def remove(self, order_numbers):
+        self._connection().executemany(
+            "DELETE FROM pending WHERE order_number = ?", [(n,) for n in order_numbers]
+        )
+
+    def fail(self, order_number, payload, error):
+        """
+        Move an order that cannot be written from ``pending`` to ``failed``.
+        """
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO failed (order_number, payload, error, failed_at) VALUES (?, ?, ?, ?)",
+                (order_number, payload, error, time.time()),
+            )
+            conn.execute("DELETE FROM pending WHERE order_number = ?", (order_number,))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def failure(self, order_number):
+        """
+        Return why a failed order could not be written, or None.
+        """
+        row = self._connection().execute(
+            "SELECT error FROM failed WHERE order_number = ?", (order_number,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def contains(self, order_number):
+        return self._connection().execute(
+            "SELECT 1 FROM pending WHERE order_number = ?", (order_number,)
+        ).fetchone() is not None
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM pending").fetchone()[0]
+
+
+_spools = {}
+_lock = threading.Lock()
+_wake = threading.Event()
+_worker = None
+
+
+def get_spool():
+    path = str(_setting("PATH", settings.BASE_DIR / "order_queue.sqlite3"))
+    spool = _spools.get(path)
+    if spool is None:
+        with _lock:
+            spool = _spools.setdefault(path, Spool(path))
+    return spool
+
+
+def _owner():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _encode(lines, subtotal, vat, total):
+    return json.dumps({
+        "lines": [[line.pizza_id, line.quantity, list(line.topping_ids)] for line in lines],
+        "subtotal": str(subtotal),
+        "vat": str(vat),
+        "total": str(total),
+    })
+
+
+def _decode(order_number, payload):
+    data = json.loads(payload)
+    lines = [QueuedLine(*line) for line in data["lines"]]
+    return order_number, lines, Decimal(data["subtotal"]), Decimal(data["vat"]), Decimal(data["total"])
+
+
+def submit(order_number, lines, subtotal, vat, total):
+    """
+    Persist a priced order: spool it when queued ingestion is on, otherwise
+    write it straight away. Returns True when the order was spooled.
+    """
+    if not is_enabled():
+        create_order(order_number, lines, subtotal, vat, total)
+        return False
+    get_spool().put(order_number, _encode(lines, subtotal, vat, total))
+    if _setting("WORKER", True):
+        _ensure_worker()
+        _wake.set()
+    return True
+
+
+def drain(spool=None):
+    """
+    Write spooled orders to the database until the spool is empty, returning
+    the number of orders created.
+    """
+    spool = spool or get_spool()
+    owner = _owner()
+    created = 0
+    while True:
+        rows = spool.claim(owner, _setting("BATCH_SIZE", 500), _setting("LEASE", 30))
+        if not rows:
+            return created
+        created += _write(spool, rows)
+
+
+def _write(spool, rows):
+    """
+    Write claimed orders, splitting the batch until the orders the database
+    rejects are isolated and moved to the failed table.
+    """
+    try:
+        created = create_orders([_decode(*row) for row in rows])
+    except (IntegrityError, DataError, ValueError, KeyError, TypeError) as e:
+        if len(rows) > 1:
+            middle = len(rows) // 2
+            return _write(spool, rows[:middle]) + _write(spool, rows[middle:])
+        order_number, payload = rows[0]
+        logger.error("Queued order %s cannot be written: %s", order_number, e)
+        spool.fail(order_number, payload, str(e))
+        return 0
+    spool.remove([order_number for order_number, _ in rows])
+    return created
+
+
+def _run():
+    from django.db import close_old_connections
+
+    while True:
+        # Wake on the first order, then give concurrent requests a moment to
+        # join the batch. The timeout also sweeps up expired claims.
+        _wake.wait(_setting("LEASE", 30))
+        _wake.clear()
+        time.sleep(_setting("FLUSH_INTERVAL", 0.05))
+        try:
+            drain()
+        except Exception:
+            logger.exception("Writing queued orders failed; retrying")
+        finally:
+            close_old_connections()
+
+
+def _ensure_worker():
+    global _worker
+    # A forked child inherits the Thread object but not the thread.
+    if _worker is not None and _worker.is_alive():
+        return
+    with _lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name="order-queue", daemon=True)
+            _worker.start()
+
+
+def _drain_on_exit():
+    if _worker is None or not is_enabled():
+        return
+    try:
+        drain()
+    except Exception:
+        logger.exception("Queued orders left in %s at shutdown", get_spool().path)
+
+
+atexit.register(_drain_on_exit)
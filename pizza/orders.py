@@ -0,0 +1,166 @@
+from django.db import transaction
+
+from . import rollups
+from .models import Order, OrderItem
+from .pricing import PricingError
+from .retries import retry_on_lock
+
+
+class OrderRequestError(ValueError):
+    def __init__(self, message, response_object=None):
+        super().__init__(message)
+        self.response_object = response_object
+
+
+def parse_order(data, snapshot):
+    """
+    Validate a v1 single-pizza order body and price it against ``snapshot``.
+    """
+    pizza_id = data.get("pizza_id")
+    quantity = data.get("quantity")
+    topping_list = data.get("toppings", [])
+
+    if not all([pizza_id, quantity]):
+        raise OrderRequestError("Pizza ID and quantity are required", [])
+
+    try:
+        pizza_id = int(pizza_id)
+        if pizza_id not in snapshot.pizza_prices:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise OrderRequestError("Invalid pizza ID")
+
+    try:
+        quantity = int(quantity)
+        if quantity <= 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        raise OrderRequestError("Invalid quantity")
+
+    if topping_list and not isinstance(topping_list, list):
+        raise OrderRequestError("Toppings must be a list of IDs")
+
+    try:
+        return snapshot.quote(pizza_id, quantity, [int(t) for t in topping_list or []])
+    except (PricingError, ValueError, TypeError):
+        raise OrderRequestError("Invalid topping ID")
+
+
+def parse_basket(data, snapshot):
+    """
+    Validate a v2 basket body and price all of its items as one order.
+    """
+    items = data.get("items")
+    if not items or not isinstance(items, list):
+        raise OrderRequestError("Items must be a non-empty list")
+
+    basket = []
+    for position, item in enumerate(items, start=1):
+        try:
+            pizza_id = int(item["pizza_id"])
+            quantity = int(item.get("quantity", 1))
+            toppings = item.get("toppings") or []
+            if quantity <= 0 or not isinstance(toppings, list):
+                raise ValueError
+            basket.append((pizza_id, quantity, [int(t) for t in toppings]))
+        except (KeyError, AttributeError, TypeError, ValueError):
+            raise OrderRequestError(f"Invalid item {position}")
+
+    try:
+        return snapshot.quote_basket(basket)
+    except PricingError as e:
+        raise OrderRequestError(str(e))
+
+
+def order_receipt(order_number, quote):
+    return {
+        "order_id": order_number,
+        "pizza": quote.pizza_name,
+        "quantity": quote.quantity,
+        "toppings": quote.topping_names,
+        "subtotal": f"{quote.subtotal:.2f}",
+        "vat": f"{quote.vat:.2f}",
+        "grand_total": f"{quote.total:.2f}"
+    }
+
+
+def basket_receipt(order_number, quote):
+    return {
+        "order_id": order_number,
+        "items": [{
+            "pizza": line.pizza_name,
+            "quantity": line.quantity,
+            "toppings": line.topping_names,
+            "item_total": f"{line.subtotal:.2f}"
+        } for line in quote.lines],
+        "subtotal": f"{quote.subtotal:.2f}",
+        "vat": f"{quote.vat:.2f}",
+        "grand_total": f"{quote.total:.2f}"
+    }
+
+
+@retry_on_lock
+def create_order(order_number, lines, subtotal, vat, total):
+    """
+    Persist a priced order in one transaction with a fixed number of
+    queries: the order, every item and every item topping are one INSERT
+    each, however large the basket is.
+    """
+    through = OrderItem.toppings.through
+    with transaction.atomic():
+        order = Order.objects.create(  # type: ignore
+            subtotal=subtotal,
+            vat=vat,
+            total=total,
+            order_number=order_number
+        )
+        items = OrderItem.objects.bulk_create([  # type: ignore
+            OrderItem(order=order, pizza_id=line.pizza_id, quantity=line.quantity)
+            for line in lines
+        ])
+        toppings = [
+            through(orderitem_id=item.id, topping_id=topping_id)
+            for item, line in zip(items, lines)
+            for topping_id in line.topping_ids
+        ]
+        if toppings:
+            through.objects.bulk_create(toppings)
+        rollups.record_orders([(order.created_at, lines, total)])
+    return order
+
+
+@retry_on_lock
+def create_orders(orders):
+    """
+    Persist a batch of priced orders in one transaction, each model with one
+    bulk INSERT. ``orders`` holds ``(order_number, lines, subtotal, vat,
+    total)`` tuples; order numbers that already exist are skipped, so a
+    batch that is written twice creates its orders once. Returns the number
+    of orders created.
+    """
+    through = OrderItem.toppings.through
+    with transaction.atomic():
+        existing = set(Order.objects.filter(  # type: ignore
+            order_number__in=[order[0] for order in orders]
+        ).values_list("order_number", flat=True))
+        orders = [order for order in orders if order[0] not in existing]
+        created = Order.objects.bulk_create([  # type: ignore
+            Order(order_number=order_number, subtotal=subtotal, vat=vat, total=total)
+            for order_number, _, subtotal, vat, total in orders
+        ])
+        pending = [
+            (OrderItem(order=order, pizza_id=line.pizza_id, quantity=line.quantity), line)
+            for order, (_, lines, *_) in zip(created, orders) for line in lines
+        ]
+        items = OrderItem.objects.bulk_create([item for item, _ in pending])  # type: ignore
+        toppings = [
+            through(orderitem_id=item.id, topping_id=topping_id)
+            for item, (_, line) in zip(items, pending)
+            for topping_id in line.topping_ids
+        ]
+        if toppings:
+            through.objects.bulk_create(toppings)
+        rollups.record_orders([
+            (order.created_at, lines, total) for order, (_, lines, _, _, total) in zip(created, orders)
+        ])
+    return len(created)
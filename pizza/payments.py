@@ -0,0 +1,199 @@
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from . import archive, ledger, rollups
+from .models import Order
+from .pricing import from_cents, to_cents
+from .retries import Conflict, retry_on_conflict, retry_on_lock
+
+PAID = Order.PaymentStatus.PAID.value
+ORDER_FIELDS = ("id", "order_number", "payment_status", "version", "total", "created_at")
+
+
+class PaymentError(Exception):
+    pass
+
+
+class OrderConflict(PaymentError, Conflict):
+    def __init__(self):
+        super().__init__("Orders changed while settling; retry the payment")
+
+
+def transition(orders, status):
+    """
+    Move ``orders``, dicts with ``id``, ``payment_status`` and ``version``,
+    to ``status`` in one UPDATE. Each row only changes if it still has the
+    status and version it was read with, and only ``payment_status`` and
+    ``version`` are written. Raises OrderConflict if any order had changed,
+    leaving the caller's transaction to be rolled back; no row is locked.
+    Raises PaymentError for an order in a status with no transitions
+    defined.
+    """
+    matches = Q()
+    for order in orders:
+        if order["payment_status"] not in Order.TRANSITIONS:
+            raise PaymentError("Order is in an unknown payment state")
+        if status not in Order.TRANSITIONS[order["payment_status"]]:
+            raise ValueError(f"Order {order['id']} cannot move from {order['payment_status']} to {status}")
+        matches |= Q(id=order["id"], payment_status=order["payment_status"], version=order["version"])
+    updated = Order.objects.filter(matches).update(payment_status=status, version=F("version") + 1)  # type: ignore
+    if updated != len(orders):
+        raise OrderConflict()
+    for order in orders:
+        order["payment_status"] = status
+        order["version"] += 1
+
+
+def parse_payment(data):
+    """
+    Validate a payment body, returning ``(order_id, account_number, amount)``.
+    """
+    account_number = data.get("account_number")
+    amount = data.get("amount")
+    order_id = data.get("order_id")
+
+    if not all([account_number, amount, order_id]):
+        raise PaymentError("Account number, order_id and amount are required")
+    if not isinstance(order_id, str):
+        raise PaymentError("Invalid order_id")
+
+    try:
+        amount = Decimal(str(amount))
+        if amount <= 0:
+            raise ValueError
+    except (InvalidOperation, TypeError, ValueError):
+        raise PaymentError("Invalid amount")
+
+    return order_id, account_number, amount
+
+
+def _order_failure(order, amount):
+    if order is None:
+        return "Order not found"
+    if order["payment_status"] not in Order.TRANSITIONS:
+        return "Order is in an unknown payment state"
+    if order["payment_status"] == PAID:
+        return "Payment for the order already completed"
+    if order["total"] != amount:
+        return "Wrong amount submitted for payment"
+    return None
+
+
+@retry_on_lock
+@retry_on_conflict
+def settle(order_number, account_number, amount):
+    """
+    Mark an order paid and debit the account in one transaction.
+
+    The order is read and checked, then moved to paid by ``transition``, so
+    a concurrent payment of the same order makes this one conflict and rerun
+    (and report the order as paid) rather than double-settle it. The debit
+    is a ledger insert rather than an update of the account row; the balance
+    check before it is safe because the order UPDATE has already taken
+    SQLite's write lock, so no other payment can commit in between. Raises
+    PaymentError, with nothing written, when the order does not match or the
+    balance is too low.
+    """
+    with transaction.atomic():
+        order = archive.find_order(order_number, ORDER_FIELDS)
+        error = _order_failure(order, amount)
+        if error:
+            raise PaymentError(error)
+        transition([order], PAID)
+
+        account = ledger.get_balance(account_number)
+        if account is None:
+            raise PaymentError("Account not found")
+        cents = to_cents(amount)
+        if account["balance_cents"] < cents:
+            raise PaymentError("Insufficient balance")
+        ledger.debit(account["id"], cents, order_number)
+        rollups.record_payments([(order["created_at"], amount)])
+
+        return {"account_number": account_number, "account_balance": from_cents(account["balance_cents"] - cents)}
+
+
+def parse_batch_payment(data, limit=100):
+    """
+    Validate a batch payment body, returning ``(account_number, payments)``
+    where ``payments`` holds ``(order_id, amount)`` pairs and ``amount`` is
+    a PaymentError for items that failed validation.
+    """
+    account_number = data.get("account_number")
+    payments = data.get("payments")
+
+    if not account_number or not payments or not isinstance(payments, list):
+        raise PaymentError("Account number and a non-empty payments list are required")
+    if len(payments) > limit:
+        raise PaymentError(f"At most {limit} payments can be settled at once")
+
+    parsed = []
+    for item in payments:
+        if not isinstance(item, dict):
+            parsed.append((None, PaymentError("Account number, order_id and amount are required")))
+            continue
+        try:
+            order_id, _, amount = parse_payment({**item, "account_number": account_number})
+        except PaymentError as e:
+            order_id = item.get("order_id")
+            # Only string ids are echoed back or checked for duplicates.
+            order_id, amount = order_id if isinstance(order_id, str) else None, e
+        parsed.append((order_id, amount))
+    return account_number, parsed
+
+
+@retry_on_lock
+@retry_on_conflict
+def settle_batch(account_number, payments):
+    """
+    Settle several orders against one account in one transaction, returning
+    the account and a ``(order_id, amount, error)`` result per payment in
+    request order, with ``error`` None for settled orders.
+
+    All orders are read in one query and validated in Python; payments are
+    accepted in request order while the balance covers them. The accepted
+    orders are then moved to paid with one ``transition`` UPDATE and debited
+    with one ledger INSERT; if another request changed one of them in
+    between, the whole batch reruns from the read. The balance read is
+    race-free because the database profile starts transactions with BEGIN
+    IMMEDIATE, which holds SQLite's write lock from the start. Raises
+    PaymentError, with nothing written, if the account does not exist.
+    """
+    with transaction.atomic():
+        account = ledger.get_balance(account_number)
+        if account is None:
+            raise PaymentError("Account not found")
+
+        orders = archive.find_orders(
+            [order_id for order_id, amount in payments if not isinstance(amount, PaymentError)],
+            fields=ORDER_FIELDS,
+        )
+        balance = account["balance_cents"]
+        results = []
+        accepted = []
+        seen = set()
+        for order_id, amount in payments:
+            error = amount if isinstance(amount, PaymentError) else None
+            failure = None if error else _order_failure(orders.get(order_id), amount)
+            if error is not None:
+                pass
+            elif order_id in seen:
+                error = PaymentError("Order appears more than once in the batch")
+            elif failure:
+                error = PaymentError(failure)
+            elif to_cents(amount) > balance:
+                error = PaymentError("Insufficient balance")
+            else:
+                balance -= to_cents(amount)
+                accepted.append((order_id, amount))
+            seen.add(order_id)
+            results.append((order_id, amount, error))
+
+        if accepted:
+            transition([orders[order_id] for order_id, _ in accepted], PAID)
+            ledger.debit_many(account["id"], [(to_cents(amount), order_id) for order_id, amount in accepted])
+            rollups.record_payments([(orders[order_id]["created_at"], amount) for order_id, amount in accepted])
+
+        return {"account_number": account_number, "account_balance": from_cents(balance)}, results
@@ -0,0 +1,162 @@
+import threading
+from collections import namedtuple
+from decimal import ROUND_HALF_UP, Decimal
+
+from . import menu_cache
+from .models import VAT_RATE, Pizza, Topping
+
+# VAT as an integer number of basis points so quotes never touch Decimal.
+VAT_BASIS_POINTS = int(VAT_RATE * 10000)
+
+Quote = namedtuple("Quote", [
+    "pizza_id", "pizza_name", "quantity", "topping_ids", "topping_names",
+    "subtotal", "vat", "total",
+])
+
+BasketLine = namedtuple("BasketLine", [
+    "pizza_id", "pizza_name", "quantity", "topping_ids", "topping_names", "subtotal",
+])
+
+BasketQuote = namedtuple("BasketQuote", ["lines", "subtotal", "vat", "total"])
+
+
+class PricingError(ValueError):
+    pass
+
+
+def to_cents(amount):
+    return int((Decimal(amount) * 100).to_integral_value(ROUND_HALF_UP))
+
+
+def from_cents(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def vat_cents(subtotal_cents):
+    return (subtotal_cents * VAT_BASIS_POINTS + 5000) // 10000
+
+
+class MenuSnapshot:
+    """
+    Immutable, integer-cent view of the menu for one menu version.
+    """
+
+    __slots__ = ("version", "pizza_prices", "pizza_names", "topping_prices",
+                 "topping_names", "pizza_toppings")
+
+    def __init__(self, version, pizzas, toppings):
+        self.version = version
+        self.pizza_prices = {}
+        self.pizza_names = {}
+        self.topping_prices = {}
+        self.topping_names = {}
+        pizza_toppings = {}
+        for pizza_id, name, price in pizzas:
+            self.pizza_prices[pizza_id] = to_cents(price)
+            self.pizza_names[pizza_id] = name
+            pizza_toppings[pizza_id] = set()
+        for topping_id, pizza_id, name, price in toppings:
+            self.topping_prices[topping_id] = to_cents(price)
+            self.topping_names[topping_id] = name
+            pizza_toppings.setdefault(pizza_id, set()).add(topping_id)
+        self.pizza_toppings = {k: frozenset(v) for k, v in pizza_toppings.items()}
+
+    @classmethod
+    def build(cls, version):
+        pizzas = Pizza.objects.values_list("id", "name", "price")  # type: ignore
+        toppings = Topping.objects.values_list("id", "pizza_id", "catalog_topping__name", "price")  # type: ignore
+        return cls(version, list(pizzas), list(toppings))
+
+    @classmethod
+    async def abuild(cls, version):
+        pizzas = [row async for row in Pizza.objects.values_list("id", "name", "price")]  # type: ignore
+        toppings = [
+            row async for row in Topping.objects.values_list("id", "pizza_id", "catalog_topping__name", "price")  # type: ignore
+        ]  # type: ignore
+        return cls(version, pizzas, toppings)
+
+    def unit_cents(self, pizza_id, topping_ids):
+        try:
+            price = self.pizza_prices[pizza_id]
+        except KeyError:
+            raise PricingError("Invalid pizza ID")
+        allowed = self.pizza_toppings[pizza_id]
+        for topping_id in topping_ids:
+            if topping_id not in allowed:
+                raise PricingError("Invalid topping ID")
+            price += self.topping_prices[topping_id]
+        return price
+
+    def quote(self, pizza_id, quantity, topping_ids=()):
+        topping_ids = tuple(dict.fromkeys(topping_ids))
+        subtotal = quantity * self.unit_cents(pizza_id, topping_ids)
+        vat = vat_cents(subtotal)
+        return Quote(
+            pizza_id=pizza_id,
+            pizza_name=self.pizza_names[pizza_id],
+            quantity=quantity,
+            topping_ids=topping_ids,
+            topping_names=[self.topping_names[t] for t in topping_ids],
+            subtotal=from_cents(subtotal),
+            vat=from_cents(vat),
+            total=from_cents(subtotal + vat),
+        )
+
+    def quote_basket(self, items):
+        """
+        Price ``(pizza_id, quantity, topping_ids)`` items as one order, with
+        VAT applied once to the basket subtotal.
+        """
+        lines = []
+        subtotal = 0
+        for pizza_id, quantity, topping_ids in items:
+            topping_ids = tuple(dict.fromkeys(topping_ids))
+            line_cents = quantity * self.unit_cents(pizza_id, topping_ids)
+            subtotal += line_cents
+            lines.append(BasketLine(
+                pizza_id=pizza_id,
+                pizza_name=self.pizza_names[pizza_id],
+                quantity=quantity,
+                topping_ids=topping_ids,
+                topping_names=[self.topping_names[t] for t in topping_ids],
+                subtotal=from_cents(line_cents),
+            ))
+        vat = vat_cents(subtotal)
+        return BasketQuote(lines, from_cents(subtotal), from_cents(vat), from_cents(subtotal + vat))
+
+
+_snapshot = None
+_lock = threading.Lock()
+
+
+def get_snapshot():
+    """
+    Return the snapshot for the current menu version, rebuilding it when the
+    menu has changed. Readers always see either the old or the new snapshot.
+    """
+    global _snapshot
+    version = menu_cache.current_version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        with _lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot.version != version:
+                snapshot = _snapshot = MenuSnapshot.build(version)
+    return snapshot
+
+
+async def aget_snapshot():
+    """
+    Async counterpart of ``get_snapshot``. Concurrent rebuilds are harmless:
+    each produces the same snapshot and the last one to finish is kept.
+    """
+    global _snapshot
+    version = await menu_cache.acurrent_version()
+    snapshot = _snapshot
+    if snapshot is None or snapshot.version != version:
+        snapshot = _snapshot = await MenuSnapshot.abuild(version)
+    return snapshot
+
+
+def quote(pizza_id, quantity, topping_ids=()):
+    return get_snapshot().quote(pizza_id, quantity, topping_ids)
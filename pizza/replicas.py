@@ -0,0 +1,41 @@
+"""
+Local read replicas: SQLite copies of the primary refreshed with the online
+backup API (``manage.py sync_replicas``).
+
+A backup reads a consistent snapshot of the primary without blocking its
+writers, and replaces the replica's pages in one transaction, so replica
+readers see either the old copy or the new one. After each sync the menu
+cache is invalidated. A menu rebuilt from the replica before the sync
+caught up with a menu change therefore lives at most one sync interval.
+That only reaches the web workers through a shared menu cache, so the
+``pizza.E001`` system check refuses replicas with a per-process one.
+"""
+import sqlite3
+import time
+from contextlib import closing
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from . import menu_cache, routers
+
+
+def backup(source_path, target_path):
+    with closing(sqlite3.connect(str(source_path), timeout=20)) as source, \
+            closing(sqlite3.connect(str(target_path), timeout=20)) as target:
+        source.backup(target)
+
+
+def sync(alias, source=DEFAULT_DB_ALIAS):
+    backup(settings.DATABASES[source]["NAME"], settings.DATABASES[alias]["NAME"])
+
+
+def sync_all():
+    """
+    Refresh every replica, returning the seconds it took.
+    """
+    started = time.perf_counter()
+    for alias in routers.replicas():
+        sync(alias)
+    menu_cache.invalidate()
+    return time.perf_counter() - started
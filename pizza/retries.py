@@ -0,0 +1,59 @@
+import functools
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+LOCK_MESSAGES = ("database is locked", "database table is locked")
+
+
+def is_lock_error(exc):
+    return isinstance(exc, OperationalError) and any(message in str(exc) for message in LOCK_MESSAGES)
+
+
+def retry_on_lock(func):
+    """
+    Retry a transactional write that failed because SQLite was locked.
+
+    Runs ``func`` up to ``DATABASE_LOCK_RETRIES`` more times with jittered
+    exponential backoff. Calls made inside an outer ``atomic()`` block are
+    not retried, since the outer transaction is already aborted.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = 0 if connection.in_atomic_block else getattr(settings, "DATABASE_LOCK_RETRIES", 3)
+        delay = getattr(settings, "DATABASE_LOCK_BACKOFF", 0.05)
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as exc:
+                if attempt == retries or not is_lock_error(exc):
+                    raise
+            time.sleep(delay * 2 ** attempt * random.uniform(0.5, 1.5))
+    return wrapper
+
+
+class Conflict(Exception):
+    """
+    A compare-and-swap write found its row changed since it was read.
+    """
+
+
+def retry_on_conflict(func):
+    """
+    Rerun a transactional write that raised Conflict, up to
+    ``DATABASE_CONFLICT_RETRIES`` more times. There is no backoff: the rerun
+    reads the rows again and usually settles or fails validation at once.
+    Calls made inside an outer ``atomic()`` block are not retried.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = 0 if connection.in_atomic_block else getattr(settings, "DATABASE_CONFLICT_RETRIES", 2)
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except Conflict:
+                if attempt == retries:
+                    raise
+    return wrapper
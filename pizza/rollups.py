@@ -0,0 +1,198 @@
+"""
+Daily sales rollups.
+
+``DailyPizzaSales``, ``DailyToppingSales`` and ``DailyOrderStatus`` hold
+per-day totals keyed by the day an order was created. They are kept up to
+date in the same transaction as the write they summarise: creating orders
+adds to them, settling a payment moves the order from the unpaid to the
+paid status row. Each update is one ``INSERT ... ON CONFLICT DO UPDATE``
+per table however many rows it touches. ``rebuild()`` (``manage.py
+rebuild_rollups``) recomputes everything from the hot and archived orders.
+
+Order items do not record prices, so pizza and topping revenue is taken
+from the menu at the time an order is recorded, and from the current menu
+on a rebuild.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, DailyOrderStatus, DailyPizzaSales, DailyToppingSales, Order,
+    OrderItem, Pizza, Topping,
+)
+from .pricing import from_cents, get_snapshot, to_cents
+
+UNPAID = Order.PaymentStatus.UNPAID.value
+PAID = Order.PaymentStatus.PAID.value
+
+
+def _increment(model, keys, counters, rows):
+    """
+    Add ``rows`` (``{key tuple: counter tuple}``) to ``model``'s counters,
+    creating missing rows, in one statement.
+    """
+    if not rows:
+        return
+    opts = model._meta
+    qn = connection.ops.quote_name
+    table = qn(opts.db_table)
+    key_columns = [qn(opts.get_field(name).column) for name in keys]
+    counter_columns = [qn(opts.get_field(name).column) for name in counters]
+    row_sql = "(" + ", ".join(["%s"] * (len(keys) + len(counters))) + ")"
+    sql = (
+        f"INSERT INTO {table} ({', '.join(key_columns + counter_columns)}) "
+        f"VALUES {', '.join([row_sql] * len(rows))} "
+        f"ON CONFLICT ({', '.join(key_columns)}) DO UPDATE SET "
+        + ", ".join(f"{column} = {table}.{column} + excluded.{column}" for column in counter_columns)
+    )
+    params = []
+    for key, values in rows.items():
+        params += [connection.ops.adapt_datefield_value(key[0]), *key[1:], *values]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def _day(created_at):
+    return timezone.localdate(created_at)
+
+
+def record_orders(orders):
+    """
+    Add new unpaid orders, given as ``(created_at, lines, total)``, to the
+    rollups. Lines need ``pizza_id``, ``quantity`` and ``topping_ids``.
+    """
+    snapshot = get_snapshot()
+    pizzas = defaultdict(lambda: [0, 0, 0])
+    toppings = defaultdict(lambda: [0, 0])
+    statuses = defaultdict(lambda: [0, 0])
+    for created_at, lines, total in orders:
+        day = _day(created_at)
+        for pizza_id in {line.pizza_id for line in lines}:
+            pizzas[day, pizza_id][0] += 1
+        for line in lines:
+            row = pizzas[day, line.pizza_id]
+            row[1] += line.quantity
+            row[2] += line.quantity * snapshot.pizza_prices.get(line.pizza_id, 0)
+            for topping_id in line.topping_ids:
+                cents = line.quantity * snapshot.topping_prices.get(topping_id, 0)
+                row[2] += cents
+                toppings[day, topping_id][0] += line.quantity
+                toppings[day, topping_id][1] += cents
+        statuses[day, UNPAID][0] += 1
+        statuses[day, UNPAID][1] += to_cents(total)
+    _increment(DailyPizzaSales, ("day", "pizza"), ("orders", "quantity", "revenue_cents"), pizzas)
+    _increment(DailyToppingSales, ("day", "topping"), ("quantity", "revenue_cents"), toppings)
+    _increment(DailyOrderStatus, ("day", "payment_status"), ("orders", "total_cents"), statuses)
+
+
+def record_payments(orders):
+    """
+    Move settled orders, given as ``(created_at, total)``, from the unpaid
+    to the paid status rollup.
+    """
+    statuses = defaultdict(lambda: [0, 0])
+    for created_at, total in orders:
+        day = _day(created_at)
+        cents = to_cents(total)
+        statuses[day, UNPAID][0] -= 1
+        statuses[day, UNPAID][1] -= cents
+        statuses[day, PAID][0] += 1
+        statuses[day, PAID][1] += cents
+    _increment(DailyOrderStatus, ("day", "payment_status"), ("orders", "total_cents"), statuses)
+
+
+def rebuild():
+    """
+    Recompute every rollup from the hot and archived orders.
+    """
+    pizza_prices = {pk: to_cents(price) for pk, price in Pizza.objects.values_list("id", "price")}  # type: ignore
+    toppings = {
+        pk: (pizza_id, to_cents(price))
+        for pk, pizza_id, price in Topping.objects.values_list("id", "pizza_id", "price")  # type: ignore
+    }
+    pizza_rows = defaultdict(lambda: [0, 0, 0])
+    topping_rows = defaultdict(lambda: [0, 0])
+    status_rows = defaultdict(lambda: [0, 0])
+
+    with transaction.atomic():
+        for order_model, item_model in ((Order, OrderItem), (ArchivedOrder, ArchivedOrderItem)):
+            for row in order_model.objects.annotate(day=TruncDate("created_at")).values(  # type: ignore
+                "day", "payment_status"
+            ).annotate(count=Count("id"), total=Sum("total")):
+                counters = status_rows[row["day"], row["payment_status"]]
+                counters[0] += row["count"]
+                counters[1] += to_cents(row["total"])
+
+            for row in item_model.objects.annotate(day=TruncDate("order__created_at")).values(  # type: ignore
+                "day", "pizza_id"
+            ).annotate(orders=Count("order", distinct=True), quantity=Sum("quantity")):
+                counters = pizza_rows[row["day"], row["pizza_id"]]
+                counters[0] += row["orders"]
+                counters[1] += row["quantity"]
+                counters[2] += row["quantity"] * pizza_prices.get(row["pizza_id"], 0)
+
+            through = item_model.toppings.through
+            item_field = item_model._meta.model_name
+            for row in through.objects.annotate(day=TruncDate(f"{item_field}__order__created_at")).values(
+                "day", "topping_id"
+            ).annotate(quantity=Sum(f"{item_field}__quantity")):
+                pizza_id, price = toppings[row["topping_id"]]
+                cents = row["quantity"] * price
+                topping_rows[row["day"], row["topping_id"]][0] += row["quantity"]
+                topping_rows[row["day"], row["topping_id"]][1] += cents
+                pizza_rows[row["day"], pizza_id][2] += cents
+
+        DailyPizzaSales.objects.all().delete()  # type: ignore
+        DailyToppingSales.objects.all().delete()  # type: ignore
+        DailyOrderStatus.objects.all().delete()  # type: ignore
+        DailyPizzaSales.objects.bulk_create([  # type: ignore
+            DailyPizzaSales(day=day, pizza_id=pizza_id, orders=orders, quantity=quantity, revenue_cents=cents)
+            for (day, pizza_id), (orders, quantity, cents) in pizza_rows.items()
+        ], batch_size=500)
+        DailyToppingSales.objects.bulk_create([  # type: ignore
+            DailyToppingSales(day=day, topping_id=topping_id, quantity=quantity, revenue_cents=cents)
+            for (day, topping_id), (quantity, cents) in topping_rows.items()
+        ], batch_size=500)
+        DailyOrderStatus.objects.bulk_create([  # type: ignore
+            DailyOrderStatus(day=day, payment_status=status, orders=orders, total_cents=cents)
+            for (day, status), (orders, cents) in status_rows.items()
+        ], batch_size=500)
+    return len(pizza_rows) + len(topping_rows) + len(status_rows)
+
+
+def report(start, end):
+    """
+    Sales between the ``start`` and ``end`` days inclusive, read from the
+    rollups only.
+    """
+    days = defaultdict(dict)
+    for row in DailyOrderStatus.objects.filter(day__range=(start, end)).order_by("day", "payment_status"):  # type: ignore
+        days[row.day][row.payment_status] = {"orders": row.orders, "total": f"{from_cents(row.total_cents):.2f}"}
+    pizzas = DailyPizzaSales.objects.filter(day__range=(start, end)).values(  # type: ignore
+        "pizza_id", "pizza__name"
+    ).annotate(orders=Sum("orders"), quantity=Sum("quantity"), revenue=Sum("revenue_cents")).order_by("-revenue")
+    toppings = DailyToppingSales.objects.filter(day__range=(start, end)).values(  # type: ignore
+        "topping_id", "topping__catalog_topping__name"
+    ).annotate(quantity=Sum("quantity"), revenue=Sum("revenue_cents")).order_by("-revenue")
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "days": [{"date": day.isoformat(), "statuses": statuses} for day, statuses in sorted(days.items())],
+        "pizzas": [{
+            "pizza_id": row["pizza_id"],
+            "pizza": row["pizza__name"],
+            "orders": row["orders"],
+            "quantity": row["quantity"],
+            "revenue": f"{from_cents(row['revenue']):.2f}"
+        } for row in pizzas],
+        "toppings": [{
+            "topping_id": row["topping_id"],
+            "topping": row["topping__catalog_topping__name"],
+            "quantity": row["quantity"],
+            "revenue": f"{from_cents(row['revenue']):.2f}"
+        } for row in toppings],
+    }
@@ -0,0 +1,109 @@
+"""
+Read/write splitting across the primary database and read replicas.
+
+``ReplicaRouter`` sends writes to ``default``. It sends reads of the models
+in ``DATABASE_REPLICA_MODELS`` (the menu) to a random alias from
+``DATABASE_REPLICAS``, as well as every read made by the URL names in
+``DATABASE_REPLICA_VIEWS``. Reads inside a transaction stay on the primary,
+and reads through a related manager go to the database its instance came
+from. Views that read lazily, after the response is returned, ask the
+router for their alias up front and pin their querysets to it.
+
+``ReplicaRoutingMiddleware`` gives read-your-writes. Every request with a
+method that may write runs against the primary, and a successful one sets a
+cookie. While that cookie lasts, ``DATABASE_REPLICA_STICKY_SECONDS``, which
+should exceed the replica sync interval, the client's reads also go to the
+primary. With no replicas configured, everything goes to ``default``.
+"""
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+PRIMARY = "primary"
+REPLICA = "replica"
+STICKY_COOKIE = "db_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_routing = ContextVar("db_routing", default=None)
+
+
+def replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if not aliases or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        instance = hints.get("instance")
+        if instance is not None:
+            # Related rows, e.g. an order item's toppings, come from the
+            # database the instance was read from, never a lagging replica.
+            return instance._state.db
+        routing = _routing.get()
+        if routing == PRIMARY:
+            return DEFAULT_DB_ALIAS
+        if routing == REPLICA or model._meta.label in getattr(settings, "DATABASE_REPLICA_MODELS", ()):
+            return random.choice(aliases)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema with the data they are copied from.
+        return False if db in replicas() else None
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _start(self, request):
+        pinned = request.method not in SAFE_METHODS or STICKY_COOKIE in request.COOKIES
+        return _routing.set(PRIMARY if pinned else None)
+
+    def _finish(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400 and replicas():
+            response.set_cookie(
+                STICKY_COOKIE, "1", max_age=getattr(settings, "DATABASE_REPLICA_STICKY_SECONDS", 10),
+                httponly=True, samesite="Lax",
+            )
+        return response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self._finish(request, response)
+
+    async def __acall__(self, request):
+        token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        return self._finish(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if _routing.get() is None and match and match.url_name in getattr(settings, "DATABASE_REPLICA_VIEWS", ()):
+            _routing.set(REPLICA)
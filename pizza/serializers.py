@@ -1,3 +1,5 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 from . models import Pizza, Topping, Account
 
@@ -8,6 +10,8 @@ class PizzaSerializer(serializers.ModelSerializer):
 
 
 class ToppingSerializer(serializers.ModelSerializer):
+    name = serializers.CharField(source='catalog_topping.name', read_only=True)
+
     class Meta:
         model = Topping
         fields = ['id', 'name', 'price']
@@ -18,3 +22,39 @@ class AccountSerializer(serializers.ModelSerializer):
         model = Account
         fields = ['account_number', 'account_balance']
 
+
+
+# Fast paths for the hot endpoints: read columns straight from the database
+# instead of building model instances and walking serializer fields. Each
+# produces exactly what the ModelSerializer above would for the same rows.
+
+def _decimal(value, places=2):
+    return f"{value.quantize(Decimal(1).scaleb(-places)):f}"
+
+
+MENU_ROW_FIELDS = ("id", "name", "price")
+TOPPING_ROW_FIELDS = ("id", "catalog_topping__name", "price")
+
+
+def menu_rows(rows):
+    """
+    PizzaSerializer/ToppingSerializer output for ``values_list(*MENU_ROW_FIELDS)``
+    (or ``TOPPING_ROW_FIELDS``) rows.
+    """
+    return [{"id": pk, "name": name, "price": _decimal(price)} for pk, name, price in rows]
+
+
+def account_row(account):
+    return {
+        "account_number": account["account_number"],
+        "account_balance": _decimal(account["account_balance"]),
+    }
+
+
+def envelope(response_object, message="Success", successful=True):
+    return {
+        "statusCode": "00" if successful else "99",
+        "statusMessage": message,
+        "successful": successful,
+        "responseObject": response_object
+    }
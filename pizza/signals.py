@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import menu_cache
+from .models import CatalogTopping, Pizza, Topping
+
+
+@receiver([post_save, post_delete], sender=Pizza)
+@receiver([post_save, post_delete], sender=Topping)
+@receiver([post_save, post_delete], sender=CatalogTopping)
+def invalidate_menu(sender, **kwargs):
+    # Bump only once the change is visible, otherwise a concurrent reader
+    # could cache the old rows under the new version.
+    transaction.on_commit(menu_cache.invalidate, using=kwargs.get("using"))
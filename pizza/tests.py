@@ -1,3 +1,1397 @@
-from django.test import TestCase
+import csv
+import importlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import closing
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.conf import settings
+from django.core.cache import cache
+from datetime import timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.urls import resolve
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from . import admin, archive, benchmarks, catalog, checks, exports, idempotency, ledger, metrics, order_ids, order_queue, orders, pricing, replicas, retries, rollups, routers, throttling
+from .backends.sqlite_cache import SQLiteCache
+from .models import (
+    Account, ArchivedOrder, ArchivedOrderItem, BalanceSnapshot, CatalogTopping, DailyOrderStatus, DailyPizzaSales,
+    DailyToppingSales, LedgerEntry, Order, OrderItem, Pizza, Topping, VAT_RATE,
+)
+from .payments import OrderConflict, PaymentError, settle, transition
+from .pricing import from_cents
+from .renderers import FastJSONRenderer
+from .serializers import TOPPING_ROW_FIELDS, ToppingSerializer, envelope, menu_rows
+
+
+class MenuTestCase(TestCase):
+    def setUp(self):
+        # Menu snapshots are keyed by the cached menu version, which the
+        # rolled-back test transactions never get to bump.
+        cache.clear()
+        self.small = Pizza.objects.create(name="small", price="10.00")  # type: ignore
+        self.large = Pizza.objects.create(name="large", price="20.00")  # type: ignore
+        self.cheese = Topping.objects.create(  # type: ignore
+            pizza=self.small, price="1.50",
+            catalog_topping=CatalogTopping.objects.create(name="cheese", category="basic"),  # type: ignore
+        )
+        self.olives = Topping.objects.create(  # type: ignore
+            pizza=self.large, price="2.25",
+            catalog_topping=CatalogTopping.objects.create(name="olives", category="deluxe"),  # type: ignore
+        )
+
+
+class OrderBasketTests(MenuTestCase):
+    def post_basket(self, items):
+        return self.client.post("/api/v2/order/", {"items": items}, content_type="application/json")
+
+    def assert_basket_queries(self, items):
+        pricing.get_snapshot()
+        # One INSERT each for the order, its items and their toppings, one
+        # upsert per rollup table, plus the savepoint the test transaction
+        # wraps the atomic block in.
+        with self.assertNumQueries(8):
+            return self.post_basket(items)
+
+    def test_single_item_basket(self):
+        item = {"pizza_id": self.small.id, "quantity": 2, "toppings": [self.cheese.id]}
+        response = self.assert_basket_queries([item])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["responseObject"]["grand_total"], "26.68")
+
+    def test_query_count_does_not_grow_with_basket(self):
+        item = {"pizza_id": self.small.id, "quantity": 2, "toppings": [self.cheese.id]}
+        response = self.assert_basket_queries([item] * 25)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data["responseObject"]["subtotal"], "575.00")
+        self.assertEqual(response.data["responseObject"]["grand_total"], "667.00")
+        self.assertEqual(OrderItem.toppings.through.objects.count(), 25)  # type: ignore
+
+    def test_topping_must_belong_to_pizza(self):
+        response = self.post_basket([
+            {"pizza_id": self.small.id, "quantity": 1},
+            {"pizza_id": self.large.id, "quantity": 1, "toppings": [self.cheese.id]},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())  # type: ignore
+        self.assertFalse(OrderItem.objects.exists())  # type: ignore
+
+
+def _claimed_order_numbers(lock_dir, count):
+    worker_id, _ = order_ids.claim_worker_id(lock_dir)
+    generator = order_ids.OrderNumberGenerator(worker_id)
+    return [generator.next_order_number() for _ in range(count)]
+
+
+class OrderNumberTests(SimpleTestCase):
+    def test_fits_order_number_field(self):
+        number = order_ids.OrderNumberGenerator(order_ids.MAX_WORKER_ID).next_order_number()
+        self.assertLessEqual(len(number), Order._meta.get_field("order_number").max_length)
+        self.assertTrue(number.startswith("OR"))
+
+    def test_unique_and_monotonic_across_threads(self):
+        generator = order_ids.OrderNumberGenerator(1)
+        per_thread = [[] for _ in range(8)]
+        start = threading.Barrier(len(per_thread))
+
+        def generate(out):
+            start.wait()
+            for _ in range(20000):
+                out.append(generator.next_order_number())
+
+        threads = [threading.Thread(target=generate, args=(out,)) for out in per_thread]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        numbers = [n for out in per_thread for n in out]
+        self.assertEqual(len(set(numbers)), len(numbers))
+        for out in per_thread:
+            self.assertEqual(out, sorted(out))
+
+    def test_unique_across_processes(self):
+        context = multiprocessing.get_context("fork")
+        with tempfile.TemporaryDirectory() as lock_dir, context.Pool(4) as pool:
+            batches = pool.starmap(_claimed_order_numbers, [(lock_dir, 20000)] * 8)
+        numbers = [n for batch in batches for n in batch]
+        self.assertEqual(len(set(numbers)), len(numbers))
+
+    def test_monotonic_when_clock_goes_backwards(self):
+        ticks = iter([order_ids.EPOCH_MS + 500, order_ids.EPOCH_MS + 100, order_ids.EPOCH_MS + 100])
+        generator = order_ids.OrderNumberGenerator(3, clock=lambda: next(ticks))
+        first, second, third = (generator.next_id() for _ in range(3))
+        self.assertLess(first, second)
+        self.assertLess(second, third)
+
+    def test_sequence_overflow_borrows_next_millisecond(self):
+        generator = order_ids.OrderNumberGenerator(0, clock=lambda: order_ids.EPOCH_MS)
+        ids = [generator.next_id() for _ in range(order_ids.SEQUENCE_MASK + 2)]
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(ids, sorted(ids))
+
+
+class PricingTests(MenuTestCase):
+    def test_snapshot_is_rebuilt_when_the_menu_version_changes(self):
+        snapshot = pricing.get_snapshot()
+        self.assertIs(pricing.get_snapshot(), snapshot)
+        with self.captureOnCommitCallbacks(execute=True):
+            # A queryset update sends no signal, so the version stays put.
+            Pizza.objects.filter(id=self.small.id).update(price="12.00")  # type: ignore
+        self.assertIs(pricing.get_snapshot(), snapshot)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.small.price = "12.00"
+            self.small.save()
+        rebuilt = pricing.get_snapshot()
+        self.assertNotEqual(rebuilt.version, snapshot.version)
+        self.assertEqual(rebuilt.pizza_prices[self.small.id], 1200)
+        self.assertEqual(snapshot.pizza_prices[self.small.id], 1000)
+
+    def test_totals_are_integer_cents_with_vat(self):
+        Pizza.objects.filter(id=self.small.id).update(price="0.05")  # type: ignore
+        Topping.objects.filter(id=self.cheese.id).update(price="0.01")  # type: ignore
+        snapshot = pricing.MenuSnapshot.build(0)
+        self.assertEqual((snapshot.pizza_prices[self.small.id], snapshot.topping_prices[self.cheese.id]), (5, 1))
+
+        quote = snapshot.quote(self.small.id, 3, [self.cheese.id, self.cheese.id])
+        self.assertEqual((quote.subtotal, quote.topping_ids), (Decimal("0.18"), (self.cheese.id,)))
+        # 18 cents at 16% VAT is 2.88 cents, rounded half up to 3.
+        self.assertEqual(quote.vat, (quote.subtotal * VAT_RATE).quantize(Decimal("0.01"), ROUND_HALF_UP))
+        self.assertEqual((quote.vat, quote.total), (Decimal("0.03"), Decimal("0.21")))
+        self.assertEqual(pricing.vat_cents(1000), 160)
+        self.assertEqual(pricing.vat_cents(3), 0)
+        self.assertEqual(pricing.vat_cents(4), 1)
+
+        basket = snapshot.quote_basket([(self.small.id, 1, [self.cheese.id]), (self.small.id, 2, [])])
+        self.assertEqual((basket.subtotal, basket.vat, basket.total), (Decimal("0.16"), Decimal("0.03"), Decimal("0.19")))
+
+    def test_toppings_from_another_pizza_are_rejected(self):
+        snapshot = pricing.get_snapshot()
+        with self.assertRaisesMessage(pricing.PricingError, "Invalid topping ID"):
+            snapshot.quote(self.small.id, 1, [self.olives.id])
+        with self.assertRaisesMessage(pricing.PricingError, "Invalid topping ID"):
+            snapshot.quote_basket([(self.large.id, 1, [self.olives.id]), (self.small.id, 1, [self.olives.id])])
+        with self.assertRaisesMessage(pricing.PricingError, "Invalid pizza ID"):
+            snapshot.quote(self.large.id + 100, 1)
+        response = self.client.post(
+            "/api/v1/order/", {"pizza_id": self.small.id, "quantity": 1, "toppings": [self.olives.id]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())  # type: ignore
+
+
+class MenuCacheTests(MenuTestCase):
+    def test_matching_etag_gets_an_empty_304(self):
+        for path in ("/api/v1/pizzas/", "/api/v1/toppings/?size=small", "/api/v1/async/pizzas/"):
+            first = self.client.get(path)
+            self.assertEqual(first.status_code, 200)
+            response = self.client.get(path, HTTP_IF_NONE_MATCH=first["ETag"])
+            self.assertEqual((response.status_code, response.content), (304, b""))
+            self.assertEqual(response["ETag"], first["ETag"])
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_menu_changes_invalidate_cached_listings(self):
+        def change_small_price():
+            self.small.price = "11.00"
+            self.small.save()
+
+        def change_cheese_price():
+            self.cheese.price = "1.75"
+            self.cheese.save()
+
+        changes = [
+            ("/api/v1/pizzas/", change_small_price, "11.00"),
+            ("/api/v1/toppings/", change_cheese_price, "1.75"),
+            ("/api/v1/toppings/", lambda: self.olives.delete(), "olives"),
+            ("/api/v1/pizzas/", lambda: Pizza.objects.create(name="medium", price="15.00"), "medium"),  # type: ignore
+            ("/api/v1/pizzas/", lambda: self.large.delete(), "large"),
+        ]
+        for path, change, marker in changes:
+            before = self.client.get(path)
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            after = self.client.get(path)
+            self.assertNotEqual(after["ETag"], before["ETag"])
+            self.assertNotEqual(marker in after.content.decode(), marker in before.content.decode())
+            self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=before["ETag"]).status_code, 200)
+
+
+class OrderViewTests(MenuTestCase):
+    def test_orders_in_the_same_second_do_not_collide(self):
+        body = {"pizza_id": self.small.id, "quantity": 1}
+        for _ in range(5):
+            response = self.client.post("/api/v1/order/", body, content_type="application/json")
+            self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 5)  # type: ignore
+
+
+class PaymentTests(TestCase):
+    def setUp(self):
+        self.account = ledger.open_account("0100172111111", "50.00")
+        self.order = Order.objects.create(order_number="OR1", total="17.46")  # type: ignore
+
+    def pay(self, amount="17.46", order_id="OR1"):
+        return self.client.post("/api/v1/payment/", {
+            "account_number": self.account.account_number, "order_id": order_id, "amount": amount,
+        }, content_type="application/json")
+
+    def test_settles_once(self):
+        response = self.pay()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["responseObject"]["account_balance"], "32.54")
+        response = self.pay()
+        self.assertEqual(response.data["statusMessage"], "Payment for the order already completed")
+        self.assertEqual(ledger.balance(self.account.account_number), Decimal("32.54"))
+
+    def test_insufficient_balance_leaves_order_unpaid(self):
+        ledger.debit(self.account.id, 4000)
+        response = self.pay()
+        self.assertEqual(response.data["statusMessage"], "Insufficient balance")
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, "99")
+
+    def test_failure_messages(self):
+        self.assertEqual(self.pay(amount="1.00").data["statusMessage"], "Wrong amount submitted for payment")
+        self.assertEqual(self.pay(order_id="OR2").data["statusMessage"], "Order not found")
+
+    def test_debits_are_ledger_entries_compacted_into_snapshots(self):
+        Order.objects.create(order_number="OR2", total="2.54")  # type: ignore
+        self.pay()
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.account_balance, Decimal("50.00"))
+
+        self.assertEqual(ledger.compact(), 1)
+        self.assertEqual(ledger.compact(), 0)
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.account_balance, Decimal("32.54"))
+
+        self.assertEqual(self.pay(amount="2.54", order_id="OR2").data["responseObject"]["account_balance"], "30.00")
+        self.assertEqual(list(LedgerEntry.objects.values_list("amount_cents", flat=True)), [5000, -1746, -254])
+        with self.assertNumQueries(2):
+            self.assertEqual(ledger.balance(self.account.account_number), Decimal("30.00"))
+
+    def test_credits_after_compaction_count(self):
+        self.pay()
+        ledger.compact()
+        ledger.credit(self.account.id, 1000, "top-up")
+        self.assertEqual(ledger.balance(self.account.account_number), Decimal("42.54"))
+        ledger.compact()
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.account_balance, Decimal("42.54"))
+        self.assertEqual(ledger.balance(self.account.account_number), Decimal("42.54"))
+
+    def test_compaction_scans_only_entries_after_the_last_snapshot(self):
+        self.pay()
+        ledger.compact()
+        floor = LedgerEntry.objects.latest("id").id  # type: ignore
+        ledger.credit(self.account.id, 1000, "top-up")
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(ledger.compact(), 1)
+        scan = next(q["sql"] for q in queries.captured_queries if 'FROM "pizza_ledgerentry"' in q["sql"])
+        self.assertIn(f'"pizza_ledgerentry"."id" > {floor}', scan)
+        self.assertNotIn("pizza_balancesnapshot", scan)
+
+
+class PaymentTransitionTests(TransactionTestCase):
+    def setUp(self):
+        Order.objects.create(order_number="OR1", total="17.46")  # type: ignore
+
+    def read(self):
+        return Order.objects.values("id", "payment_status", "version").get(order_number="OR1")  # type: ignore
+
+    def test_transitions_compare_status_and_version(self):
+        stale = self.read()
+        Order.objects.update(version=5)  # type: ignore
+        with self.assertRaises(OrderConflict):
+            transition([stale], Order.PaymentStatus.PAID)
+        self.assertEqual(self.read()["payment_status"], Order.PaymentStatus.UNPAID)
+
+        fresh = self.read()
+        transition([fresh], Order.PaymentStatus.PAID)
+        self.assertEqual(fresh, {**self.read(), "version": 6})
+        with self.assertRaises(ValueError):
+            transition([fresh], Order.PaymentStatus.PAID)
+
+    def test_conflicts_are_retried(self):
+        attempts = []
+
+        @retries.retry_on_conflict
+        def pay():
+            attempts.append(1)
+            order = self.read()
+            if len(attempts) == 1:
+                # Another request settles the order between read and write.
+                Order.objects.update(payment_status=Order.PaymentStatus.PAID, version=1)  # type: ignore
+            transition([order], Order.PaymentStatus.PAID)
+
+        # The rerun reads the order as paid, which may not be paid again.
+        with self.assertRaises(ValueError):
+            pay()
+        self.assertEqual(len(attempts), 2)
+
+
+    def test_legacy_statuses_are_converted_and_unknown_ones_rejected(self):
+        from django.apps import apps
+
+        migration = importlib.import_module("pizza.migrations.0010_order_payment_version")
+        Order.objects.create(order_number="OR2", total="5.00", payment_status="completed")  # type: ignore
+        Order.objects.filter(order_number="OR1").update(payment_status="Pending")  # type: ignore
+        migration.convert_legacy_statuses(apps, None)
+        self.assertEqual(dict(Order.objects.values_list("order_number", "payment_status")),  # type: ignore
+                         {"OR1": "99", "OR2": "00"})
+
+        Order.objects.filter(order_number="OR1").update(payment_status="refunded")  # type: ignore
+        with self.assertRaisesMessage(PaymentError, "Order is in an unknown payment state"):
+            transition([self.read()], Order.PaymentStatus.PAID)
+        ledger.open_account("0100172111111", "50.00")
+        response = self.client.post("/api/v1/payment/", {
+            "account_number": "0100172111111", "order_id": "OR1", "amount": "17.46",
+        }, content_type="application/json")
+        self.assertEqual(response.json()["statusMessage"], "Order is in an unknown payment state")
+
+
+class BatchPaymentTests(TestCase):
+    def setUp(self):
+        self.account = ledger.open_account("0100172111111", "50.00")
+        Order.objects.create(order_number="OR1", total="17.46")  # type: ignore
+
+    def test_settles_valid_orders_and_reports_the_rest(self):
+        for number, total in [("OR2", "20.00"), ("OR3", "30.00"), ("OR4", "5.00")]:
+            Order.objects.create(order_number=number, total=total)  # type: ignore
+        Order.objects.filter(order_number="OR4").update(payment_status="00")  # type: ignore
+        payments = [
+            {"order_id": "OR1", "amount": "17.46"},
+            {"order_id": "OR2", "amount": "20.00"},
+            {"order_id": "OR3", "amount": "30.00"},
+            {"order_id": "OR4", "amount": "5.00"},
+            {"order_id": "OR5", "amount": "1.00"},
+            {"order_id": "OR1", "amount": "17.46"},
+            {"order_id": "OR2", "amount": "oops"},
+        ]
+        # Two balance reads, the orders (and the archive for the unknown one),
+        # one UPDATE, one INSERT and the status rollup, plus the test's
+        # savepoint.
+        with self.assertNumQueries(9):
+            response = self.client.post("/api/v1/payment/batch/", {
+                "account_number": self.account.account_number, "payments": payments,
+            }, content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        body = response.data["responseObject"]
+        self.assertEqual(body["account_balance"], "12.54")
+        self.assertEqual([p["statusMessage"] for p in body["payments"]], [
+            "Payment completed", "Payment completed", "Insufficient balance",
+            "Payment for the order already completed", "Order not found",
+            "Order appears more than once in the batch", "Invalid amount",
+        ])
+        self.assertEqual(
+            set(Order.objects.filter(payment_status="00").values_list("order_number", flat=True)),  # type: ignore
+            {"OR1", "OR2", "OR4"},
+        )
+        self.assertEqual(ledger.balance(self.account.account_number), Decimal("12.54"))
+
+
+    def test_items_that_are_not_objects_are_reported_not_raised(self):
+        response = self.client.post("/api/v1/payment/batch/", {
+            "account_number": self.account.account_number,
+            "payments": ["OR1", 42, None, [], {"order_id": "OR1", "amount": "17.46"}],
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        payments = response.data["responseObject"]["payments"]
+        self.assertEqual([p["statusMessage"] for p in payments],
+                         ["Account number, order_id and amount are required"] * 4 + ["Payment completed"])
+        self.assertEqual(ledger.balance(self.account.account_number), Decimal("32.54"))
+
+
+    def test_order_ids_that_are_not_strings_fail_only_their_item(self):
+        response = self.client.post("/api/v1/payment/batch/", {
+            "account_number": self.account.account_number, "payments": [
+                {"order_id": ["OR1"], "amount": "17.46"},
+                {"order_id": {"id": "OR1"}, "amount": "17.46"},
+                {"order_id": 1, "amount": "17.46"},
+                {"order_id": "OR1", "amount": "17.46"},
+            ],
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        payments = response.data["responseObject"]["payments"]
+        self.assertEqual([p["statusMessage"] for p in payments], ["Invalid order_id"] * 3 + ["Payment completed"])
+        self.assertEqual(ledger.balance(self.account.account_number), Decimal("32.54"))
+
+        response = self.client.post("/api/v1/payment/", {
+            "account_number": self.account.account_number, "order_id": ["OR1"], "amount": "17.46",
+        }, content_type="application/json")
+        self.assertEqual((response.status_code, response.data["statusMessage"]), (400, "Invalid order_id"))
+
+
+class ConcurrentPaymentTests(TransactionTestCase):
+    threads = 8
+    attempts = 60
+
+    def test_balances_are_conserved_under_parallel_load(self):
+        account = ledger.open_account("0100172111111", "100.00")
+        orders = [
+            Order.objects.create(order_number=f"OR{i}", total="7.50")  # type: ignore
+            for i in range(30)
+        ]
+        settled = []
+        start = threading.Barrier(self.threads)
+
+        def pay_randomly():
+            start.wait()
+            try:
+                for _ in range(self.attempts):
+                    order = random.choice(orders)
+                    while True:
+                        try:
+                            settle(order.order_number, account.account_number, Decimal("7.50"))
+                            settled.append(order.order_number)
+                        except PaymentError:
+                            pass
+                        except OperationalError:
+                            # The shared in-memory test database reports lock
+                            # contention instead of waiting; the client retries.
+                            continue
+                        break
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=pay_randomly) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        paid = set(Order.objects.filter(payment_status="00").values_list("order_number", flat=True))  # type: ignore
+        self.assertEqual(len(settled), len(set(settled)))
+        self.assertEqual(set(settled), paid)
+        self.assertEqual(len(paid), 13)
+        self.assertEqual(ledger.balance(account.account_number), Decimal("100.00") - Decimal("7.50") * len(paid))
+
+
+class IdempotencyTests(MenuTestCase):
+    def post_order(self, key, quantity=1):
+        return self.client.post(
+            "/api/v1/order/", {"pizza_id": self.small.id, "quantity": quantity},
+            content_type="application/json", HTTP_IDEMPOTENCY_KEY=key,
+        )
+
+    def test_retry_replays_stored_response(self):
+        first = self.post_order("retry-1")
+        second = self.post_order("retry-1")
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)  # type: ignore
+
+    def test_async_views_replay_stored_responses(self):
+        account = ledger.open_account("0100172111111", "50.00")
+        first, second = (self.client.post(
+            "/api/v1/async/order/", {"pizza_id": self.small.id, "quantity": 1},
+            content_type="application/json", HTTP_IDEMPOTENCY_KEY="async-order",
+        ) for _ in range(2))
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual((second.content, second["Idempotent-Replayed"]), (first.content, "true"))
+        self.assertEqual(Order.objects.count(), 1)  # type: ignore
+
+        order = Order.objects.get()  # type: ignore
+        body = {"account_number": account.account_number, "order_id": order.order_number, "amount": str(order.total)}
+        first, second = (self.client.post(
+            "/api/v1/async/payment/", body, content_type="application/json", HTTP_IDEMPOTENCY_KEY="async-payment",
+        ) for _ in range(2))
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(LedgerEntry.objects.filter(amount_cents__lt=0).count(), 1)  # type: ignore
+
+    def test_key_reused_with_different_body(self):
+        self.post_order("retry-2")
+        self.assertEqual(self.post_order("retry-2", quantity=2).status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)  # type: ignore
+
+    @override_settings(IDEMPOTENCY_STORE="database")
+    def test_database_store(self):
+        first = self.post_order("retry-3")
+        self.assertEqual(self.post_order("retry-3").content, first.content)
+        self.assertEqual(Order.objects.count(), 1)  # type: ignore
+
+
+class ConcurrentIdempotencyTests(SimpleTestCase):
+    def test_concurrent_duplicates_run_once(self):
+        cache.clear()
+        calls = []
+        responses = []
+        start = threading.Barrier(6)
+
+        def handler():
+            calls.append(1)
+            time.sleep(0.2)
+            return HttpResponse(b"done", status=201)
+
+        def send():
+            request = RequestFactory().post("/api/v1/order/", b"{}", content_type="application/json",
+                                            HTTP_IDEMPOTENCY_KEY="burst")
+            start.wait()
+            responses.append(idempotency.run_once(request, handler))
+
+        threads = [threading.Thread(target=send) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([r.status_code for r in responses], [201] * 6)
+        self.assertEqual({r.content for r in responses}, {b"done"})
+
+
+class SharedCacheTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "cache.sqlite3")
+
+    def cache(self, **options):
+        return SQLiteCache(self.path, {"OPTIONS": {"LOCAL_PREFIXES": ["menu:"], **options}})
+
+    def test_workers_see_each_others_writes(self):
+        first, second = self.cache(), self.cache()
+        first.set("menu:version", 1)
+        self.assertEqual(second.get("menu:version"), 1)
+        # The second read is served in process; a write elsewhere still shows.
+        self.assertEqual(second.get("menu:version"), 1)
+        first.incr("menu:version")
+        self.assertEqual(second.get("menu:version"), 2)
+
+        self.assertTrue(first.add("claim", "a", timeout=60))
+        self.assertFalse(second.add("claim", "b"))
+        second.set("gone", 1, timeout=0)
+        self.assertIsNone(first.get("gone"))
+        self.assertTrue(first.add("gone", 2))
+        with self.assertRaises(ValueError):
+            first.incr("missing")
+
+    def test_culls_least_recently_read_entries(self):
+        cache = self.cache(MAX_ENTRIES=10, CULL_CHECK_EVERY=1, TOUCH_INTERVAL=0)
+        for i in range(10):
+            cache.set(f"key{i}", i)
+        cache.get("key0")
+        cache.set("key10", 10)
+        self.assertEqual(cache.get("key0"), 0)
+        self.assertIsNone(cache.get("key1"))
+
+    def test_increments_are_atomic_across_processes(self):
+        self.cache().set("counter", 0)
+        processes = [multiprocessing.get_context("fork").Process(target=_increment, args=(self.path, 200))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache().get("counter"), 800)
+
+
+def _increment(path, times):
+    cache = SQLiteCache(path, {})
+    for _ in range(times):
+        cache.incr("counter")
+
+
+class QueryPlanTests(TestCase):
+    """
+    Every query the API views run, checked with EXPLAIN QUERY PLAN against a
+    menu, order history and a year of rollups of realistic size: only
+    menu-wide listings may scan a table.
+    """
+    FULL_SCAN = re.compile(r"\bSCAN (pizza_\w+)")
+
+    @classmethod
+    def setUpTestData(cls):
+        cache.clear()
+        cls.menu = benchmarks.seed_menu(pizzas=20, toppings_per_pizza=100)
+        benchmarks.seed_account()
+        accounts = Account.objects.bulk_create([  # type: ignore
+            Account(account_number=f"{i:013d}") for i in range(1000)
+        ])
+        LedgerEntry.objects.bulk_create([  # type: ignore
+            LedgerEntry(account=account, amount_cents=10000) for account in accounts
+        ])
+        # A paid order history spread over 200 days, then fresh unpaid orders.
+        pizza_ids = list(cls.menu)
+        history = Order.objects.bulk_create([  # type: ignore
+            Order(order_number=f"H{i}", payment_status="00", total="10.00") for i in range(10000)
+        ])
+        items = OrderItem.objects.bulk_create([  # type: ignore
+            OrderItem(order=order, pizza_id=pizza_ids[i % len(pizza_ids)]) for i, order in enumerate(history)
+        ])
+        OrderItem.toppings.through.objects.bulk_create([
+            OrderItem.toppings.through(orderitem_id=item.id, topping_id=cls.menu[item.pizza_id][i % 100])
+            for i, item in enumerate(items)
+        ])
+        for day in range(200):
+            Order.objects.filter(id__gt=day * 50, id__lte=(day + 1) * 50).update(  # type: ignore
+                created_at=timezone.now() - timedelta(days=day + 1)
+            )
+        cls.orders = benchmarks.seed_orders(cls.menu, 20)
+        today = timezone.localdate()
+        days = [today - timedelta(days=n) for n in range(1, 366)]
+        toppings = [topping_ids[0] for topping_ids in cls.menu.values()]
+        DailyOrderStatus.objects.bulk_create([  # type: ignore
+            DailyOrderStatus(day=day, payment_status=status, orders=1, total_cents=100)
+            for day in days for status in ("00", "99")
+        ])
+        DailyPizzaSales.objects.bulk_create([  # type: ignore
+            DailyPizzaSales(day=day, pizza_id=pizza_id, orders=1, quantity=1, revenue_cents=100)
+            for day in days for pizza_id in cls.menu
+        ])
+        DailyToppingSales.objects.bulk_create([  # type: ignore
+            DailyToppingSales(day=day, topping_id=topping_id, quantity=1, revenue_cents=100)
+            for day in days for topping_id in toppings
+        ])
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        cache.clear()
+
+    def assertNoFullScans(self, run, allowed=()):
+        with CaptureQueriesContext(connection) as queries:
+            result = run()
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query["sql"]
+                if not sql.startswith(("SELECT", "UPDATE", "DELETE", "INSERT")):
+                    continue
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                plan = "\n".join(row[-1] for row in cursor.fetchall())
+                scanned = set(self.FULL_SCAN.findall(plan)) - set(allowed)
+                self.assertFalse(scanned, f"{sql}\n{plan}")
+        return result
+
+    def get(self, path, allowed=(), **params):
+        def run():
+            response = self.client.get(path, params)
+            self.assertEqual(response.status_code, 200)
+            if response.streaming:
+                b"".join(response.streaming_content)
+
+        self.assertNoFullScans(run, allowed)
+
+    def post(self, path, body):
+        response = self.assertNoFullScans(lambda: self.client.post(path, body, content_type="application/json"))
+        self.assertIn(response.status_code, (200, 201), response.content)
+
+    def test_menu_listings(self):
+        self.get("/api/v1/pizzas/", allowed={"pizza_pizza"})
+        self.get("/api/v1/toppings/", allowed={"pizza_topping"})
+        # Each category is a large share of the menu, so reading the menu
+        # in id order beats going through the category index.
+        self.get("/api/v1/toppings/", allowed={"pizza_topping"}, category="Deluxe")
+
+    def test_topping_listings_by_size(self):
+        self.get("/api/v1/toppings/", size="SIZE-3")
+        # The small catalog is read whole to match the category; the size
+        # still narrows the toppings through the indexes.
+        self.get("/api/v1/toppings/", allowed={"pizza_catalogtopping"}, size="size-3", category="basic")
+
+    def test_orders(self):
+        # Price snapshots are whole-menu builds, covered by the listings.
+        pricing.get_snapshot()
+        pizza_id = next(iter(self.menu))
+        self.post("/api/v1/order/", {"pizza_id": pizza_id, "quantity": 2, "toppings": self.menu[pizza_id][:2]})
+        self.post("/api/v2/order/", {"items": [
+            {"pizza_id": pizza_id, "quantity": 1, "toppings": self.menu[pizza_id][2:4]},
+        ]})
+        self.get(f"/api/v1/order/{self.orders[0][0]}/")
+
+    def test_payments(self):
+        (first, first_total), (second, second_total), (third, third_total) = self.orders[-3:]
+        self.post("/api/v1/payment/", {
+            "account_number": "0100172111111", "order_id": first, "amount": str(first_total),
+        })
+        self.post("/api/v1/payment/batch/", {"account_number": "0100172111111", "payments": [
+            {"order_id": second, "amount": str(second_total)}, {"order_id": third, "amount": str(third_total)},
+        ]})
+
+    def test_reports_and_exports(self):
+        today = timezone.localdate()
+        self.get("/api/v1/reports/sales/", start=str(today - timedelta(days=6)), end=str(today))
+        self.get("/api/v1/orders/export/", start=str(today - timedelta(days=121)), end=str(today - timedelta(days=119)))
+
+    def test_archive_batches(self):
+        moved = self.assertNoFullScans(lambda: sum(archive.archive_orders(chunk_size=40, max_batches=1)))
+        self.assertEqual(moved, 40)
+
+
+class AdminTests(MenuTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(User.objects.create_superuser("admin", "admin@example.com", "secret"))
+
+    def add_orders(self, count):
+        snapshot = pricing.get_snapshot()
+        for _ in range(count):
+            quote = snapshot.quote(self.large.id, 1, [self.olives.id])
+            orders.create_order(order_ids.next_order_number(), [quote], quote.subtotal, quote.vat, quote.total)
+        Account.objects.create(account_number=f"{Account.objects.count():013d}")  # type: ignore
+
+    def changelist_queries(self, path):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(path).status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        paths = ["/admin/pizza/order/", "/admin/pizza/orderitem/", "/admin/pizza/account/",
+                 "/admin/pizza/order/?payment_status__exact=99"]
+        self.add_orders(2)
+        before = [self.changelist_queries(path) for path in paths]
+        self.add_orders(20)
+        self.assertEqual([self.changelist_queries(path) for path in paths], before)
+
+    def test_ledger_entries_and_snapshots_are_read_only(self):
+        account = ledger.open_account("0100172111111", "50.00")
+        ledger.compact()
+        entry, snapshot = LedgerEntry.objects.get(), BalanceSnapshot.objects.get()  # type: ignore
+        for path, obj in (("ledgerentry", entry), ("balancesnapshot", snapshot)):
+            self.assertEqual(self.client.get(f"/admin/pizza/{path}/").status_code, 200)
+            self.assertEqual(self.client.get(f"/admin/pizza/{path}/{obj.id}/change/").status_code, 200)
+            self.assertEqual(self.client.get(f"/admin/pizza/{path}/add/").status_code, 403)
+            change, delete = f"/admin/pizza/{path}/{obj.id}/change/", f"/admin/pizza/{path}/{obj.id}/delete/"
+            self.assertEqual(self.client.post(change, {"amount_cents": 1}).status_code, 403)
+            self.assertEqual(self.client.post(delete, {"post": "yes"}).status_code, 403)
+        self.assertEqual(ledger.balance(account.account_number), Decimal("50.00"))
+        self.assertEqual(BalanceSnapshot.objects.get().balance_cents, 5000)  # type: ignore
+
+    def test_accounts_show_the_ledger_balance_read_only(self):
+        account = ledger.open_account("0100172111111", "50.00")
+        ledger.debit(account.id, 1746, "OR1")
+        ledger.compact()
+        ledger.credit(account.id, 1000, "top-up")
+        row = ledger.with_balances(Account.objects.all()).get(id=account.id)  # type: ignore
+        self.assertEqual(from_cents(row.balance_cents), ledger.balance(account.account_number))
+        self.assertContains(self.client.get("/admin/pizza/account/"), "42.54")
+
+        url = f"/admin/pizza/account/{account.id}/change/"
+        self.assertContains(self.client.get(url), "42.54")
+        self.client.post(url, {"account_number": account.account_number, "account_balance": "999.00"})
+        account.refresh_from_db()
+        self.assertEqual((account.account_balance, ledger.balance(account.account_number)),
+                         (Decimal("32.54"), Decimal("42.54")))
+
+    def test_date_hierarchy_lists_periods_between_first_and_last(self):
+        self.add_orders(3)
+        first, second, _ = Order.objects.order_by("id")  # type: ignore
+        Order.objects.filter(id=first.id).update(created_at=timezone.now().replace(year=2023, month=1, day=5))  # type: ignore
+        Order.objects.filter(id=second.id).update(created_at=timezone.now().replace(year=2023, month=3, day=5))  # type: ignore
+        self.assertContains(self.client.get("/admin/pizza/order/"), "created_at__year=2024")
+        response = self.client.get("/admin/pizza/order/?created_at__year=2023")
+        for month in (1, 2, 3):
+            self.assertContains(response, f"created_at__month={month}")
+        self.assertNotContains(response, "created_at__month=4")
+
+    def test_counts_are_capped(self):
+        self.add_orders(5)
+        paginator = admin.EstimatedCountPaginator(Order.objects.order_by("id"), 2)  # type: ignore
+        paginator.count_limit = 3
+        first, last = Order.objects.order_by("id")[0].id, Order.objects.order_by("-id")[0].id  # type: ignore
+        Order.objects.filter(id__gt=first, id__lt=last).delete()  # type: ignore
+        self.add_orders(2)
+        # Unfiltered: estimated from the id range, gaps included.
+        self.assertEqual(paginator.count, Order.objects.order_by("-id")[0].id - first + 1)  # type: ignore
+        filtered = admin.EstimatedCountPaginator(Order.objects.filter(payment_status="99").order_by("id"), 2)  # type: ignore
+        filtered.count_limit = 3
+        self.assertEqual(filtered.count, 3)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(SimpleTestCase):
+    def route(self, method, path, **cookies):
+        seen = {}
+        request = getattr(RequestFactory(), method)(path)
+        request.COOKIES.update(cookies)
+        request.resolver_match = resolve(path)
+
+        def view(request):
+            middleware.process_view(request, None, (), {})
+            router = routers.ReplicaRouter()
+            seen.update(menu=router.db_for_read(Pizza), order=router.db_for_read(Order))
+            return HttpResponse(status=201 if method == "post" else 200)
+
+        middleware = routers.ReplicaRoutingMiddleware(view)
+        return seen, middleware(request)
+
+    def test_menu_and_read_only_views_use_replicas(self):
+        self.assertEqual(self.route("get", "/api/v1/pizzas/")[0], {"menu": "replica", "order": None})
+        self.assertEqual(self.route("get", "/api/v1/order/OR1/")[0], {"menu": "replica", "order": "replica"})
+        self.assertEqual(routers.ReplicaRouter().db_for_write(Pizza), "default")
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        seen, response = self.route("post", "/api/v1/order/")
+        self.assertEqual(seen, {"menu": "default", "order": "default"})
+        self.assertIn(routers.STICKY_COOKIE, response.cookies)
+        seen, _ = self.route("get", "/api/v1/order/OR1/", **{routers.STICKY_COOKIE: "1"})
+        self.assertEqual(seen, {"menu": "default", "order": "default"})
+
+    def test_replicas_need_a_shared_menu_cache(self):
+        self.assertEqual([error.id for error in checks.check_replica_menu_cache(None)], ["pizza.E001"])
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = {"BACKEND": "pizza.backends.sqlite_cache.SQLiteCache",
+                  "LOCATION": os.path.join(directory.name, "cache.sqlite3")}
+        with self.settings(CACHES={"default": settings.CACHES["default"], "shared": shared},
+                           MENU_CACHE_ALIAS="shared"):
+            self.assertEqual(checks.check_replica_menu_cache(None), [])
+        with self.settings(DATABASE_REPLICAS=[]):
+            self.assertEqual(checks.check_replica_menu_cache(None), [])
+
+    def test_backup_refreshes_open_replica_connections(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        primary, replica = (os.path.join(directory.name, name) for name in ("primary.sqlite3", "replica.sqlite3"))
+        with closing(sqlite3.connect(primary)) as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("CREATE TABLE pizza (name TEXT)")
+            db.execute("INSERT INTO pizza VALUES ('small')")
+            db.commit()
+            replicas.backup(primary, replica)
+            with closing(sqlite3.connect(replica)) as reader:
+                self.assertEqual(reader.execute("SELECT count(*) FROM pizza").fetchone(), (1,))
+                db.execute("INSERT INTO pizza VALUES ('large')")
+                db.commit()
+                replicas.backup(primary, replica)
+                self.assertEqual(reader.execute("SELECT count(*) FROM pizza").fetchone(), (2,))
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class StaleReplicaTests(TransactionTestCase):
+    """
+    Runs against a real replica alias: a copy of the test database taken
+    before the order was placed.
+    """
+
+    def setUp(self):
+        cache.clear()
+        small = Pizza.objects.create(name="small", price="10.00")  # type: ignore
+        cheese = Topping.objects.create(  # type: ignore
+            pizza=small, price="1.50",
+            catalog_topping=CatalogTopping.objects.create(name="cheese", category="basic"),  # type: ignore
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        connections.settings["replica"] = dict(
+            connection.settings_dict, NAME=os.path.join(directory.name, "replica.sqlite3")
+        )
+        self.addCleanup(self.drop_replica)
+        self.sync_replica()
+        quote = pricing.get_snapshot().quote(small.id, 1, [cheese.id])
+        orders.create_order("OR0000000000001", [quote], quote.subtotal, quote.vat, quote.total)
+
+    def sync_replica(self):
+        connections["replica"].close()
+        connection.ensure_connection()
+        with closing(sqlite3.connect(connections.settings["replica"]["NAME"])) as replica:
+            connection.connection.backup(replica)
+
+    def drop_replica(self):
+        connections["replica"].close()
+        del connections["replica"]
+        del connections.settings["replica"]
+
+    def test_related_managers_read_from_their_instances_database(self):
+        self.assertEqual(Topping.objects.all().db, "replica")
+        item = OrderItem.objects.get()  # type: ignore
+        self.assertEqual([topping.name for topping in item.toppings.all()], ["cheese"])
+        item = OrderItem.objects.prefetch_related("toppings").get()  # type: ignore
+        self.assertEqual([topping.name for topping in item.toppings.all()], ["cheese"])
+
+    def test_export_streams_from_the_replica(self):
+        def export():
+            with CaptureQueriesContext(connections["replica"]) as replica, \
+                    CaptureQueriesContext(connection) as primary:
+                response = self.client.get("/api/v1/orders/export/?type=ndjson")
+                lines = b"".join(response.streaming_content).decode().splitlines()
+            self.assertTrue(replica.captured_queries)
+            self.assertFalse([q for q in primary.captured_queries if "pizza_order" in q["sql"]])
+            return [json.loads(line) for line in lines]
+
+        self.assertEqual(export(), [])
+        self.sync_replica()
+        exported = export()
+        self.assertEqual([order["order_number"] for order in exported], ["OR0000000000001"])
+        self.assertEqual(exported[0]["items"][0]["toppings"], ["cheese"])
+
+
+class AsyncViewTests(MenuTestCase):
+    async def test_menu_matches_sync_view(self):
+        sync = await self.async_client.get("/api/v1/toppings/?size=small")
+        cache.clear()
+        response = await self.async_client.get("/api/v1/async/toppings/?size=SMALL")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, sync.content)
+        self.assertEqual(response["ETag"], sync["ETag"])
+
+    async def test_order(self):
+        response = await self.async_client.post(
+            "/api/v1/async/order/", {"pizza_id": self.small.id, "quantity": 2, "toppings": [self.cheese.id]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(json.loads(response.content)["responseObject"]["grand_total"], "26.68")
+        self.assertEqual(await Order.objects.acount(), 1)  # type: ignore
+
+
+class MetricsTests(MenuTestCase):
+    def test_reports_per_route_query_counts_across_processes(self):
+        other_worker = metrics.Registry()
+        probe = metrics.Probe()
+        probe.queries = 4
+        other_worker.observe("api/v1/pizzas/", "GET", 200, 0.002, probe)
+
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            with open(os.path.join(directory, "metrics-1.json"), "w") as f:
+                json.dump(other_worker.snapshot(), f)
+            before = metrics.merge([metrics.registry.snapshot()])["queries"].get("api/v1/pizzas/")
+            self.client.get("/api/v1/pizzas/")
+            body = self.client.get("/api/metrics/").content.decode()
+
+        sum_before = before[-1] if before else 0
+        self.assertIn(f'soko_db_queries_per_request_sum{{route="api/v1/pizzas/"}} {sum_before + 4 + 1}', body)
+        self.assertIn('soko_http_requests_total{route="api/v1/pizzas/",method="GET",status="200"}', body)
+
+
+    def test_files_of_exited_workers_are_folded_into_one(self):
+        exited = multiprocessing.get_context("fork").Process(target=os._exit, args=(0,))
+        exited.start()
+        exited.join()
+        probe = metrics.Probe()
+        probe.queries = 2
+        worker = metrics.Registry()
+        worker.observe("api/v1/pizzas/", "GET", 200, 0.002, probe)
+
+        with tempfile.TemporaryDirectory() as directory, self.settings(METRICS_DIR=directory):
+            for name in (f"metrics-{exited.pid}-1.json", f"metrics-{exited.pid}-2.json", "metrics-1.json"):
+                with open(os.path.join(directory, name), "w") as f:
+                    json.dump(worker.snapshot(), f)
+            totals = metrics.collect()["requests"]
+            files = sorted(name for name in os.listdir(directory) if name.endswith(".json"))
+            self.assertEqual(len(files), 3)
+            self.assertEqual((files[0], files[-1]), ("metrics-1.json", "metrics-dead.json"))
+            self.assertTrue(files[1].startswith(f"metrics-{os.getpid()}-"))
+            self.assertEqual(metrics.fold_dead(directory), 0)
+            self.assertEqual(metrics.collect()["requests"], totals)
+        own = metrics.registry.snapshot()["requests"].get("api/v1/pizzas/|GET|200", 0)
+        self.assertEqual(totals["api/v1/pizzas/|GET|200"], own + 3)
+
+    def test_only_internal_clients_may_read_metrics(self):
+        self.assertEqual(self.client.get("/api/metrics/", REMOTE_ADDR="10.1.2.3").status_code, 200)
+        self.assertEqual(self.client.get("/api/metrics/", REMOTE_ADDR="203.0.113.9").status_code, 403)
+        with self.settings(METRICS_ALLOWED_NETWORKS=["203.0.113.0/24"]):
+            self.assertEqual(self.client.get("/api/metrics/", REMOTE_ADDR="203.0.113.9").status_code, 200)
+
+
+class RenderTests(MenuTestCase):
+    def test_fast_path_matches_model_serializer_output(self):
+        expected = JSONRenderer().render(envelope(ToppingSerializer(Topping.objects.select_related("catalog_topping"), many=True).data))
+        rows = menu_rows(Topping.objects.values_list(*TOPPING_ROW_FIELDS))  # type: ignore
+        self.assertEqual(FastJSONRenderer().render(envelope(rows)), expected)
+
+    def test_falls_back_for_data_orjson_cannot_match(self):
+        data = {"line\u2028sep": [Decimal("1.50"), 2 ** 70], 1: "int key"}
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+
+class ApiProfileTests(MenuTestCase):
+    def test_api_profile_serves_the_same_responses(self):
+        from soko_pizza import settings_api
+
+        expected = self.client.get("/api/v1/pizzas/").content
+        with self.settings(ROOT_URLCONF=settings_api.ROOT_URLCONF, MIDDLEWARE=settings_api.MIDDLEWARE):
+            response = self.client.get("/api/v1/pizzas/")
+            order = self.client.post("/api/v1/order/", {"pizza_id": self.small.id, "quantity": 1},
+                                     content_type="application/json")
+        self.assertEqual(response.content, expected)
+        self.assertEqual(order.status_code, 201)
+
+
+class ApiProfileProcessTests(SimpleTestCase):
+    """
+    Loads ``soko_pizza.settings_api`` for real, in a separate process, with
+    a throwaway database and cache.
+    """
+    REQUEST = """
+import json
+import django
+django.setup()
+from django.test import Client
+from django.test.utils import setup_test_environment
+from pizza import benchmarks
+setup_test_environment()
+with benchmarks.benchmark_database():
+    benchmarks.seed_menu(pizzas=2)
+    client = Client()
+    pizzas = client.get("/api/v1/pizzas/")
+    print(json.dumps({
+        "status": pizzas.status_code, "pizzas": len(json.loads(pizzas.content)["responseObject"]),
+        "renderer": pizzas["Content-Type"], "admin": client.get("/admin/").status_code,
+    }))
+"""
+
+    def run_in_profile(self, *args):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE="soko_pizza.settings_api",
+                   CACHE_PATH=os.path.join(directory.name, "cache.sqlite3"))
+        result = subprocess.run([sys.executable, *args], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout
+
+    def test_system_checks_pass(self):
+        self.assertIn("no issues", self.run_in_profile("manage.py", "check"))
+
+    def test_serves_the_api_without_the_admin(self):
+        self.assertEqual(json.loads(self.run_in_profile("-c", self.REQUEST)), {
+            "status": 200, "pizzas": 2, "renderer": "application/json", "admin": 404,
+        })
+
+
+class DatabaseBackendTests(SimpleTestCase):
+    databases = {"default"}
+
+    def test_connections_run_init_commands(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+        self.assertEqual(connection.transaction_mode, "IMMEDIATE")
+
+    def test_retries_lock_errors_outside_atomic_blocks(self):
+        attempts = []
+
+        @retries.retry_on_lock
+        def write():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise OperationalError("database is locked")
+            return "written"
+
+        with self.settings(DATABASE_LOCK_BACKOFF=0):
+            self.assertEqual(write(), "written")
+        self.assertEqual(len(attempts), 3)
+
+
+class OrderQueueTests(MenuTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(self.settings(
+            ORDER_INGESTION="queued", ORDER_QUEUE_WORKER=False,
+            ORDER_QUEUE_PATH=os.path.join(directory.name, "queue.sqlite3"),
+        ))
+
+    def test_queued_orders_are_accepted_then_written_in_one_batch(self):
+        numbers = []
+        for quantity in (1, 2, 3):
+            response = self.client.post(
+                "/api/v2/order/",
+                {"items": [{"pizza_id": self.small.id, "quantity": quantity, "toppings": [self.cheese.id]}]},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 202)
+            numbers.append(response.json()["responseObject"]["order_id"])
+        self.assertFalse(Order.objects.exists())  # type: ignore
+        self.assertEqual(self.client.get(f"/api/v1/order/{numbers[0]}/").json()["responseObject"]["status"], "queued")
+
+        with self.assertNumQueries(9):
+            self.assertEqual(order_queue.drain(), 3)
+
+        status = self.client.get(f"/api/v1/order/{numbers[1]}/").json()["responseObject"]
+        self.assertEqual((status["status"], status["grand_total"]), ("persisted", "26.68"))
+        self.assertEqual(OrderItem.toppings.through.objects.count(), 3)
+        self.assertEqual(len(order_queue.get_spool()), 0)
+
+    def test_a_batch_written_twice_creates_its_orders_once(self):
+        quote = pricing.get_snapshot().quote(self.small.id, 1, [])
+        batch = [("OR0000000000001", [quote], quote.subtotal, quote.vat, quote.total)]
+        self.assertEqual(orders.create_orders(batch), 1)
+        self.assertEqual(orders.create_orders(batch), 0)
+        self.assertEqual(self.client.get("/api/v1/order/OR0000000000002/").status_code, 404)
+
+
+class QueuedOrderFailureTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.small = Pizza.objects.create(name="small", price="10.00")  # type: ignore
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(self.settings(
+            ORDER_INGESTION="queued", ORDER_QUEUE_WORKER=False,
+            ORDER_QUEUE_PATH=os.path.join(directory.name, "queue.sqlite3"),
+        ))
+
+    def test_an_order_the_database_rejects_is_moved_aside(self):
+        good = order_queue.QueuedLine(self.small.id, 1, [])
+        missing = order_queue.QueuedLine(self.small.id + 100, 1, [])
+        for number, line in (("OR0000000000001", good), ("OR0000000000002", missing), ("OR0000000000003", good)):
+            order_queue.submit(number, [line], Decimal("10.00"), Decimal("1.60"), Decimal("11.60"))
+
+        with self.assertLogs("pizza.order_queue", "ERROR"):
+            self.assertEqual(order_queue.drain(), 2)
+
+        spool = order_queue.get_spool()
+        self.assertEqual(len(spool), 0)
+        self.assertIn("FOREIGN KEY", spool.failure("OR0000000000002"))
+        self.assertEqual(set(Order.objects.values_list("order_number", flat=True)),  # type: ignore
+                         {"OR0000000000001", "OR0000000000003"})
+        statuses = [
+            self.client.get(f"/api/v1/order/OR000000000000{i}/").json()["responseObject"]["status"]
+            for i in (1, 2, 3)
+        ]
+        self.assertEqual(statuses, ["persisted", "failed", "persisted"])
+
+
+class ArchiveTests(MenuTestCase):
+    def setUp(self):
+        super().setUp()
+        ledger.open_account("0100172111111", "1000.00")
+        snapshot = pricing.get_snapshot()
+        self.numbers = []
+        for i in range(5):
+            quote = snapshot.quote(self.small.id, 1, [self.cheese.id])
+            self.numbers.append(f"OR{i}")
+            orders.create_order(f"OR{i}", [quote], quote.subtotal, quote.vat, quote.total)
+        Order.objects.filter(order_number__in=self.numbers[:4]).update(  # type: ignore
+            payment_status="00", created_at=timezone.now() - timedelta(days=100)
+        )
+        Order.objects.filter(order_number="OR3").update(created_at=timezone.now())  # type: ignore
+
+    def test_moves_old_paid_orders_in_resumable_batches(self):
+        self.assertEqual(list(archive.archive_orders(chunk_size=2, max_batches=1)), [2])
+        self.assertEqual(list(archive.archive_orders(chunk_size=2)), [1])
+        self.assertEqual(list(archive.archive_orders(chunk_size=2)), [])
+
+        self.assertEqual(set(Order.objects.values_list("order_number", flat=True)), {"OR3", "OR4"})  # type: ignore
+        self.assertEqual(ArchivedOrder.objects.count(), 3)  # type: ignore
+        self.assertEqual(ArchivedOrderItem.toppings.through.objects.count(), 3)
+        self.assertEqual(OrderItem.objects.count(), 2)  # type: ignore
+
+    def test_lookups_fall_back_to_the_archive(self):
+        list(archive.archive_orders())
+        status = self.client.get("/api/v1/order/OR0/").json()["responseObject"]
+        self.assertEqual((status["payment_status"], status["grand_total"]), ("00", "13.34"))
+        response = self.client.post("/api/v1/payment/", {
+            "account_number": "0100172111111", "order_id": "OR0", "amount": "13.34",
+        }, content_type="application/json")
+        self.assertEqual(response.data["statusMessage"], "Payment for the order already completed")
+
+
+class ExportTests(MenuTestCase):
+    def setUp(self):
+        super().setUp()
+        snapshot = pricing.get_snapshot()
+        for i in range(5):
+            quote = snapshot.quote(self.large.id, i + 1, [self.olives.id])
+            orders.create_order(f"OR{i}", [quote], quote.subtotal, quote.vat, quote.total)
+        Order.objects.filter(order_number="OR4").update(created_at=timezone.now() - timedelta(days=3))  # type: ignore
+
+    def test_streams_csv_with_items_and_toppings(self):
+        response = self.client.get("/api/v1/orders/export/", {"start": str(timezone.now().date())})
+        self.assertTrue(response.streaming)
+        rows = list(csv.reader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0], list(exports.CSV_COLUMNS))
+        self.assertEqual([row[0] for row in rows[1:]], ["OR0", "OR1", "OR2", "OR3"])
+        self.assertEqual(rows[2][6:], ["large", "2", "olives"])
+
+    def test_prefetches_per_chunk(self):
+        # One cursor per table, then items and toppings for each chunk of 2.
+        with self.assertNumQueries(8):
+            lines = list(exports.ndjson_lines(exports.iter_orders(chunk_size=2)))
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(json.loads(lines[4])["items"][0]["toppings"], ["olives"])
+
+    def test_rejects_unknown_types_and_dates(self):
+        self.assertEqual(self.client.get("/api/v1/orders/export/", {"type": "xml"}).status_code, 400)
+        self.assertEqual(self.client.get("/api/v1/orders/export/", {"end": "last week"}).status_code, 400)
+
+
+class RollupTests(MenuTestCase):
+    def setUp(self):
+        super().setUp()
+        ledger.open_account("0100172111111", "1000.00")
+
+    def order(self, items):
+        response = self.client.post("/api/v2/order/", {"items": items}, content_type="application/json")
+        return response.data["responseObject"]
+
+    def sales(self):
+        today = str(timezone.localdate())
+        return self.client.get("/api/v1/reports/sales/", {"start": today, "end": today}).data["responseObject"]
+
+    def test_orders_and_payments_update_rollups_incrementally(self):
+        first = self.order([{"pizza_id": self.small.id, "quantity": 2, "toppings": [self.cheese.id]}])
+        self.order([
+            {"pizza_id": self.small.id, "quantity": 1},
+            {"pizza_id": self.large.id, "quantity": 1, "toppings": [self.olives.id]},
+        ])
+        self.client.post("/api/v1/payment/", {
+            "account_number": "0100172111111", "order_id": first["order_id"], "amount": first["grand_total"],
+        }, content_type="application/json")
+
+        report = self.sales()
+        self.assertEqual(report["days"][0]["statuses"], {
+            "00": {"orders": 1, "total": "26.68"},
+            "99": {"orders": 1, "total": "37.41"},
+        })
+        self.assertEqual(
+            [(p["pizza"], p["orders"], p["quantity"], p["revenue"]) for p in report["pizzas"]],
+            [("small", 2, 3, "33.00"), ("large", 1, 1, "22.25")],
+        )
+        self.assertEqual([(t["topping"], t["quantity"]) for t in report["toppings"]], [("cheese", 2), ("olives", 1)])
+
+        rollups.rebuild()
+        self.assertEqual(self.sales(), report)
+
+    def test_report_reads_only_rollups(self):
+        self.order([{"pizza_id": self.small.id, "quantity": 1}])
+        with self.assertNumQueries(3):
+            self.sales()
+
+
+class CatalogTests(MenuTestCase):
+    def test_import_upserts_prices_and_keeps_topping_ids(self):
+        rows = catalog.read_rows(io.StringIO(
+            "pizza,topping,category,price\n"
+            "Small,cheese,basic,1.75\n"
+            "large,cheese,basic,2.50\n"
+            "large,olives,deluxe,2.25\n"
+            "small,ham,deluxe,3.00\n"
+        ))
+        self.assertEqual(catalog.import_rows(rows), (3, 4))
+        self.cheese.refresh_from_db()
+        self.assertEqual(self.cheese.price, Decimal("1.75"))
+        self.assertEqual(Topping.objects.count(), 4)  # type: ignore
+        self.assertEqual(sorted(self.large.toppings.values_list("catalog_topping__name", flat=True)), ["cheese", "olives"])
+
+        out = io.StringIO()
+        catalog.write_rows(out, catalog.export_rows())
+        self.assertEqual(out.getvalue().splitlines()[1:3], ["large,cheese,basic,2.50", "large,olives,deluxe,2.25"])
+
+    def test_topping_names_match_ignoring_case(self):
+        rows = [("small", "Cheese", "deluxe", Decimal("1.80")), ("large", "HAM", "basic", Decimal("3.00")),
+                ("small", "ham", "basic", Decimal("2.50"))]
+        self.assertEqual(catalog.import_rows(rows), (2, 3))
+        self.assertEqual(CatalogTopping.objects.get(name__iexact="cheese").id, self.cheese.catalog_topping_id)  # type: ignore
+        self.assertEqual(sorted(CatalogTopping.objects.values_list("name", "category")),  # type: ignore
+                         [("HAM", "basic"), ("cheese", "deluxe"), ("olives", "deluxe")])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CatalogTopping.objects.create(name="OLIVES", category="deluxe")  # type: ignore
+
+    def test_rejects_conflicting_categories(self):
+        rows = [("small", "ham", "basic", Decimal("3.00")), ("large", "Ham", "deluxe", Decimal("3.00"))]
+        with self.assertRaisesMessage(catalog.CatalogError, "Conflicting categories for toppings: ham"):
+            catalog.import_rows(rows)
+        self.assertFalse(CatalogTopping.objects.filter(name__iexact="ham").exists())  # type: ignore
+
+    def test_rejects_unknown_pizzas_and_bad_rows(self):
+        with self.assertRaisesMessage(catalog.CatalogError, "Unknown pizza sizes: huge"):
+            catalog.import_rows([("huge", "cheese", "basic", Decimal("1.00"))])
+        with self.assertRaisesMessage(catalog.CatalogError, "line 2"):
+            catalog.read_rows(io.StringIO("pizza,topping,category,price\nsmall,cheese,gold,1.00\n"))
+
+
+class ThrottlingTests(MenuTestCase):
+    def test_token_bucket_allows_a_burst_then_refills(self):
+        self.assertEqual([throttling.take(cache, "bucket", 2, 3, now=100.0) for _ in range(4)], [0, 0, 0, 0.5])
+        self.assertEqual(throttling.take(cache, "bucket", 2, 3, now=100.5), 0)
+
+    @override_settings(RATE_LIMITS={"read-client": {"rate": 1, "burst": 2}, "write-global": {"rate": 1, "burst": 1}})
+    def test_reads_and_writes_have_separate_buckets(self):
+        statuses = [self.client.get("/api/v1/pizzas/").status_code for _ in range(3)]
+        self.assertEqual(statuses, [200, 200, 429])
+        response = self.client.get("/api/v1/async/pizzas/")
+        self.assertEqual((response.status_code, response["Retry-After"]), (429, "1"))
+
+        body = {"pizza_id": self.small.id, "quantity": 1}
+        first = self.client.post("/api/v1/order/", body, content_type="application/json", REMOTE_ADDR="10.0.0.1")
+        second = self.client.post("/api/v1/order/", body, content_type="application/json", REMOTE_ADDR="10.0.0.2")
+        self.assertEqual((first.status_code, second.status_code), (201, 429))
+        self.assertEqual(second.json()["statusMessage"], throttling.THROTTLED_MESSAGE)
+        self.assertIn("Retry-After", second)
+
+    @override_settings(RATE_LIMITS={"write-client": {"rate": 1, "burst": 2}, "write-global": {"rate": 1, "burst": 10}})
+    def test_requests_a_client_bucket_rejects_leave_the_global_bucket_alone(self):
+        factory = RequestFactory()
+        noisy = [throttling.wait_time(factory.post("/", REMOTE_ADDR="1.1.1.1"), "write") for _ in range(12)]
+        self.assertEqual(sum(1 for wait in noisy if not wait), 2)
+        self.assertEqual(throttling.wait_time(factory.post("/", REMOTE_ADDR="2.2.2.2"), "write"), 0)
+
+    def test_sheds_writes_over_the_in_flight_cap(self):
+        admitted = threading.Event()
+        release = threading.Event()
+
+        def slow_write(request):
+            admitted.set()
+            release.wait(5)
+            return HttpResponse(status=201)
+
+        middleware = throttling.AdmissionControlMiddleware(slow_write)
+        factory = RequestFactory()
+        with self.settings(WRITE_CONCURRENCY_LIMIT=1):
+            thread = threading.Thread(target=middleware, args=(factory.post("/api/v1/order/"),))
+            thread.start()
+            admitted.wait(5)
+            shed = middleware(factory.post("/api/v1/order/"))
+            release.set()
+            thread.join()
+            self.assertEqual(middleware(factory.post("/api/v1/order/")).status_code, 201)
+        self.assertEqual((shed.status_code, shed["Retry-After"]), (429, "1"))
+
+
+class BenchmarkTests(SimpleTestCase):
+    def report(self, throughput, p95_ms, queries):
+        return {"total": {"throughput": throughput, "p95_ms": p95_ms},
+                "queries_per_request": {"api/v1/order/": queries}}
+
+    def test_compare_flags_regressions_past_the_tolerance(self):
+        from .management.commands.benchmark import Command
+
+        baseline = self.report(1000, 10.0, 4)
+        self.assertEqual(Command().compare(baseline, self.report(900, 11.0, 4), 0.15), [])
+        regressions = Command().compare(baseline, self.report(800, 12.0, 5), 0.15)
+        self.assertEqual(len(regressions), 3)
+        self.assertIn("throughput 800 req/s < baseline 1000 req/s", regressions)
+
+    def test_baseline_run_fails_on_regression_and_leaves_the_database_alone(self):
+        database = settings.BASE_DIR / "db.sqlite3"
+        journals = [f"{database}-wal", f"{database}-shm"]
+        before = (database.read_bytes(), [os.path.exists(path) for path in journals])
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = os.path.join(directory, "baseline.json")
+            with open(baseline, "w") as f:
+                json.dump(self.report(10 ** 9, 0.001, 1), f)
+            result = subprocess.run(
+                [sys.executable, "manage.py", "benchmark", "--requests", "20", "--concurrency", "2",
+                 "--baseline", baseline],
+                cwd=settings.BASE_DIR, capture_output=True, text=True,
+                env=dict(os.environ, DJANGO_SETTINGS_MODULE="soko_pizza.settings"),
+            )
+        self.assertEqual(result.returncode, 1, result.stderr)
+        self.assertIn("Performance regressed against baseline", result.stderr)
+        self.assertEqual(json.loads(result.stdout)["target"], "in-process")
+        self.assertEqual((database.read_bytes(), [os.path.exists(path) for path in journals]), before)
@@ -0,0 +1,194 @@
+"""
+Rate limiting and admission control.
+
+Token buckets live in the ``RATE_LIMIT_CACHE_ALIAS`` cache and are
+configured per scope in ``RATE_LIMITS``::
+
+    RATE_LIMITS = {
+        "read-client": {"rate": 50, "burst": 100},   # per client, per second
+        "read-global": {"rate": 2000, "burst": 4000},
+        "write-client": {"rate": 5, "burst": 10},
+        "write-global": {"rate": 200, "burst": 200},
+    }
+
+Missing scopes are unlimited. Buckets use GCRA, which stores a single
+timestamp per bucket. Updates are serialised within a process; with a
+cache shared by several processes, concurrent updates can let a few extra
+requests through.
+
+``AdmissionControlMiddleware`` caps the writes in flight in each process at
+``WRITE_CONCURRENCY_LIMIT`` and sheds the rest straight away with 429 and
+``Retry-After``, instead of letting them queue on the database lock.
+"""
+import math
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponse
+from rest_framework import exceptions, status
+from rest_framework.throttling import BaseThrottle
+from rest_framework.views import exception_handler as drf_exception_handler
+
+from .renderers import FastJSONRenderer
+from .serializers import envelope
+
+THROTTLED_MESSAGE = "Too many requests; retry later"
+WRITE_METHODS = frozenset(["POST", "PUT", "PATCH", "DELETE"])
+
+_bucket_lock = threading.Lock()
+
+
+def _cache():
+    return caches[getattr(settings, "RATE_LIMIT_CACHE_ALIAS", "default")]
+
+
+def _reserve(cache, key, rate, burst, now):
+    # The bucket's next arrival time if a token is taken now, and the
+    # seconds until one is available (0 if it is).
+    interval = 1.0 / rate
+    arrival = max(cache.get(key) or now, now) + interval
+    return arrival, max(0.0, arrival - burst * interval - now)
+
+
+def _store(cache, key, rate, burst, arrival):
+    cache.set(key, arrival, timeout=math.ceil(burst / rate) + 1)
+
+
+def take(cache, key, rate, burst, now=None):
+    """
+    Take one token from the bucket at ``key``, returning 0 if it was
+    available or the seconds until one will be.
+    """
+    now = time.time() if now is None else now
+    with _bucket_lock:
+        arrival, wait = _reserve(cache, key, rate, burst, now)
+        if not wait:
+            _store(cache, key, rate, burst, arrival)
+    return wait
+
+
+def _ident(request):
+    return BaseThrottle().get_ident(request)
+
+
+def wait_time(request, scope):
+    """
+    Seconds ``request`` must wait under the ``scope`` buckets, 0 if it may
+    proceed now. A request is checked against its client's bucket first,
+    and takes a token from each bucket only when both have one, so a
+    client over its own limit never drains the global bucket.
+    """
+    limits = getattr(settings, "RATE_LIMITS", {})
+    client, shared = limits.get(f"{scope}-client"), limits.get(f"{scope}-global")
+    cache = _cache()
+    key = f"throttle:{scope}:{_ident(request)}"
+    now = time.time()
+    with _bucket_lock:
+        if client:
+            arrival, wait = _reserve(cache, key, client["rate"], client["burst"], now)
+            if wait:
+                return wait
+        if shared:
+            shared_arrival, wait = _reserve(cache, f"throttle:{scope}:*", shared["rate"], shared["burst"], now)
+            if wait:
+                return wait
+            _store(cache, f"throttle:{scope}:*", shared["rate"], shared["burst"], shared_arrival)
+        if client:
+            _store(cache, key, client["rate"], client["burst"], arrival)
+    return 0.0
+
+
+async def await_time(request, scope):
+    if isinstance(_cache(), LocMemCache):
+        # Never blocks, so skip the thread hop.
+        return wait_time(request, scope)
+    return await sync_to_async(wait_time)(request, scope)
+
+
+def throttled_response(wait):
+    response = HttpResponse(FastJSONRenderer().render(envelope(None, THROTTLED_MESSAGE, successful=False)),
+                            status=status.HTTP_429_TOO_MANY_REQUESTS, content_type="application/json")
+    response["Retry-After"] = str(max(1, math.ceil(wait)))
+    return response
+
+
+class TokenBucketThrottle(BaseThrottle):
+    scope = None
+
+    def allow_request(self, request, view):
+        self._wait = wait_time(request, self.scope)
+        return not self._wait
+
+    def wait(self):
+        return self._wait
+
+
+class ReadThrottle(TokenBucketThrottle):
+    scope = "read"
+
+
+class WriteThrottle(TokenBucketThrottle):
+    scope = "write"
+
+
+def exception_handler(exc, context):
+    """
+    DRF's handler, with throttled responses in the API's envelope.
+    """
+    response = drf_exception_handler(exc, context)
+    if response is not None and isinstance(exc, exceptions.Throttled):
+        response.data = envelope(None, THROTTLED_MESSAGE, successful=False)
+    return response
+
+
+class AdmissionControlMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def _admit(self, request):
+        limit = getattr(settings, "WRITE_CONCURRENCY_LIMIT", None)
+        if not limit or request.method not in WRITE_METHODS:
+            return None
+        with self.lock:
+            if self.in_flight >= limit:
+                return False
+            self.in_flight += 1
+        return True
+
+    def _release(self):
+        with self.lock:
+            self.in_flight -= 1
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        admitted = self._admit(request)
+        if admitted is False:
+            return throttled_response(1)
+        try:
+            return self.get_response(request)
+        finally:
+            if admitted:
+                self._release()
+
+    async def __acall__(self, request):
+        admitted = self._admit(request)
+        if admitted is False:
+            return throttled_response(1)
+        try:
+            return await self.get_response(request)
+        finally:
+            if admitted:
+                self._release()
@@ -1,11 +1,24 @@
 from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
 
-from .views import PizzaList, ToppingList, OrderView, MakePayment
+from .async_views import AsyncMakePayment, AsyncOrderView, AsyncPizzaList, AsyncToppingList
+from .metrics import metrics_view
+from .views import PizzaList, ToppingList, OrderView, OrderBasketView, OrderStatus, OrderExport, SalesReport, MakePayment, MakeBatchPayment
 
 urlpatterns = [
     path('v1/pizzas/', PizzaList.as_view(), name = 'pizza-list')
     ,path('v1/toppings/', ToppingList.as_view(), name = 'topping-list')
     ,path('v1/order/', OrderView.as_view(), name = 'post-order')
+    ,path('v1/orders/export/', OrderExport.as_view(), name = 'order-export')
+    ,path('v1/order/<str:order_number>/', OrderStatus.as_view(), name = 'order-status')
     ,path('v1/payment/', MakePayment.as_view(), name = 'make-payment')
+    ,path('v1/payment/batch/', MakeBatchPayment.as_view(), name = 'make-payment-batch')
+    ,path('v2/order/', OrderBasketView.as_view(), name = 'post-order-v2')
+    ,path('v1/async/pizzas/', AsyncPizzaList.as_view(), name = 'pizza-list-async')
+    ,path('v1/async/toppings/', AsyncToppingList.as_view(), name = 'topping-list-async')
+    ,path('v1/async/order/', csrf_exempt(AsyncOrderView.as_view()), name = 'post-order-async')
+    ,path('v1/async/payment/', csrf_exempt(AsyncMakePayment.as_view()), name = 'make-payment-async')
+    ,path('v1/reports/sales/', SalesReport.as_view(), name = 'sales-report')
+    ,path('metrics/', metrics_view, name = 'metrics')
 
 ]
\ No newline at end of file
@@ -1,232 +1,209 @@
-from datetime import datetime
-from decimal import Decimal
+from datetime import timedelta
+
+from django.db import router
+from django.db.models.functions import Lower
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .models import Order, OrderItem, Pizza, Topping, Account
-from .serializers import PizzaSerializer, ToppingSerializer, AccountSerializer
+from . import archive, exports, menu_cache, order_queue, pricing, rollups
+from .idempotency import IdempotentMixin
+from .models import Order, Pizza, Topping
+from .order_ids import next_order_number
+from .orders import OrderRequestError, basket_receipt, order_receipt, parse_basket, parse_order
+from .payments import PaymentError, parse_batch_payment, parse_payment, settle, settle_batch
+from .serializers import MENU_ROW_FIELDS, TOPPING_ROW_FIELDS, account_row, envelope, menu_rows
+from .throttling import ReadThrottle, WriteThrottle
 
 
 class PizzaList(APIView):
+    throttle_classes = [ReadThrottle]
+
     def get(self, request):
-        pizzas = Pizza.objects.all()  # type: ignore
-        serializer = PizzaSerializer(pizzas, many=True)
-        return Response({
-            "statusCode": "00",
-            "statusMessage": "Success",
-            "successful": True,
-            "responseObject": serializer.data
-        }, status=status.HTTP_200_OK)
+        def build():
+            pizzas = Pizza.objects.values_list(*MENU_ROW_FIELDS)  # type: ignore
+            return envelope(menu_rows(pizzas))
+
+        return menu_cache.respond(request, menu_cache.get_entry("pizzas", build))
 
 
 class ToppingList(APIView):
+    throttle_classes = [ReadThrottle]
+
     def get(self, request):
         size = request.query_params.get("size")
         category = request.query_params.get("category")
-        toppings = Topping.objects.all()  # type: ignore
-        if size:
-            toppings = toppings.filter(pizza__name__iexact=size)
 
-        if category:
-            toppings = toppings.filter(category__iexact=category)
+        def build():
+            toppings = Topping.objects.all()  # type: ignore
+            if size:
+                toppings = toppings.alias(size=Lower("pizza__name")).filter(size=size.lower())
 
-        serializer = ToppingSerializer(toppings, many=True)
+            if category:
+                toppings = toppings.alias(category=Lower("catalog_topping__category")).filter(category=category.lower())
 
-        return Response({
-            "statusCode": "00",
-            "statusMessage": "Success",
-            "successful": True,
-            "responseObject": serializer.data
-        }, status=status.HTTP_200_OK)
+            return envelope(menu_rows(toppings.order_by("id").values_list(*TOPPING_ROW_FIELDS)))
 
-class OrderView(APIView):
-    def post(self, request):
-        data = request.data
-        pizza_id = data.get("pizza_id")
-        quantity = data.get("quantity")
-        topping_list = data.get("toppings", [])
-
-        if not all([pizza_id, quantity]):
-            return Response({
-                "statusCode": "99",
-                "statusMessage": "Pizza ID and quantity are required",
-                "successful": False,
-                "responseObject": []
-            }, status=status.HTTP_400_BAD_REQUEST)
+        params = ((size or "").lower(), (category or "").lower())
+        return menu_cache.respond(request, menu_cache.get_entry("toppings", build, params))
 
-        try:
-            pizza = Pizza.objects.get(id=int(pizza_id))  # type: ignore
-        except (Pizza.DoesNotExist, ValueError):  # type: ignore
-            return Response({
-                "statusCode": "99",
-                "statusMessage": "Invalid pizza ID",
-                "successful": False,
-                "responseObject": None
-            }, status=status.HTTP_400_BAD_REQUEST)
+class OrderView(IdempotentMixin, APIView):
+    throttle_classes = [WriteThrottle]
 
+    def post(self, request):
         try:
-            quantity = int(quantity)
-            if quantity <= 0:
-                raise ValueError
-        except ValueError:
-            return Response({
-                "statusCode": "99",
-                "statusMessage": "Invalid quantity",
-                "successful": False,
-                "responseObject": None
-            }, status=status.HTTP_400_BAD_REQUEST)
+            quote = parse_order(request.data, pricing.get_snapshot())
+        except OrderRequestError as e:
+            return Response(envelope(e.response_object, str(e), successful=False),
+                            status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            if topping_list:
-                if not isinstance(topping_list, list):
-                    return Response({
-                        "statusCode": "99",
-                        "statusMessage": "Toppings must be a list of IDs",
-                        "successful": False,
-                        "responseObject": None
-                    }, status=status.HTTP_400_BAD_REQUEST)
-
-                topping_ids = [int(t) for t in topping_list]
-                toppings = Topping.objects.filter(id__in=topping_ids)  # type: ignore
-            else:
-                toppings = []
-
-            base_price = pizza.price
-            topping_price = sum(t.price for t in toppings)
-            subtotal = quantity * (base_price + topping_price)
-            vat = Decimal("0.16") * subtotal
-            total = subtotal + vat
-            order_number = f"OR{datetime.now().strftime('%Y%m%d%H%M%S')}"
-
-            order = Order.objects.create(  # type: ignore
-                subtotal=subtotal,
-                vat=vat,
-                total=total,
-                order_number=order_number
-            )
-
-            order_item = OrderItem.objects.create(order=order, pizza=pizza, quantity=quantity)  # type: ignore
-            if toppings:
-                order_item.toppings.set(toppings)
-
-            receipt = {
-                "order_id": order_number,
-                "pizza": pizza.name,
-                "quantity": quantity,
-                "toppings": [t.name for t in toppings],
-                "subtotal": f"{subtotal:.2f}",
-                "vat": f"{vat:.2f}",
-                "grand_total": f"{total:.2f}"
-            }
-
-            return Response(
-                {
-                "statusCode": "00",
-                "statusMessage": f"Order {order_number} processed successfully",
-                "successful": True,
-                "responseObject": receipt
-            }, status=status.HTTP_201_CREATED)
+            order_number = next_order_number()
+
+            if order_queue.submit(order_number, [quote], quote.subtotal, quote.vat, quote.total):
+                return Response(envelope(
+                    order_receipt(order_number, quote), f"Order {order_number} accepted for processing"
+                ), status=status.HTTP_202_ACCEPTED)
+
+            return Response(envelope(
+                order_receipt(order_number, quote), f"Order {order_number} processed successfully"
+            ), status=status.HTTP_201_CREATED)
 
         except Exception as e:
-            return Response({
-                "statusCode": "99",
-                "statusMessage": f"Unknown error occurred: {str(e)}",
-                "successful": False,
-                "responseObject": None
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return Response(envelope(None, f"Unknown error occurred: {str(e)}", successful=False),
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class MakePayment(APIView):
-    def post(self, request):
-        data = request.data
-        account_number = data.get("account_number")
-        amount = data.get("amount")
-        order_id = data.get("order_id")
-
-        if not all([account_number, amount, order_id]):
-            return Response({
-                "statusCode": "99",
-                "statusMessage": "Account number, order_id and amount are required",
-                "successful": False,
-                "responseObject": None
-            }, status=status.HTTP_400_BAD_REQUEST)
+class OrderBasketView(IdempotentMixin, APIView):
+    throttle_classes = [WriteThrottle]
 
+    def post(self, request):
         try:
-            amount = Decimal(amount)
-            if amount <= 0:
-                raise ValueError
-        except:
-            return Response({
-                "statusCode": "99",
-                "statusMessage": "Invalid amount",
-                "successful": False,
-                "responseObject": None
-            }, status=status.HTTP_400_BAD_REQUEST)
+            quote = parse_basket(request.data, pricing.get_snapshot())
+        except OrderRequestError as e:
+            return Response(envelope(e.response_object, str(e), successful=False),
+                            status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            order = Order.objects.get(order_number=order_id)  # type: ignore
-        except Order.DoesNotExist:  # type: ignore
-            return Response({
-                "statusCode": "99",
-                "statusMessage": "Order not found",
-                "successful": False,
-                "responseObject": None
-            }, status=status.HTTP_400_BAD_REQUEST)
+            order_number = next_order_number()
+
+            if order_queue.submit(order_number, quote.lines, quote.subtotal, quote.vat, quote.total):
+                return Response(envelope(
+                    basket_receipt(order_number, quote), f"Order {order_number} accepted for processing"
+                ), status=status.HTTP_202_ACCEPTED)
 
+            return Response(envelope(
+                basket_receipt(order_number, quote), f"Order {order_number} processed successfully"
+            ), status=status.HTTP_201_CREATED)
 
+        except Exception as e:
+            return Response(envelope(None, f"Unknown error occurred: {str(e)}", successful=False),
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class OrderStatus(APIView):
+    def get(self, request, order_number):
+        order = archive.find_order(order_number)
+        if order is not None:
+            return Response(envelope({
+                "order_id": order_number,
+                "status": "persisted",
+                "payment_status": order["payment_status"],
+                "grand_total": f"{order['total']:.2f}"
+            }), status=status.HTTP_200_OK)
+
+        if order_queue.is_enabled():
+            spool = order_queue.get_spool()
+            if spool.contains(order_number):
+                return Response(envelope({
+                    "order_id": order_number,
+                    "status": "queued"
+                }), status=status.HTTP_200_OK)
+            if spool.failure(order_number) is not None:
+                return Response(envelope({
+                    "order_id": order_number,
+                    "status": "failed"
+                }), status=status.HTTP_200_OK)
+
+        return Response(envelope(None, "Order not found", successful=False),
+                        status=status.HTTP_404_NOT_FOUND)
+
+
+class OrderExport(APIView):
+    def get(self, request):
+        kind = request.query_params.get("type", "csv")
+        try:
+            start = exports.parse_bound(request.query_params.get("start"), "start")
+            end = exports.parse_bound(request.query_params.get("end"), "end", end=True)
+            # The body streams after the routing middleware has returned,
+            # so pick the database now.
+            using = router.db_for_read(Order)
+            lines = exports.export_lines(kind, exports.iter_orders(start, end, using=using))
+        except exports.ExportError as e:
+            return Response(envelope(None, str(e), successful=False),
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        response = StreamingHttpResponse(lines, content_type=exports.CONTENT_TYPES[kind])
+        response["Content-Disposition"] = f'attachment; filename="orders.{kind}"'
+        return response
+
+
+class SalesReport(APIView):
+    def get(self, request):
         try:
-            account = Account.objects.get(account_number=account_number)  # type: ignore
-        except Account.DoesNotExist:  # type: ignore
-            return Response({
-                "statusCode": "99",
-                "statusMessage": "Account not found",
-                "successful": False,
-                "responseObject": None
-            }, status=status.HTTP_400_BAD_REQUEST)
-
-        if order.payment_status == "00":
-            return Response({
-                "statusCode": "99",
-                "statusMessage": "Payment for the order already completed",
-                "successful": False,
-                "responseObject": None
-            }, status=status.HTTP_400_BAD_REQUEST)
-
-        if not order.total == amount:
-            return Response({
-                "statusCode": "99",
-                "statusMessage": "Wrong amount submitted for payment",
-                "successful": False,
-                "responseObject": None
-            }, status=status.HTTP_400_BAD_REQUEST)
-
-        if account.account_balance < amount:
-            return Response({
-                "statusCode": "99",
-                "statusMessage": "Insufficient balance",
-                "successful": False,
-                "responseObject": None
-            }, status=status.HTTP_400_BAD_REQUEST)
+            end = parse_date(request.query_params.get("end") or str(timezone.localdate()))
+            start = parse_date(request.query_params.get("start") or str(end - timedelta(days=29)))
+            if start is None or end is None or start > end:
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response(envelope(None, "Invalid date range", successful=False),
+                            status=status.HTTP_400_BAD_REQUEST)
 
+        return Response(envelope(rollups.report(start, end)), status=status.HTTP_200_OK)
 
+
+class MakePayment(IdempotentMixin, APIView):
+    throttle_classes = [WriteThrottle]
+
+    def post(self, request):
         try:
-            account.account_balance -= amount
-            order.payment_status = "00"
-            for item in [account, order]:
-                item.save()
+            order_id, account_number, amount = parse_payment(request.data)
+            account = settle(order_id, account_number, amount)
+        except PaymentError as e:
+            return Response(envelope(None, str(e), successful=False),
+                            status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response(envelope(None, f"Payment processing failed with error: {e}", successful=False),
+                            status=status.HTTP_400_BAD_REQUEST)
 
-            return Response({
-                "statusCode": "00",
-                "statusMessage": f"Payment completed for Order number {order.order_number}",
-                "successful": True,
-                "responseObject": AccountSerializer(account).data
-            }, status=status.HTTP_200_OK)
+        return Response(envelope(
+            account_row(account), f"Payment completed for Order number {order_id}"
+        ), status=status.HTTP_200_OK)
 
 
+class MakeBatchPayment(IdempotentMixin, APIView):
+    throttle_classes = [WriteThrottle]
+
+    def post(self, request):
+        try:
+            account_number, payments = parse_batch_payment(request.data)
+            account, results = settle_batch(account_number, payments)
+        except PaymentError as e:
+            return Response(envelope(None, str(e), successful=False),
+                            status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
-            return Response({
-                "statusCode": "99",
-                "statusMessage": f"Payment processing failed with error: {e}",
-                "successful": False,
-                "responseObject": None
-            }, status=status.HTTP_400_BAD_REQUEST)
+            return Response(envelope(None, f"Payment processing failed with error: {e}", successful=False),
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        settled = sum(error is None for _, _, error in results)
+        response_object = account_row(account)
+        response_object["payments"] = [{
+            "order_id": order_id,
+            "successful": error is None,
+            "statusMessage": "Payment completed" if error is None else str(error)
+        } for order_id, _, error in results]
+        return Response(envelope(
+            response_object, f"Payment completed for {settled} of {len(results)} orders", successful=settled > 0
+        ), status=status.HTTP_200_OK if settled else status.HTTP_400_BAD_REQUEST)
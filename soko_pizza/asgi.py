@@ -2,6 +2,8 @@
 ASGI config for soko_pizza project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Django is imported and set up on the first request rather than at import
+time, so process managers can import this module cheaply.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -9,8 +11,15 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
-
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "soko_pizza.settings")
 
-application = get_asgi_application()
+_application = None
+
+
+async def application(scope, receive, send):
+    global _application
+    if _application is None:
+        from django.core.asgi import get_asgi_application
+
+        _application = get_asgi_application()
+    return await _application(scope, receive, send)
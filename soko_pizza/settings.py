@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "pizza.metrics.MetricsMiddleware",
+    "pizza.throttling.AdmissionControlMiddleware",
+    "pizza.routers.ReplicaRoutingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -76,11 +80,51 @@ WSGI_APPLICATION = "soko_pizza.wsgi.application"
 
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
+        "ENGINE": "pizza.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Under ASGI every request runs its sync code in a new thread, so a
+        # persistent connection is never reused and is only closed once the
+        # thread is gone. wsgi.py keeps connections open across requests,
+        # which saves re-running the pragmas below each time.
+        "CONN_MAX_AGE": int(os.environ.get("DATABASE_CONN_MAX_AGE", 0)),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            # Seconds a writer waits for the lock before "database is locked".
+            "timeout": 20,
+            "transaction_mode": "IMMEDIATE",
+            "init_command": (
+                "PRAGMA journal_mode=WAL;"
+                "PRAGMA synchronous=NORMAL;"
+                "PRAGMA mmap_size=134217728;"
+                "PRAGMA cache_size=-20000;"
+                "PRAGMA temp_store=MEMORY"
+            ),
+        },
     }
 }
 
+# Transactional writes that still hit a lock are retried this many times.
+DATABASE_LOCK_RETRIES = 3
+DATABASE_LOCK_BACKOFF = 0.05
+
+# Read replicas. With DATABASE_REPLICA_PATH set, a copy of the database kept
+# fresh by `manage.py sync_replicas --interval 2` serves the menu models and
+# the read-only views below; clients read from the primary for a while after
+# each write they make. Replicas need a menu cache shared by every process,
+# such as the one in settings_api.
+DATABASE_ROUTERS = ["pizza.routers.ReplicaRouter"]
+DATABASE_REPLICAS = []
+if os.environ.get("DATABASE_REPLICA_PATH"):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": os.environ["DATABASE_REPLICA_PATH"],
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS = ["replica"]
+DATABASE_REPLICA_MODELS = ["pizza.Pizza", "pizza.CatalogTopping", "pizza.Topping"]
+DATABASE_REPLICA_VIEWS = ["order-status", "order-export", "sales-report"]
+DATABASE_REPLICA_STICKY_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -129,3 +173,35 @@ CACHES = {
     }
 }
 
+# "queued" answers order POSTs with 202 once the order is in the local spool
+# file and writes spooled orders to the database in batches.
+ORDER_INGESTION = os.environ.get("ORDER_INGESTION", "sync")
+ORDER_QUEUE_PATH = os.environ.get("ORDER_QUEUE_PATH", BASE_DIR / "order_queue.sqlite3")
+ORDER_QUEUE_BATCH_SIZE = 500
+
+# Paid orders older than this move to the archive tables (archive_orders).
+ORDER_ARCHIVE_AFTER_DAYS = 90
+
+# Request metrics served at /api/metrics/. Point METRICS_DIR at a directory
+# shared by the worker processes on the host to aggregate them across
+# workers. Only loopback and private clients may read them; set
+# METRICS_ALLOWED_NETWORKS to a list of networks to change that.
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_FLUSH_INTERVAL = 5
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "pizza.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "EXCEPTION_HANDLER": "pizza.throttling.exception_handler",
+}
+
+# Token-bucket limits per scope ("read"/"write") and bucket ("client"/
+# "global"), e.g. {"write-client": {"rate": 5, "burst": 10}}; see
+# pizza/throttling.py. Unlimited in development.
+RATE_LIMITS = {}
+RATE_LIMIT_CACHE_ALIAS = "default"
+
+# Writes allowed in flight per process before new ones get 429.
+WRITE_CONCURRENCY_LIMIT = None
@@ -0,0 +1,67 @@
+"""
+Production settings for the API-only deployment.
+
+Select with ``DJANGO_SETTINGS_MODULE=soko_pizza.settings_api``. Starts from
+the default settings and drops everything a JSON API does not use: the
+admin, sessions, messages, CSRF, auth and clickjacking middleware, the
+template stack and the browsable API. ``DEBUG`` is off so queries are not
+kept in memory.
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+
+SECRET_KEY = os.environ.get("DJANGO_SECRET_KEY", SECRET_KEY)  # noqa: F405
+
+DEBUG = os.environ.get("DJANGO_DEBUG") == "1"
+
+INSTALLED_APPS = [
+    "pizza", "rest_framework"
+]
+
+MIDDLEWARE = [
+    "pizza.metrics.MetricsMiddleware",
+    "pizza.throttling.AdmissionControlMiddleware",
+    "pizza.routers.ReplicaRoutingMiddleware",
+    "django.middleware.security.SecurityMiddleware",
+    "django.middleware.common.CommonMiddleware",
+]
+
+ROOT_URLCONF = "soko_pizza.urls_api"
+
+TEMPLATES = []
+
+AUTH_PASSWORD_VALIDATORS = []
+
+USE_I18N = False
+
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": ["pizza.renderers.FastJSONRenderer"],
+    "DEFAULT_PARSER_CLASSES": ["rest_framework.parsers.JSONParser"],
+    "DEFAULT_AUTHENTICATION_CLASSES": [],
+    "DEFAULT_PERMISSION_CLASSES": ["rest_framework.permissions.AllowAny"],
+    "UNAUTHENTICATED_USER": None,
+    "EXCEPTION_HANDLER": "pizza.throttling.exception_handler",
+}
+
+RATE_LIMITS = {
+    "read-client": {"rate": 50, "burst": 100},
+    "read-global": {"rate": 2000, "burst": 4000},
+    "write-client": {"rate": 5, "burst": 20},
+    "write-global": {"rate": 300, "burst": 300},
+}
+
+WRITE_CONCURRENCY_LIMIT = 8
+
+# One cache for every worker on the host, so menu invalidations, rate-limit
+# buckets and idempotency keys are seen by all of them. Menu keys are also
+# kept in process and revalidated against a shared generation counter.
+CACHES = {
+    "default": {
+        "BACKEND": "pizza.backends.sqlite_cache.SQLiteCache",
+        "LOCATION": os.environ.get("CACHE_PATH", BASE_DIR / "cache.sqlite3"),  # noqa: F405
+        "TIMEOUT": 300,
+        "OPTIONS": {"MAX_ENTRIES": 50000, "LOCAL_PREFIXES": ["menu:"]},
+    }
+}
@@ -0,0 +1,12 @@
+"""
+URL configuration for the API-only settings profile: the API without the
+admin site.
+"""
+
+from django.urls import path, include
+import pizza.urls
+
+
+urlpatterns = [
+    path("api/", include(pizza.urls)),
+]
@@ -2,6 +2,8 @@
 WSGI config for soko_pizza project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
+Django is imported and set up on the first request rather than at import
+time, so process managers can import this module cheaply.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
@@ -9,8 +11,18 @@ https://docs.djangoproject.com/en/5.0/howto/deployment/wsgi/
 
 import os
 
-from django.core.wsgi import get_wsgi_application
-
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "soko_pizza.settings")
+# Each worker thread serves request after request, so it can keep its
+# database connection open.
+os.environ.setdefault("DATABASE_CONN_MAX_AGE", "600")
+
+_application = None
+
+
+def application(environ, start_response):
+    global _application
+    if _application is None:
+        from django.core.wsgi import get_wsgi_application
 
-application = get_wsgi_application()
+        _application = get_wsgi_application()
+    return _application(environ, start_response)